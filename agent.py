@@ -0,0 +1,280 @@
+"""
+ * AGENT_PY
+ * Agent run in the remote host, started once by the client over a single
+ * SSH channel (see ssh_methods.RemoteAgent), that serves structured requests
+ * on stdin/stdout, one JSON object by line:
+ *
+ *   request:   {"id": 1, "op": "list", "args": {"path": "work/2021S_2"}}
+ *   response:  {"id": 1, "ok": true, "result": [...]}
+ *              {"id": 1, "ok": false, "error": "..."}
+ *
+ * So every remote operation costs a round trip of one message, instead of a
+ * shell spawned for it, and its result is data instead of console output.
+ * Only the standard library is used; the paths are relative to the home of
+ * the remote user, where the other scripts (columnar.py, cas, jobq) live.
+ *
+ * Usage (in the remote host): python3 agent.py
+ * (the client sends it through the channel itself, see AGENT_BOOTSTRAP in
+ * ssh_methods.py, so it needs no upload)
+ *
+ * This product is protected under U.S. Copyright Law.
+ * Unauthorized reproduction is considered a criminal act.
+ * (C) 2018-2021 VDI Technologies, LLC. All rights reserved.
+"""
+
+__author__    = "Yoel Monsalve"
+__date__      = "October, 2026"
+__modified__  = ""
+__version__   = ""
+__copyright__ = "VDI Technologies, LLC"
+
+import os
+import sys
+from sys import stdin, stdout, stderr, argv, exit
+import stat
+import json
+import time
+import gzip
+import shutil
+import hashlib
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+MANIFEST      = "MANIFEST.b2"     # see compress.MANIFEST
+VERIFY_FAILED = ".verify_failed"  # see ssh_methods.VERIFY_FAILED
+COL_EXT       = ".col"            # see columnar.EXT
+ZD_EXT        = ".zd"             # see zdict.EXT
+ZD_DICT       = "DICT.zdict"      # see zdict.DICT
+JOBQ          = "./jobq"
+
+COPY_BUFFER = 1 << 20
+WORKERS     = os.cpu_count() or 1
+
+def __entry(path, name, st):
+    return {
+        "name": name,
+        "type": "dir" if stat.S_ISDIR(st.st_mode) else "file",
+        "size": st.st_size,
+        "mtime": st.st_mtime,
+        "mode": stat.S_IMODE(st.st_mode),
+    }
+
+def __walk(path, recursive = True):
+    """(full path, name relative to path, stat) of the entries of path"""
+    stack = [(path, "")]
+    while stack:
+        d, prefix = stack.pop()
+        with os.scandir(d) as it:
+            for e in it:
+                st = e.stat(follow_symlinks = False)
+                yield e.path, prefix + e.name, st
+                if recursive and e.is_dir(follow_symlinks = False):
+                    stack.append((e.path, prefix + e.name + '/'))
+
+def __hash_file(path):
+    h = hashlib.blake2b()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(COPY_BUFFER), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def op_list(path = ".", recursive = False):
+    """Entries of a folder: name, type, size, mtime, mode"""
+    entries = [__entry(p, name, st) for p, name, st in __walk(path, recursive)]
+    entries.sort(key = lambda e: e["name"])
+    return entries
+
+def op_inventory(path = ".", since = 0, dirs = None):
+    """Inventory of a folder tree, as a delta of the one the client has: the
+    folders whose mtime is not the known one (a file added, removed or
+    renamed) come with all their files, and the rest only with the files
+    modified since the given time
+    @param dirs: {folder: mtime} known by the client (folders relative to path)
+    @return {"time": time of the walk, "all": [all the folders],
+             "dirs": {folder: {"mtime", "files": {name: [size, mtime]}}},
+             "updated": {folder: {name: [size, mtime]}}}
+    """
+    dirs = dirs or {}
+    now = time.time()
+    inv = {"time": now, "all": [], "dirs": {}, "updated": {}}
+    stack = [""]
+    while stack:
+        rel = stack.pop()
+        d = os.path.join(path, rel) if rel else path
+        inv["all"].append(rel)
+        mtime = os.stat(d).st_mtime    # before the listing, so a change meanwhile is seen next time
+        changed = dirs.get(rel) != mtime
+        files = {}
+        with os.scandir(d) as it:
+            for e in it:
+                if e.is_dir(follow_symlinks = False):
+                    stack.append(rel + "/" + e.name if rel else e.name)
+                    continue
+                st = e.stat(follow_symlinks = False)
+                if changed or st.st_mtime >= since:
+                    files[e.name] = [st.st_size, st.st_mtime]
+        if changed:
+            inv["dirs"][rel] = {"mtime": mtime, "files": files}
+        elif files:
+            inv["updated"][rel] = files
+    return inv
+
+def op_stat(path = "."):
+    """Type, size, mtime and mode of a file or folder"""
+    st = os.stat(path)
+    return __entry(path, os.path.basename(path), st)
+
+def op_hash(paths = ()):
+    """BLAKE2b hashes of the files (as b2sum), as {path: hash}"""
+    with ThreadPoolExecutor(WORKERS) as pool:
+        return dict(zip(paths, pool.map(__hash_file, paths)))
+
+def op_mkdir(path = "", mode = 0o750):
+    """Creates a folder (and its parents), with the given mode"""
+    os.makedirs(path, exist_ok = True)
+    os.chmod(path, mode)
+    return path
+
+def op_provision(paths = (), layout = (), mode = 0o750):
+    """Creates many working folders at once, every one with the subfolders
+    of the layout, as pairs [subfolder, mode]
+    @return list of {"path", "ok", "created": [...], "error"} by folder
+    """
+    results = []
+    for path in paths:
+        r = {"path": path, "ok": True, "created": [], "error": ""}
+        try:
+            for sub, m in [("", mode)] + [tuple(e) for e in layout]:
+                d = os.path.join(path, sub) if sub else path
+                if not os.path.isdir(d):
+                    os.makedirs(d)
+                    r["created"].append(sub or ".")
+                os.chmod(d, m)
+        except OSError as e:
+            r["ok"] = False
+            r["error"] = f"{type(e).__name__}: {e}"
+        results.append(r)
+    return results
+
+def __gunzip(path):
+    path_out = path[:-len(".gz")]
+    with gzip.open(path, "rb") as fi, open(path_out + ".part", "wb") as fo:
+        shutil.copyfileobj(fi, fo, COPY_BUFFER)
+    os.replace(path_out + ".part", path_out)
+    os.remove(path)
+    if path_out.endswith(COL_EXT):
+        # the remote side of the columnar format
+        import columnar
+        if not columnar.decode_file(path_out):
+            raise ValueError(f"{path_out}: bad columnar file")
+        path_out = path_out[:-len(COL_EXT)]
+    return path_out
+
+def __unzd(path, dictionary):
+    # the remote side of the dictionary mode
+    import zdict
+    if not zdict.decode_file(path, dictionary):
+        raise ValueError(f"{path}: bad file, or not of this dictionary")
+    return path[:-len(ZD_EXT)]
+
+def op_decompress(path = ""):
+    """Decompresses (in parallel) the CSV files of a folder, rebuilds the ones
+    in the columnar format, decodes the ones compressed against a dictionary,
+    verifies them against the manifest, and adds them to the content-addressed
+    store (see the script cas)
+    @return {"files": n, "verified": True if there was a manifest,
+             "failed": [names not matching the manifest],
+             "missing": [names of the manifest not in the folder]}
+    """
+    files = [p for p, name, st in __walk(path)
+        if stat.S_ISREG(st.st_mode) and (p.endswith(".csv.gz") or p.endswith(".csv" + COL_EXT + ".gz"))]
+    zd_files = [p for p, name, st in __walk(path) if stat.S_ISREG(st.st_mode) and p.endswith(".csv" + ZD_EXT)]
+    with ThreadPoolExecutor(WORKERS) as pool:
+        n = len(list(pool.map(__gunzip, files)))
+        if zd_files:
+            with open(os.path.join(path, ZD_DICT), "rb") as f:
+                dictionary = f.read()
+            n += len(list(pool.map(lambda p: __unzd(p, dictionary), zd_files)))
+
+    failed = []
+    missing = []
+    manifest = os.path.join(path, MANIFEST)
+    verified = os.path.isfile(manifest)
+    if verified:
+        expected = {}
+        with open(manifest, encoding = 'utf-8') as f:
+            for line in f:
+                h, name = line.rstrip('\n').split('  ', 1)
+                expected[name] = h
+        # the files not in the folder (e.g. not uploaded) are not a failure
+        missing = sorted(name for name in expected if not os.path.isfile(os.path.join(path, name)))
+        names = sorted(set(expected) - set(missing))
+        with ThreadPoolExecutor(WORKERS) as pool:
+            hashes = pool.map(lambda name: __hash_file(os.path.join(path, name)), names)
+            failed = [name for name, h in zip(names, hashes) if h != expected[name]]
+        with open(os.path.join(path, VERIFY_FAILED), "w") as f:
+            f.write("".join(name + '\n' for name in failed))
+
+    if os.path.isfile("cas"):
+        subprocess.run(["bash", "cas", "ingest", path], stdout = subprocess.DEVNULL)
+    return {"files": n, "verified": verified, "failed": failed, "missing": missing}
+
+def op_run(working_dir = "", options = ""):
+    """Submits a run of the TST to the remote queue (see the script jobq)
+    @return the job id
+    """
+    r = subprocess.run([JOBQ, "submit", working_dir] + options.split(), capture_output = True, text = True)
+    if r.returncode != 0:
+        raise RuntimeError(r.stderr.strip() or f"jobq failed ({r.returncode})")
+    return r.stdout.strip()
+
+def op_tail(path = "", lines = 20):
+    """Last lines of a file (read backwards from its end)"""
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        data = b""
+        while pos > 0 and data.count(b'\n') <= lines:
+            n = min(pos, 1 << 16)
+            pos -= n
+            f.seek(pos)
+            data = f.read(n) + data
+    return data.decode('utf-8', 'replace').splitlines()[-lines:]
+
+OPS = {
+    "list":       op_list,
+    "stat":       op_stat,
+    "inventory":  op_inventory,
+    "hash":       op_hash,
+    "mkdir":      op_mkdir,
+    "provision":  op_provision,
+    "decompress": op_decompress,
+    "run":        op_run,
+    "tail":       op_tail,
+}
+
+def serve(fin = stdin.buffer, fout = stdout):
+    """Serves the requests of fin until it is closed, or an op 'quit'"""
+    for line in fin:
+        if not line.strip(): continue
+        try:
+            req = json.loads(line)
+        except ValueError as e:
+            req = None
+            resp = {"id": None, "ok": False, "error": f"bad request: {e}"}
+        if req is not None:
+            rid = req.get("id")
+            op  = req.get("op")
+            if op == "quit": break
+            if op not in OPS:
+                resp = {"id": rid, "ok": False, "error": f"unknown op '{op}'"}
+            else:
+                try:
+                    resp = {"id": rid, "ok": True, "result": OPS[op](**req.get("args", {}))}
+                except Exception as e:
+                    resp = {"id": rid, "ok": False, "error": f"{type(e).__name__}: {e}"}
+        fout.write(json.dumps(resp) + '\n')
+        fout.flush()
+
+if __name__ == "__main__":
+    serve()
@@ -0,0 +1,121 @@
+"""
+ * AGGREGATE_PY
+ * Aggregation of the results of a TST run, in the remote host, so the
+ * client downloads a few large files instead of thousands of small ones.
+ *
+ *   output/summaries.gz    all the output/summary/*.summary, one gzip member
+ *                          by case (gzip -d gives them all, concatenated)
+ *   output/summaries.idx   index of the former: case, offset, length, size
+ *   output/reports.zip     (optional) all the output/report/*.report
+ *
+ * The loose files are kept, so single cases can still be pulled on demand.
+ * The client side reads a single case out of the aggregate with
+ * read_summary(), seeking through the index.
+ *
+ * Usage (in the remote host, after the TST):
+ *   python3 aggregate.py working_directory [--pack-reports]
+ *
+ * This product is protected under U.S. Copyright Law.
+ * Unauthorized reproduction is considered a criminal act.
+ * (C) 2018-2021 VDI Technologies, LLC. All rights reserved.
+"""
+
+__author__    = "Yoel Monsalve"
+__date__      = "October, 2026"
+__modified__  = ""
+__version__   = ""
+__copyright__ = "VDI Technologies, LLC"
+
+import os
+import sys
+from sys import stdin, stdout, stderr, argv, exit
+import gzip
+import zipfile
+
+SUMMARY_DIR = "output/summary"
+REPORT_DIR  = "output/report"
+SUMMARIES   = "output/summaries.gz"
+INDEX       = "output/summaries.idx"
+REPORTS     = "output/reports.zip"
+
+def __cases(path, ext):
+    """Names of the cases with a file <case><ext> in path, sorted"""
+    try:
+        names = os.listdir(path)
+    except FileNotFoundError:
+        return []
+    return sorted(n[:-len(ext)] for n in names if n.endswith(ext))
+
+def aggregate_summaries(wd):
+    """Merges the summaries of the cases into SUMMARIES, indexed by INDEX
+    @return number of cases
+    """
+    cases = __cases(os.path.join(wd, SUMMARY_DIR), ".summary")
+    path_out = os.path.join(wd, SUMMARIES)
+    with open(path_out + ".part", "wb") as fo, open(os.path.join(wd, INDEX) + ".part", "w") as fidx:
+        offset = 0
+        for case in cases:
+            with open(os.path.join(wd, SUMMARY_DIR, case + ".summary"), "rb") as fi:
+                data = fi.read()
+            member = gzip.compress(data, compresslevel = 6)
+            fo.write(member)
+            fidx.write(f"{case}\t{offset}\t{len(member)}\t{len(data)}\n")
+            offset += len(member)
+    # both appear at once, so a reader never sees a partial aggregate
+    os.replace(path_out + ".part", path_out)
+    os.replace(os.path.join(wd, INDEX) + ".part", os.path.join(wd, INDEX))
+    return len(cases)
+
+def pack_reports(wd):
+    """Packs the reports of the cases into REPORTS (a zip, seekable by member)
+    @return number of cases
+    """
+    cases = __cases(os.path.join(wd, REPORT_DIR), ".report")
+    path_out = os.path.join(wd, REPORTS)
+    with zipfile.ZipFile(path_out + ".part", "w", compression = zipfile.ZIP_DEFLATED) as z:
+        for case in cases:
+            z.write(os.path.join(wd, REPORT_DIR, case + ".report"), case + ".report")
+    os.replace(path_out + ".part", path_out)
+    return len(cases)
+
+def read_index(path_idx):
+    """@return dict {case: (offset, length, size)} of an index of summaries"""
+    index = {}
+    with open(path_idx) as f:
+        for line in f:
+            case, offset, length, size = line.rstrip('\n').split('\t')
+            index[case] = (int(offset), int(length), int(size))
+    return index
+
+def read_summary(wd, case, index = None):
+    """Reads the summary of a single case out of the aggregate (seeking)
+    @return the summary (bytes), or None if the case is not there
+    """
+    if index is None:
+        index = read_index(os.path.join(wd, INDEX))
+    if case not in index: return None
+    offset, length, size = index[case]
+    with open(os.path.join(wd, SUMMARIES), "rb") as f:
+        f.seek(offset)
+        return gzip.decompress(f.read(length))
+
+def read_report(wd, case):
+    """Reads the report of a single case out of REPORTS
+    @return the report (bytes), or None if the case is not there
+    """
+    with zipfile.ZipFile(os.path.join(wd, REPORTS)) as z:
+        try:
+            return z.read(case + ".report")
+        except KeyError:
+            return None
+
+if __name__ == "__main__":
+    if len(argv) < 2:
+        stderr.write(f"USAGE {argv[0]} working_directory [--pack-reports]\n")
+        exit(1)
+    wd = argv[1]
+    n = aggregate_summaries(wd)
+    print(f"aggregate: {n} summaries into {SUMMARIES}")
+    if "--pack-reports" in argv[2:]:
+        n = pack_reports(wd)
+        print(f"aggregate: {n} reports into {REPORTS}")
@@ -24,7 +24,16 @@ import signal
 import re         # regex
 from helpers import is_win, is_posix
 from compress import compress_files
-from transfer import transfer_files, download_files
+from transfer import transfer_files, download_files, stream_files, fetch_case
+from dedup import link_known_files, compressed_names
+from scanner import scan, total_size
+from watch import watch_folder
+from linkprofile import profile_link
+from workspace import inspect_workspace
+from ratelimit import LIMITER, save_cap
+import results_db
+import history
+from profiling import profile_call
 from ssh_methods import *
 
 def login():
@@ -52,7 +61,59 @@ def menu(MENU_OPTIONS = {}):
         
     return opt
 
-def main():
+def jobs_menu(HOST):
+    """Sub-menu to follow up the TST runs in the remote queue"""
+    
+    JOBS_OPTIONS = {
+        1: "Status of the jobs",
+        2: "Progress of a job",
+        3: "Last lines of the log of a job",
+        4: "Cancel a job",
+        5: "Back",
+    }
+    while 1:
+        opt = menu(JOBS_OPTIONS)
+        
+        if opt == 1:
+            jobs = job_status(HOST)
+            if jobs is None: continue
+            history.learn_jobs(HOST, jobs)
+            if not jobs: print("No jobs in the queue")
+            for j in jobs:
+                print("  {:s}  {:10s}  {:s}  submitted: {}  started: {}  finished: {}".format(
+                    j["id"], j["state"], j["working_dir"], j["submitted"], 
+                    j["started"] or "-", j["finished"] or "-"))
+        
+        elif opt == 2:
+            job_id = input("Enter the job id: ")
+            r = job_progress(HOST, job_id)
+            if r is None: continue
+            done, total = r
+            pct = 100.0 * done / total if total else 0.0
+            print(f"=> {done} of {total} cases done ({pct:.1f}%)")
+        
+        elif opt == 3:
+            job_id = input("Enter the job id: ")
+            out = job_tail(HOST, job_id)
+            if out is not None: print(out)
+        
+        elif opt == 4:
+            job_id = input("Enter the job id: ")
+            if job_cancel(HOST, job_id): print(f"=> job {job_id} cancelled")
+        
+        else:
+            return
+
+def main(profile = False):
+    """Main loop of the client
+    @param profile: if True, every action is run under the profiler (see
+        profiling.py), leaving its artifacts in .tstclient/profiles/
+    """
+    
+    def action(name, func, *args, **kwargs):
+        if profile:
+            return profile_call(name, func, *args, **kwargs)
+        return func(*args, **kwargs)
     
     #CSV_DIR = "../work/2021S_2/csv/"
     CSV_DIR = ""
@@ -62,7 +123,9 @@ def main():
     #remote_path = "work/2021S_2/csv/"
     local_path  = ""
     remote_path = ""
+    inventory   = None   # CSV files of CSV_DIR (see scanner.scan())
     p = None             # underlying process
+    agent = RemoteAgent(HOST)    # started on its first use, see agent.py
     
     print(
         "******************************************************\n" + \
@@ -81,12 +144,17 @@ def main():
         3: "Compress files locally",
         4: "Transfer files to the remote host",
         5: "Decompress files in the remote host/destination",
-        6: "Go in one (compress + transfer + decompress) (not implemented)",
-        7: "Run the TST",
-        8: "Download the analysis result files from the server (not implemented)",
-        9: "Clean the CSV files in the server (not implemented)",
+        6: "Go in one (compress + transfer + decompress), streaming with adaptive compression",
+        7: "Run the TST (as a background job in the remote queue)",
+        8: "Download the analysis result files from the server",
+        9: "Clean the CSV files in the server",
         10: "Interact with the remote host via SSH (advanced)(not implemented)",
-        11: "Exit",
+        11: "Follow up the background jobs (status, progress, log, cancel)",
+        12: "Query the local results store",
+        13: "Watch a CSV folder (compress and upload the files as the study writes them)",
+        14: "Profile the link with the remote host (ciphers, compression, SFTP buffers)",
+        15: "Set the cap of the bandwidth for all the transfers",
+        16: "Exit",
     }
     exit_option = -1
     for o in MENU_OPTIONS.keys():
@@ -98,14 +166,24 @@ def main():
 
         if opt == 1:
             # create a new working directory
-            new_path = input("Enter the path for your new working directory: ")
+            new_paths = input("Enter the path for your new working directory (or several, space separated): ").split()
+            if not new_paths: continue
             create_structure = input("Create a structure into this directory? y/[n]: ")
             create_structure = (create_structure.lower() == 'y')
-            p = create_directory(HOST, new_path, 0o750, create_structure)
+            if len(new_paths) == 1:
+                p = action("create", create_directory, HOST, new_paths[0], 0o750, create_structure, agent = agent)
+            else:
+                # all at once, in a single request
+                layout = WORKSPACE_LAYOUT if create_structure else ()
+                results = action("provision", provision_workspaces, HOST, new_paths, layout, agent = agent) or []
+                for r in results:
+                    print("  {:s}  {:s}".format(r["path"], "created {:d} folder(s)".format(len(r["created"]))
+                        if r["ok"] else "??? " + r["error"]))
+                print(f"=> {sum(r['ok'] for r in results)} of {len(new_paths)} working folder(s) ready")
 
         elif opt == 2:
             remote_wd = input("Enter the name of the remote working folder: ")
-            p = inspect_working_directory(HOST, remote_wd)
+            p = action("inspect", inspect_workspace, HOST, remote_wd, agent = agent)
         
         if opt == 3:
             # compress files
@@ -120,11 +198,31 @@ def main():
             # changing the directory modes (user: read + write)
             os.chmod(CSV_DIR, os.stat('.').st_mode | stat.S_IRUSR | stat.S_IXUSR)
             #os.chmod(DIR, 0o700)
-            p = compress_files(CSV_DIR)
+            recursive = input("Include the CSV files in subfolders? y/[n]: ")
+            recursive = (recursive.lower() == 'y')
+            use_columnar = input("Use the columnar format for numeric CSV files? y/[n]: ")
+            use_columnar = (use_columnar.lower() == 'y')
+            dictionary = False
+            if not use_columnar:
+                dictionary = input("Compress the small files against a shared dictionary? y/[n]: ")
+                dictionary = (dictionary.lower() == 'y')
+            inventory = action("scan", scan, CSV_DIR, recursive = recursive)
+            print(f"=> {len(inventory)} CSV file(s), {total_size(inventory)} bytes")
+            eta = history.predict(HOST, total_size(inventory), len(inventory))
+            print("=> predicted: compress {:s}, upload {:s}, TST {:s}".format(
+                *(history.format_secs(eta[phase]) for phase in history.PHASES)))
+            stats = {}
+            done = action("compress", compress_files, CSV_DIR, use_columnar, inventory = inventory,
+                dictionary = dictionary, stats = stats)
+            if done:
+                names = set(done)
+                history.record(HOST, "compress", sum(f.size for f in inventory if f.name in names),
+                    stats["secs"], out_bytes = stats["out_bytes"])
         
         elif opt == 4:
             if not CSV_DIR:
                 CSV_DIR = input("Enter the path where you have your CSV files: ")
+                inventory = None
             if not CSV_DIR[-1] == '/': CSV_DIR += '/'
             if not os.path.exists(CSV_DIR) or not os.path.isdir(CSV_DIR):
                 # verifying the file exists and it is directory
@@ -136,16 +234,62 @@ def main():
             remote_wd = input("Enter the name of the remote working folder: ")
             remote_path = "work/" + remote_wd + "/csv"
             print("=> remote path to transfer the files to:", remote_path)
-            p = transfer_files(HOST, local_path, remote_path)
+            files = None
+            dedup = input("Skip the files already in the server (deduplicated upload)? [y]/n: ")
+            if dedup.lower() != 'n':
+                missing = action("link", link_known_files, HOST, CSV_DIR, remote_path, inventory = inventory)
+                if missing is not None:
+                    files = compressed_names(local_path, missing)
+            p = action("transfer", transfer_files, HOST, local_path, remote_path, files = files)
 
         elif opt == 5:
             remote_wd = input("Enter the name of the remote working folder: ")
             remote_path = remote_wd + "/csv"
-            p = decompress_files(HOST, remote_path)
+            p = action("decompress", decompress_files, HOST, remote_path, agent = agent)
         
-        elif opt == 7:
+        elif opt == 6:
+            CSV_DIR = input("Enter the path where you have your CSV files: ")
+            inventory = None
+            if not os.path.exists(CSV_DIR) or not os.path.isdir(CSV_DIR):
+                # verifying the file exists and it is directory
+                print("??? Does not exist, or it is not a directory")
+                continue
             remote_wd = input("Enter the name of the remote working folder: ")
-            p = run_app(HOST, remote_wd)
+            remote_path = "work/" + remote_wd + "/csv"
+            print("=> remote path to stream the files to:", remote_path)
+            totals = action("stream", stream_files, HOST, CSV_DIR, remote_path)
+            if totals:
+                # compressed and sent at once: the rate is the one of the slower
+                history.record(HOST, "link", totals["bytes_out"], totals["secs"])
+                p = action("decompress", decompress_files, HOST, remote_path, agent = agent)
+        
+        elif opt == 7:
+            # one or more, separated by spaces
+            remote_wds = input("Enter the name(s) of the remote working folder(s): ").split()
+            if not remote_wds: continue
+            stream = input("Feed the TST from the compressed files, with no decompression (run --stream)? y/[n]: ")
+            stream = (stream.lower() == 'y')
+            ready = []
+            for remote_wd in remote_wds:
+                failed = [] if stream else action("verify", verify_report, HOST, remote_wd + "/csv")
+                if failed is None:
+                    print(f"=> W: the CSV files of '{remote_wd}' were not verified against the manifest")
+                elif failed:
+                    print(f"=> W: {len(failed)} CSV file(s) of '{remote_wd}' do not match the local ones:")
+                    for f in failed: print(f"     {f}")
+                    if input("Run anyway? y/[n]: ").lower() != 'y':
+                        continue
+                ready.append(remote_wd)
+            if not ready: continue
+            pack = input("Pack the reports into a single archive? [y]/n: ")
+            options = "--pack-reports" if pack.lower() != 'n' else ""
+            if stream: options += " --stream"
+            if len(ready) > 1:
+                # the longest first, for the least makespan of the queue
+                ready = action("plan", history.plan_studies, HOST, ready, agent = agent) or ready
+            for remote_wd in ready:
+                job_id = action("run", submit_job, HOST, remote_wd, options)
+                if job_id: print(f"=> '{remote_wd}' submitted as job {job_id}")
 
         elif opt == 8:
             remote_wd = input("Enter the name of the remote working folder: ")
@@ -153,9 +297,73 @@ def main():
             local_wd  = input("Enter the name of your local working folder: ")
             print(remote_wd)
             print(local_wd)
-            download_files(HOST, remote_wd, local_wd)
+            what = input("Download [a]ll the results (aggregated), [f]ollow a running TST, or a single [c]ase? [a]/f/c: ")
+            if what.lower() == 'c':
+                case = input("Enter the name of the case: ")
+                action("fetch_case", fetch_case, HOST, remote_wd, local_wd, case)
+            else:
+                follow = (what.lower() == 'f')
+                if action("download", download_files, HOST, remote_wd, local_wd, aggregated = True, follow = follow):
+                    n = action("ingest", results_db.ingest, local_wd, os.path.basename(remote_wd))
+                    print(f"=> {n} case(s) loaded into the local results store")
+
+        elif opt == 9:
+            report = action("retention_report", retention_report, HOST)
+            if report:
+                print("Last clean: {:s}, started {:s}{:s}".format(report["state"], report["started"],
+                    " (dry run, estimated)" if report["dry_run"] else ""))
+                for policy, nbytes in report["reclaimed"].items():
+                    print("  {:8s} {:7d} file(s) {:12.1f} MB reclaimed".format(policy, report["files"][policy], nbytes / 2**20))
+                if report["errors"]: print(f"  {len(report['errors'])} error(s), e.g. {report['errors'][0]}")
+            if report is not None and report.get("state") != "running":
+                what = input("Start a new clean of the old working folders? [n]o/[y]es/[d]ry run: ")
+                if what.lower() in ('y', 'd'):
+                    if action("clean", clean_server, HOST, dry_run = (what.lower() == 'd')):
+                        print("=> running in the background (see this option again for the result)")
+
+        elif opt == 11:
+            jobs_menu(HOST)
+
+        elif opt == 12:
+            status = input(f"Status of the cases ({results_db.STABLE}/{results_db.UNSTABLE}/[any]): ")
+            last = input("In the last N studies (blank for all): ")
+            case = input("Case name pattern (e.g. P1-1-%, blank for any): ")
+            rows = action("query", results_db.query, status, int(last) if last.isdigit() else 0, case = case)
+            for r in rows:
+                print("  {:s}  {:s}  {:s}".format(*r))
+            print(f"=> {len(rows)} case(s)")
+
+        elif opt == 13:
+            CSV_DIR = input("Enter the path where the study writes the CSV files: ")
+            inventory = None
+            if not os.path.exists(CSV_DIR) or not os.path.isdir(CSV_DIR):
+                # verifying the file exists and it is directory
+                print("??? Does not exist, or it is not a directory")
+                continue
+            remote_wd = input("Enter the name of the remote working folder: ")
+            remote_path = "work/" + remote_wd + "/csv"
+            print("=> remote path to upload the files to:", remote_path)
+            use_columnar = input("Use the columnar format for numeric CSV files? y/[n]: ")
+            use_columnar = (use_columnar.lower() == 'y')
+            n = action("watch", watch_folder, HOST, CSV_DIR, remote_path, use_columnar = use_columnar)
+            print(f"=> {n} file(s) uploaded")
+            if n and input("Decompress the files in the remote host now? [y]/n: ").lower() != 'n':
+                p = action("decompress", decompress_files, HOST, remote_path, agent = agent)
+
+        elif opt == 14:
+            print("The fastest options found are taken by all the SSH/SFTP sessions with the host")
+            action("linkprofile", profile_link, HOST)
+
+        elif opt == 15:
+            cap = input("Cap of the bandwidth for all the transfers, in MB/s (0 for none, blank to keep {:s}): ".format(
+                f"{LIMITER.rate / 2**20:.1f} MB/s" if LIMITER.rate > 0 else "none"))
+            try:
+                if cap.strip(): save_cap(float(cap) * 2**20)
+            except ValueError:
+                print("??? Not a number, the cap was kept")
 
         elif opt == exit_option:
+            agent.close()
             print("Thanks for using the TST app, by VDITech.- Bye!")
             exit(0)
 
@@ -164,5 +372,5 @@ def main():
         """
 
 if __name__ == "__main__":
-    main()
+    main(profile = "--profile" in argv[1:])
     
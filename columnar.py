@@ -0,0 +1,236 @@
+"""
+ * COLUMNAR_PY
+ * Columnar transport format for the numeric CSV files.
+ *
+ * The rows of the CSV are transposed into columns. Every numeric column
+ * (fixed number of decimals, e.g. angles and voltages) is stored as the
+ * deltas of its scaled integer values, with the bytes of the deltas shuffled
+ * in planes, which the entropy coder (gzip) compresses much better than the
+ * text rows. Any other column is kept as text. The original CSV is rebuilt
+ * byte by byte; a file that does not fit the format is stored as it is.
+ *
+ * Usage (in the remote host, after gzip -d):
+ *   python3 columnar.py -d file.csv.col ...     ==> file.csv
+ *   python3 columnar.py -c file.csv.col         ==> the CSV to stdout
+ *   (- as file reads stdin, e.g. for gzip -dc file.csv.col.gz | ...)
+ *
+ * This product is protected under U.S. Copyright Law.
+ * Unauthorized reproduction is considered a criminal act.
+ * (C) 2018-2021 VDI Technologies, LLC. All rights reserved.
+"""
+
+__author__    = "Yoel Monsalve"
+__date__      = "October, 2026"
+__modified__  = ""
+__version__   = ""
+__copyright__ = "VDI Technologies, LLC"
+
+import os
+import sys
+from sys import stdin, stdout, stderr, argv, exit
+import re         # regex
+import json
+import struct
+from array import array
+from itertools import accumulate
+
+MAGIC    = b"TSTCOL\x01"
+MODE_RAW = 0
+MODE_COL = 1
+EXT      = ".col"      # file.csv ==> file.csv.col
+
+DELIMITER = ','
+
+# array typecodes by width of the deltas, in bytes
+TYPECODES = {1: 'b', 2: 'h', 4: 'i', 8: 'q'}
+
+__num_re = {}
+
+# '-0' or '-0.00' would not be rebuilt
+__neg_zero_re = re.compile(r"(?:^|\n)-0(?:\.0*)?(?:\n|$)")
+
+def __numeric_re(decimals):
+    """Regex of a column (cells joined by newlines) of numbers in canonical form,
+    with the given decimals
+    """
+    if decimals not in __num_re:
+        frac = r"\.\d{%d}" % decimals if decimals else ""
+        num = r"-?(?:0|[1-9]\d*)" + frac
+        __num_re[decimals] = re.compile(r"(?:%s\n)*%s" % (num, num))
+    return __num_re[decimals]
+
+def __format(v, decimals):
+    """Inverse of the parsing of a numeric cell"""
+    s = str(abs(v))
+    if decimals:
+        s = s.rjust(decimals + 1, '0')
+        s = s[:-decimals] + '.' + s[-decimals:]
+    return '-' + s if v < 0 else s
+
+def __encode_numeric(cells):
+    """Encodes a numeric column
+    @return tuple (metadata, blob), or None if the column is not numeric
+    """
+    first = cells[0]
+    dot = first.find('.')
+    decimals = len(first) - dot - 1 if dot >= 0 else 0
+    column = '\n'.join(cells)
+    if not __numeric_re(decimals).fullmatch(column): return None
+    if __neg_zero_re.search(column): return None
+
+    vals = list(map(int, column.replace('.', '').split('\n')))
+    deltas = [b - a for a, b in zip([0] + vals, vals)]
+    peak = max(max(deltas), -min(deltas))
+    for width in sorted(TYPECODES):
+        if peak < 1 << (8 * width - 1): break
+    else:
+        return None
+
+    a = array(TYPECODES[width], deltas)
+    if sys.byteorder == 'big': a.byteswap()
+    raw = a.tobytes()
+    # shuffle: all the low bytes first, then the next ones, ...
+    blob = b"".join(raw[k::width] for k in range(width))
+    return ({"type": "num", "decimals": decimals, "width": width}, blob)
+
+def __decode_numeric(meta, blob, rows):
+    width = meta["width"]
+    raw = bytearray(len(blob))
+    for k in range(width):
+        raw[k::width] = blob[k * rows:(k + 1) * rows]
+    a = array(TYPECODES[width])
+    a.frombytes(bytes(raw))
+    if sys.byteorder == 'big': a.byteswap()
+    decimals = meta["decimals"]
+    return [__format(v, decimals) for v in accumulate(a)]
+
+def __raw(data):
+    return MAGIC + bytes([MODE_RAW]) + data
+
+def encode(data):
+    """Encodes the content of a CSV file (bytes, or memoryview) into the
+    columnar format
+    """
+
+    # the text is handled as latin-1, which maps byte to char one to one
+    text = str(data, 'latin-1')
+    nl = '\r\n' if '\r\n' in text else '\n'
+    if text.count('\n') != text.count(nl) or '"' in text:
+        # mixed line endings, or quoted cells
+        return __raw(data)
+
+    lines = text.split(nl)
+    trailing = (lines[-1] == '')
+    if trailing: lines.pop()
+    if len(lines) < 2:
+        return __raw(data)
+
+    # the first line (header) is kept as it is
+    first = lines[0]
+    rows = [l.split(DELIMITER) for l in lines[1:]]
+    ncols = len(rows[0])
+    for r in rows:
+        if len(r) != ncols: return __raw(data)
+
+    cols  = []
+    blobs = []
+    for cells in zip(*rows):
+        r = __encode_numeric(cells)
+        if r is None:
+            r = ({"type": "text"}, '\n'.join(cells).encode('latin-1'))
+        cols.append(r[0])
+        blobs.append(r[1])
+
+    meta = json.dumps({
+        "nl": nl,
+        "trailing": trailing,
+        "first": first,
+        "rows": len(rows),
+        "cols": cols,
+    }).encode('utf-8')
+
+    out = [MAGIC, bytes([MODE_COL]), struct.pack(">I", len(meta)), meta]
+    for b in blobs:
+        out.append(struct.pack(">Q", len(b)))
+        out.append(b)
+    return b"".join(out)
+
+def decode(data):
+    """Rebuilds the original CSV file (bytes) from the columnar format"""
+
+    if not data.startswith(MAGIC):
+        raise ValueError("not a columnar CSV file")
+    pos = len(MAGIC)
+    mode = data[pos]
+    pos += 1
+    if mode == MODE_RAW:
+        return data[pos:]
+
+    (n,) = struct.unpack_from(">I", data, pos)
+    pos += 4
+    meta = json.loads(data[pos:pos + n].decode('utf-8'))
+    pos += n
+
+    rows = meta["rows"]
+    cols = []
+    for c in meta["cols"]:
+        (n,) = struct.unpack_from(">Q", data, pos)
+        pos += 8
+        blob = data[pos:pos + n]
+        pos += n
+        if c["type"] == "num":
+            cols.append(__decode_numeric(c, blob, rows))
+        else:
+            cols.append(blob.decode('latin-1').split('\n'))
+
+    nl = meta["nl"]
+    lines = [meta["first"]]
+    lines += [DELIMITER.join(r) for r in zip(*cols)]
+    text = nl.join(lines)
+    if meta["trailing"]: text += nl
+    return text.encode('latin-1')
+
+def decode_file(path_in):
+    """Decodes file.csv.col into file.csv, and removes the former
+    @return True if success, False otherwise
+    """
+    if not path_in.endswith(EXT):
+        stderr.write(f"columnar: '{path_in}' has not the extension {EXT}\n")
+        return False
+    path_out = path_in[:-len(EXT)]
+    try:
+        with open(path_in, "rb") as fi:
+            data = decode(fi.read())
+        # a new file, never written in place: the old one may be a hard link
+        # of the store (see the script cas), shared with other folders
+        with open(path_out + ".part", "wb") as fo:
+            fo.write(data)
+        os.replace(path_out + ".part", path_out)
+        os.remove(path_in)
+    except Exception as e:
+        stderr.write(f"columnar: {path_in}: {e}\n")
+        return False
+    return True
+
+if __name__ == "__main__":
+    if len(argv) == 3 and argv[1] == "-c":
+        # to stdout, e.g. to feed a named pipe (see run --stream)
+        if argv[2] == "-":
+            data = stdin.buffer.read()
+        else:
+            with open(argv[2], "rb") as f:
+                data = f.read()
+        try:
+            stdout.buffer.write(decode(data))
+        except (ValueError, BrokenPipeError) as e:
+            stderr.write(f"columnar: {argv[2]}: {e}\n")
+            exit(1)
+        exit(0)
+    if len(argv) < 3 or argv[1] != "-d":
+        stderr.write(f"USAGE {argv[0]} -d file.csv.col ...\n")
+        stderr.write(f"      {argv[0]} -c file.csv.col|-\n")
+        exit(1)
+    errors = 0
+    for path in argv[2:]:
+        if not decode_file(path): errors += 1
+    exit(1 if errors else 0)
@@ -20,9 +20,183 @@ import sys
 import stat    # chmod
 import re      # regex
 from datetime import datetime, timedelta
+from time import perf_counter
 import gzip
+import zlib
+import struct
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import mmap
+import hashlib
+from contextlib import contextmanager
+import columnar
+import zdict
+import preflight
+from scanner import scan
 
-def compress_files(DIR = ''):
+CHUNK_SIZE = 1 << 22      # 4 MB
+
+# files left in .tmp to be transferred
+OUTPUT_PATTERNS = ("*.csv.gz", "*.csv" + columnar.EXT + ".gz", "*.csv" + zdict.EXT)
+
+# BLAKE2b hashes of the original CSV files, in the format of b2sum, so the
+# remote host verifies them with b2sum -c
+MANIFEST = "MANIFEST.b2"
+
+def read_manifest(path):
+	"""@return dict {filename: hash} of a manifest (empty if it does not exist)"""
+	manifest = {}
+	try:
+		with open(path, encoding = 'utf-8') as f:
+			for line in f:
+				h, name = line.rstrip('\n').split('  ', 1)
+				manifest[name] = h
+	except FileNotFoundError:
+		pass
+	return manifest
+
+def write_manifest(path, manifest):
+	"""Writes a manifest, as dict {filename: hash}"""
+	with open(path, "w", encoding = 'utf-8', newline = '\n') as f:
+		for name in sorted(manifest):
+			f.write(f"{manifest[name]}  {name}\n")
+
+@contextmanager
+def mapped_file(path):
+	"""Maps the file in memory (read only), and gives a memoryview of its content.
+	Slices of it (see iter_chunks()) can go to the compressor or the hasher
+	with no copies in user space, and with no second copy of the pages.
+	"""
+	with open(path, "rb") as f:
+		if os.fstat(f.fileno()).st_size == 0:
+			# an empty file cannot be mapped
+			yield memoryview(b"")
+			return
+		with mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ) as mm:
+			if hasattr(mm, "madvise"):
+				mm.madvise(mmap.MADV_SEQUENTIAL)
+			with memoryview(mm) as mv:
+				yield mv
+
+def iter_chunks(data, chunk_size = CHUNK_SIZE):
+	"""Slices of (at most) chunk_size bytes of a memoryview. Every slice is
+	released when the next one is taken, so the map can be closed later.
+	"""
+	for i in range(0, len(data), chunk_size):
+		with data[i:i + chunk_size] as chunk:
+			yield chunk
+
+class AdaptiveLevel:
+	"""Controller of the gzip compression level, for a streaming compress-and-send
+	path. It is fed with the throughput of the compressor and of the link, and
+	moves the level so that both are kept busy: if the compressor is slower
+	than the link, the level goes down (less CPU by byte); if the link is the
+	slower one, the level goes up (more ratio, the CPU is waiting anyway).
+	"""
+	MIN_LEVEL = 1
+	MAX_LEVEL = 9
+	ALPHA     = 0.3       # weight of a new sample (moving average)
+	MARGIN    = 0.15      # dead band, to not oscillate between two levels
+
+	def __init__(self, level = 5):
+		self.level    = level
+		self.cpu_rate = {}    # level => input bytes/s of the compressor
+		self.ratio    = {}    # level => input bytes / output bytes
+		self.net_rate = None  # output (compressed) bytes/s of the link
+
+	def __average(self, old, new):
+		return new if old is None else (1 - self.ALPHA) * old + self.ALPHA * new
+
+	def compressed(self, level, n_in, n_out, secs):
+		"""A chunk of n_in bytes was compressed into n_out bytes, in secs"""
+		if secs <= 0 or n_out <= 0: return
+		self.cpu_rate[level] = self.__average(self.cpu_rate.get(level), n_in / secs)
+		self.ratio[level] = self.__average(self.ratio.get(level), n_in / n_out)
+
+	def sent(self, n_out, secs):
+		"""n_out compressed bytes were accepted by the link, in secs"""
+		if secs <= 0: return
+		self.net_rate = self.__average(self.net_rate, n_out / secs)
+
+	def next_level(self):
+		"""Level for the next chunk"""
+		level = self.level
+		if self.net_rate is None or level not in self.cpu_rate:
+			return level
+		cpu = self.cpu_rate[level]
+		net = self.net_rate * self.ratio[level]    # as input bytes/s
+		if cpu < net * (1 - self.MARGIN) and level > self.MIN_LEVEL:
+			self.level = level - 1
+		elif cpu > net * (1 + self.MARGIN) and level < self.MAX_LEVEL:
+			self.level = level + 1
+		return self.level
+
+# Files of PARALLEL_THRESHOLD or more are compressed in blocks, at once in a
+# pool of threads (see parallel_gzip())
+PARALLEL_THRESHOLD = 64 << 20     # 64 MB
+BLOCK_SIZE         = 1 << 20      # 1 MB
+DICT_SIZE          = 1 << 15      # the window of deflate: 32 KB
+WORKERS            = os.cpu_count() or 1
+
+def __deflate_block(block, dictionary, level, last):
+	"""Raw deflate of a block, primed with the end of the previous one. The
+	block is ended by a sync flush (so the next one starts at a byte boundary),
+	or by the end of the stream if it is the last one.
+	"""
+	if dictionary:
+		c = zlib.compressobj(level, zlib.DEFLATED, -15, zdict = dictionary)
+	else:
+		c = zlib.compressobj(level, zlib.DEFLATED, -15)
+	return c.compress(block) + c.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+def parallel_gzip(data, fout, compresslevel = 5, workers = WORKERS, hasher = None):
+	"""Compresses the memoryview data into fout (a binary file) as pigz does:
+	it is cut into blocks of BLOCK_SIZE, deflated at once in a pool of threads
+	(zlib releases the GIL), every one primed with the last 32 KB of the
+	previous block, so the ratio is almost that of a single stream. The blocks
+	are joined into a single gzip member, read by any gzip -d.
+	@param hasher: if given (e.g. hashlib.blake2b()), it is updated with data
+	"""
+	n = len(data)
+	fout.write(struct.pack("<4sIBB", b"\x1f\x8b\x08\x00", int(datetime.now().timestamp()), 0, 255))
+	crc = 0
+	pending = deque()
+	with ThreadPoolExecutor(workers) as pool:
+		for i in range(0, max(n, 1), BLOCK_SIZE):
+			block = data[i:i + BLOCK_SIZE]
+			dictionary = data[max(0, i - DICT_SIZE):i]
+			pending.append((block, dictionary, pool.submit(__deflate_block, block, dictionary, compresslevel, i + BLOCK_SIZE >= n)))
+			# a bounded window of blocks in flight, written in order
+			while len(pending) > 2 * workers or (pending and i + BLOCK_SIZE >= n):
+				block, dictionary, f = pending.popleft()
+				fout.write(f.result())
+				crc = zlib.crc32(block, crc)
+				if hasher is not None: hasher.update(block)
+				# the slices are released, so the map can be closed later
+				block.release()
+				dictionary.release()
+	fout.write(struct.pack("<II", crc, n & 0xffffffff))
+
+def compress_files(DIR = '', use_columnar = False, preflight_check = True, compresslevel = 5,
+	inventory = None, recursive = False, overwrite = None, dictionary = False, stats = None):
+	"""Compresses the CSV files of the folder DIR into DIR/.tmp
+	@param use_columnar: if True, the files are transposed into the columnar
+	       format (see columnar.py) before gzip, as file.csv.col.gz
+	@param preflight_check: if True, the files that fail the pre-flight check
+	       (see preflight.py) are excluded, and a report is left in DIR/.tmp
+	@param inventory: files to compress, as given by scanner.scan(); by default
+	       the CSV files of DIR (and its subfolders, if recursive is True)
+	@param overwrite: what to do with the outputs already in DIR/.tmp: None
+	       asks the user, True overwrites them all, False skips them all
+	@param dictionary: if True (and not use_columnar), the small files are
+	       compressed against a dictionary trained from the folder (see
+	       zdict.py), as file.csv.zd. A dictionary already in DIR/.tmp is
+	       kept, so the files compressed before are still good with it.
+	@param stats: if a dict is given, it gets "secs", the time of the
+	       compression alone (not of the checks, nor the prompts), and
+	       "out_bytes", the size of the outputs written
+	@return list of the names of the files compressed
+	"""
 
 	if not DIR:
 		stderr.write(f"{sys.argv[0]}: compress_files: No directory specified")
@@ -37,78 +211,150 @@ def compress_files(DIR = ''):
 		os.mkdir(TMP)
 		os.chmod(TMP, mode=0o770)
 
-	OW_ALL  = False        # overwrite all
-	NOW_ALL = False        # don't overwrite any
+	OW_ALL  = overwrite is True     # overwrite all
+	NOW_ALL = overwrite is False    # don't overwrite any
 	OW      = True         # overwrite this
 
 	t1 = datetime.now()
-	for filename in os.listdir(DIR):
+	
+	if inventory is None:
+		inventory = scan(DIR, recursive = recursive)
+	
+	# hashes of the original files, to be verified in the remote host
+	# (the entries of the files not compressed again are kept, but only of
+	# the files still in the folder: the inventory may be a part of it)
+	manifest = {name: h for name, h in read_manifest(TMP + MANIFEST).items() if os.path.isfile(DIR + name)}
+	
+	done = []
+	bad = {}
+	if preflight_check:
+		print("Pre-flight check of the CSV files ...")
+		bad = preflight.scan_folder(DIR, inventory = inventory)
+		# the failures of the files not checked now are kept, as the manifest
+		names = {entry.name for entry in inventory}
+		failed = {name: errors for name, errors in preflight.read_report(TMP + preflight.REPORT).items()
+			if name not in names and os.path.isfile(DIR + name)}
+		failed.update(bad)
+		preflight.write_report(failed, TMP + preflight.REPORT)
+		print(f"{len(bad)} file(s) failed the check, see {TMP + preflight.REPORT}")
+		# removing stale outputs of the bad files, so they are not uploaded
+		for filename in bad:
+			manifest.pop(filename, None)
+			for ext in (".gz", columnar.EXT + ".gz", zdict.EXT):
+				if os.path.isfile(TMP + filename + ext):
+					os.remove(TMP + filename + ext)
+	
+	zd = b""
+	if dictionary and not use_columnar:
+		try:
+			with open(TMP + zdict.DICT, "rb") as f:
+				zd = f.read()
+		except FileNotFoundError:
+			zd = zdict.train([e for e in inventory if e.name not in bad and e.size <= zdict.MAX_FILE])
+			if zd:
+				with open(TMP + zdict.DICT, "wb") as f:
+					f.write(zd)
+				print(f"Trained a dictionary of {len(zd)} bytes into {TMP + zdict.DICT}")
+	
+	secs = 0.0
+	outputs = []
+	for entry in inventory:
 		
-		# only taking .CSV files
-		matcher = re.compile(r".*\.csv$")
-		if matcher.match(filename):
-			stdout.write(f"  reading: {filename}")
-		else:
-			#print("  does not match", filename)
+		filename = entry.name
+		if filename in bad:
+			print(f"  skipping: {filename} (failed the pre-flight check)")
 			continue
+		stdout.write(f"  reading: {filename}")
 		
-		path_in = DIR + filename
-		if os.path.exists(path_in) and os.path.isfile(path_in):
-			# if it is a regular file
-			o_mode = os.stat(path_in).st_mode
-			if not o_mode & stat.S_IRUSR:
-				print(f"\n  changing mode for {path_in} to user-readable")
-				stdout.flush()
-				os.chmod(path_in, o_mode | stat.S_IRUSR)
-			
-			fi = open(path_in, "rb")
-			if fi:
-				data = fi.read()
-				
-				path_out = TMP + filename + ".gz"
-				OW = False
-				if OW_ALL: OW = True
-				if not OW_ALL and os.path.isfile(path_out):
-					if NOW_ALL:
-						print("    skipping") 
-						continue
-					else:
-						ans = input(f"\n    Overwrite {path_out}? [y]es / [n]o / [Y]es to all / [N]ot to all: ")
-						if ans == 'y': 
-							OW = True
-						elif ans == 'Y': 
-							OW_ALL = True
-							OW = True
-						elif ans == 'N': 
-							NOW_ALL = True
-						else:
-							continue    # skip this file
-				"""try:
-					zip_data = gzip.compress(data, compresslevel = 5)
-					
-				except Exception as e:
-					stderr.write("gzip error: " + str(e) + '\n')
-				
-				path_out = TMP + filename + ".gz"
-				fo = open(path_out, "wb")
-				fo.write(zip_data)
-				fo.close()
-				"""
-				
-				fzip = gzip.open(path_out, mode="wb", compresslevel = 5)
+		path_in = entry.path
+		if not entry.mode & stat.S_IRUSR:
+			print(f"\n  changing mode for {path_in} to user-readable")
+			stdout.flush()
+			os.chmod(path_in, entry.mode | stat.S_IRUSR)
+		
+		use_dict = zd and entry.size <= zdict.MAX_FILE
+		if use_columnar:
+			path_out = TMP + filename + columnar.EXT + ".gz"
+		elif use_dict:
+			path_out = TMP + filename + zdict.EXT
+		else:
+			path_out = TMP + filename + ".gz"
+		if '/' in filename:
+			# recursive layout: the same tree into .tmp
+			os.makedirs(os.path.dirname(path_out), exist_ok = True)
+		OW = False
+		if OW_ALL: OW = True
+		if not OW_ALL and os.path.isfile(path_out):
+			if NOW_ALL:
+				print("    skipping") 
+				continue
+			else:
+				ans = input(f"\n    Overwrite {path_out}? [y]es / [n]o / [Y]es to all / [N]ot to all: ")
+				if ans == 'y': 
+					OW = True
+				elif ans == 'Y': 
+					OW_ALL = True
+					OW = True
+				elif ans == 'N': 
+					NOW_ALL = True
+				else:
+					continue    # skip this file
+		
+		# the input is mapped in memory, and its slices go straight
+		# into the compressor, with no copies in user space
+		# (and the hasher, in the same pass)
+		h = hashlib.blake2b()
+		t = perf_counter()
+		try:
+			with mapped_file(path_in) as data:
+				if use_dict:
+					# a small file: against the dictionary (zlib)
+					with open(path_out, "wb") as fout:
+						fout.write(zdict.compress(data, zd, compresslevel))
+					h.update(data)
+					manifest[filename] = h.hexdigest()
+					done.append(filename)
+					outputs.append(path_out)
+					print("    done")
+					continue
+				if not use_columnar and entry.size >= PARALLEL_THRESHOLD:
+					# a large file: in blocks, in all the cores
+					with open(path_out, "wb") as fout:
+						parallel_gzip(data, fout, compresslevel, hasher = h)
+					manifest[filename] = h.hexdigest()
+					done.append(filename)
+					outputs.append(path_out)
+					print("    done")
+					continue
+				fzip = gzip.open(path_out, mode="wb", compresslevel = compresslevel)
 				if fzip:
-					fzip.write(data)
-					#print("written to " + path_out)
-					#fzip.close()
+					if use_columnar:
+						# the columns need the whole file, so it is hashed apart
+						# (a second pass over the mapped file, from the page cache)
+						fzip.write(columnar.encode(data))
+						h.update(data)
+					else:
+						for chunk in iter_chunks(data):
+							fzip.write(chunk)
+							h.update(chunk)
+					fzip.close()
+					manifest[filename] = h.hexdigest()
+					done.append(filename)
+					outputs.append(path_out)
 				else:
 					stderr.write(f"error: creating the gzip gile '{path_out}'\n")
-					
-				fi.close()
-				print("    done")
+		finally:
+			secs += perf_counter() - t
+		print("    done")
 	
+	write_manifest(TMP + MANIFEST, manifest)
+	if stats is not None:
+		stats["secs"] = secs
+		stats["out_bytes"] = sum(os.path.getsize(path) for path in outputs)
 	print(f"Were compressed to {TMP}")
 	t2 = datetime.now()
 	print("Processed in", t2 - t1)
+	return done
 
 def test():
 	"""Test code"""
@@ -117,5 +363,6 @@ def test():
 	compress_files(DIR)
 	
 if __name__ == "__main__":
-	test()
+	from profiling import main_with_profile
+	main_with_profile("compress", test)
 	
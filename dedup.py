@@ -0,0 +1,95 @@
+"""
+ * DEDUP_PY
+ * Deduplicated upload of the CSV files. The remote host keeps a store of
+ * the files already uploaded, by their hash (see the script cas), so the
+ * files of a new working folder that are already in the store are hard
+ * linked there, and only the rest has to be compressed and transferred.
+ *
+ * This product is protected under U.S. Copyright Law.
+ * Unauthorized reproduction is considered a criminal act.
+ * (C) 2018-2021 VDI Technologies, LLC. All rights reserved.
+"""
+
+__author__    = "Yoel Monsalve"
+__date__      = "October, 2026"
+__modified__  = ""
+__version__   = ""
+__copyright__ = "VDI Technologies, LLC"
+
+import os
+import sys
+from sys import stdin, stdout, stderr, argv, exit
+import re         # regex
+import shlex      # quote
+import hashlib
+from ssh_methods import ssh_exec, upload_script
+from compress import mapped_file, iter_chunks, OUTPUT_PATTERNS, MANIFEST, read_manifest
+from scanner import scan
+
+# Content-addressed store in the remote host
+CAS = "./cas"
+
+def hash_file(path):
+    """BLAKE2b hash of the file, as hex string (the same as b2sum)"""
+    h = hashlib.blake2b()
+    with mapped_file(path) as data:
+        for chunk in iter_chunks(data):
+            h.update(chunk)
+    return h.hexdigest()
+
+def hash_files(DIR = '', inventory = None):
+    """@return dict {filename: hash} of the CSV files of the folder DIR (or
+    the given inventory, as returned by scanner.scan())
+    """
+    if not DIR: return {}
+
+    if inventory is None:
+        inventory = scan(DIR)
+
+    # the hashes taken while compressing are good, if not older than the file
+    path = os.path.join(DIR, ".tmp", MANIFEST)
+    manifest = read_manifest(path)
+    since = os.stat(path).st_mtime if manifest else 0
+    hashes = {}
+    for f in inventory:
+        if f.name in manifest and f.mtime <= since:
+            hashes[f.name] = manifest[f.name]
+        else:
+            hashes[f.name] = hash_file(f.path)
+    return hashes
+
+def link_known_files(HOST = "", DIR = "", remote_path = "", verbose = False, inventory = None):
+    """Hard links into remote_path the CSV files of DIR already in the remote
+    store, in a single round trip
+    @return set of the names of the files still to be uploaded, or None
+    """
+    if not HOST: return
+    if not DIR: return
+    if not remote_path: return
+
+    hashes = hash_files(DIR, inventory)
+    if not hashes: return set()
+
+    if not upload_script(HOST, "cas", verbose = verbose): return None
+    data = "".join(f"{hashes[f]} {f}\n" for f in hashes).encode('utf-8')
+    out = ssh_exec(HOST, "bash {:s} link {:s}".format(CAS, shlex.quote(remote_path)),
+        data = data, verbose = verbose)
+    if out is None: return None
+
+    missing = set(out.split('\n')) - {''}
+    print(f"=> {len(hashes) - len(missing)} file(s) already in the server, {len(missing)} to upload")
+    return missing
+
+def compressed_names(TMP = "", names = ()):
+    """Names of the compressed files in TMP (file.csv.gz, file.csv.col.gz,
+    file.csv.zd), of the given CSV files
+    """
+    if not TMP: return []
+
+    matcher = re.compile(r"(.*\.csv)((\.col)?\.gz|\.zd)$")
+    files = []
+    for f in scan(TMP, include = OUTPUT_PATTERNS, recursive = True):
+        m = matcher.match(f.name)
+        if m and m.group(1) in names:
+            files.append(f.name)
+    return files
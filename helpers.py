@@ -17,6 +17,7 @@ import sys
 import signal
 from datetime import datetime
 import traceback
+import json
 
 # Makes a timestamp in the format: [%Y-%m-%d %H:%M:%S.%f]
 # @utc_server_file: the output file used by the live UTC server
@@ -231,6 +232,56 @@ def is_posix():
 	else:
 		return False
 
+# Local state of the client (results store, caches, history, ...)
+STATE_DIR = ".tstclient"
+
+def state_path(name):
+
+	"""Path of a file in the local state folder, creating the folder if needed"""
+	create_dir(STATE_DIR)
+	return os.path.join(STATE_DIR, name)
+
+# User and identity file of the SSH/SFTP sessions with the remote host
+SSH_USER = "tst"
+SSH_KEY  = ".ssh/id_rsa"
+
+# Fastest options found for every host by the link profiler (see linkprofile.py)
+LINK_PROFILES = "link_profiles.json"
+
+def link_profile(HOST):
+
+	"""Saved link profile of the host, as dict with the keys 'ssh_options'
+	and 'sftp_options' (lists of arguments), or {} if not profiled
+	"""
+	try:
+		with open(os.path.join(STATE_DIR, LINK_PROFILES)) as f:
+			return json.load(f).get(HOST, {})
+	except (OSError, ValueError):
+		return {}
+
+def ssh_args(HOST, verbose = False, profile = True):
+
+	"""Builds the argument list to open a SSH session with the remote host,
+	e.g. ['ssh', '-i', '.ssh/id_rsa', 'tst@HOST'], with the options of the
+	link profile of the host, if any (and profile is True)
+	"""
+	args = ["ssh"]
+	if verbose: args.append("-v")
+	if profile: args += link_profile(HOST).get("ssh_options", [])
+	args += ["-i", SSH_KEY, SSH_USER + "@" + HOST]
+	return args
+
+def sftp_args(HOST, verbose = False, profile = True):
+
+	"""Builds the argument list to open a SFTP session with the remote host"""
+	args = ["sftp"]
+	if verbose: args.append("-v")
+	if profile:
+		p = link_profile(HOST)
+		args += p.get("ssh_options", []) + p.get("sftp_options", [])
+	args += ["-i", SSH_KEY, SSH_USER + "@" + HOST]
+	return args
+
 def csv_print_row(f, row, delimiter=','):
   """Prints out a row in CSV file, using the given delimiter (',' by default)
   It is similar to the method writerow of the csv writer given in the python 
@@ -245,18 +296,96 @@ def csv_print_row(f, row, delimiter=','):
 
   :returns: True if success, False otherwise
   """
-  line = ''
-  for i in range(len(row)):
-    if i > 0: line += delimiter
-    line += str(row[i])
   try:
-    f.write(line + "\n")
+    f.write(delimiter.join(map(str, row)) + "\n")
   except Exception as e:
     sys.stderr.write("matchTracker.print_row: Exception: " + str(e) + "\n" )
     return False
   # success
   return True
 
+# bytes of text kept by CSVWriter before every write
+CSV_BUFFER = 1 << 20
+
+class CSVWriter:
+
+	"""Batched writer of CSV tables, with the same output as csv_print_row(),
+	row by row, but formatted by whole blocks of rows (or whole columns) and
+	written in large blocks of text (CSV_BUFFER), instead of once by row.
+
+	The sink is a file object, or a path (gzip compressed if it ends in .gz,
+	or if compress is True). E.g.:
+
+		with CSVWriter("summary.csv.gz") as w:
+			w.write_rows([["case", "status"]])
+			w.write_columns([cases, status])     # lists, or NumPy arrays
+	"""
+
+	def __init__(self, f, delimiter = ',', compress = False, compresslevel = 6, buffer_size = CSV_BUFFER):
+		self.delimiter = delimiter
+		self.buffer_size = buffer_size
+		self.own = isinstance(f, (str, os.PathLike))
+		if self.own:
+			if compress or os.fspath(f).endswith(".gz"):
+				import gzip
+				f = gzip.open(f, "wt", compresslevel = compresslevel)
+			else:
+				f = open(f, "w")
+		self.f = f
+		self.buffer = []
+		self.size = 0
+
+	@staticmethod
+	def __column(column):
+		# the cells of a column as strings. A NumPy array of int or float64
+		# is taken to Python numbers at once (same str(), and faster than its
+		# scalars), and any other dtype (e.g. float32) is formatted by NumPy
+		if hasattr(column, "dtype"):
+			if column.dtype.kind in "biu" or column.dtype == "float64":
+				column = column.tolist()
+			else:
+				return column.astype(str).tolist()
+		return list(map(str, column))
+
+	def __push(self, lines):
+		if not lines: return
+		text = "\n".join(lines) + "\n"
+		self.buffer.append(text)
+		self.size += len(text)
+		if self.size >= self.buffer_size: self.flush()
+
+	def write_rows(self, rows):
+		"""Writes many rows (sequences of cells, or a 2-D NumPy array)"""
+		if getattr(rows, "ndim", 0) == 2:
+			return self.write_columns(rows.T)
+		d = self.delimiter
+		self.__push([d.join(map(str, row)) for row in rows])
+
+	def write_columns(self, columns):
+		"""Writes a table given by its columns (sequences, or NumPy arrays, of
+		the same length)
+		"""
+		cells = [self.__column(c) for c in columns]
+		self.__push(list(map(self.delimiter.join, zip(*cells))))
+
+	def flush(self):
+		if self.buffer:
+			self.f.write("".join(self.buffer))
+			self.buffer = []
+			self.size = 0
+		self.f.flush()
+
+	def close(self):
+		"""Flushes the buffer, and closes the sink if it was opened here"""
+		self.flush()
+		if self.own: self.f.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
 def secureSecretFile(filename = '', mode = 0o640):
 
 	"""This implements a secure policy for a secret file (not allowed to be
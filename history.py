@@ -0,0 +1,270 @@
+"""
+ * HISTORY_PY
+ * Local history of the rates measured by phase, for every host, kept in
+ * .tstclient/history.json:
+ *
+ *   compress   MB/s of the compression, and ratio of the compressed size
+ *   link       MB/s sent to the host
+ *   tst        seconds of the TST by case and by MB of inputs (learned from
+ *              the finished jobs of the queue, see jobq)
+ *
+ * From them, the duration of every phase of a new folder is predicted before
+ * starting it, and a batch of studies is ordered for the queue so that its
+ * makespan is the least: the longest ones first (LPT), as the queue gives
+ * every free slot to the oldest queued job.
+ *
+ * This product is protected under U.S. Copyright Law.
+ * Unauthorized reproduction is considered a criminal act.
+ * (C) 2018-2021 VDI Technologies, LLC. All rights reserved.
+"""
+
+__author__    = "Yoel Monsalve"
+__date__      = "October, 2026"
+__modified__  = ""
+__version__   = ""
+__copyright__ = "VDI Technologies, LLC"
+
+import os
+import sys
+from sys import stdin, stdout, stderr, argv, exit
+import json
+import heapq
+from statistics import median
+from datetime import datetime
+from helpers import state_path, link_profile
+from ssh_methods import job_status, job_progress, job_slots
+from workspace import workspace_inventory
+
+HISTORY = "history.json"
+
+PHASES        = ("compress", "link", "tst")
+WINDOW        = 20       # samples kept by host and phase (the last ones)
+DEFAULT_RATIO = 0.3      # compressed size of a CSV file, before any is measured
+
+# the names of the input files of a working folder (see run)
+INPUT_SUFFIXES = (".csv", ".csv.gz", ".csv.col.gz", ".csv.zd")
+
+def __load():
+    try:
+        with open(state_path(HISTORY)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def __save(history):
+    path = state_path(HISTORY)
+    with open(path + ".part", "w") as f:
+        json.dump(history, f, indent = 1)
+    os.replace(path + ".part", path)
+
+def record(HOST = "", phase = "", nbytes = 0, secs = 0.0, out_bytes = 0, cases = 0, key = ""):
+    """Adds a sample of a phase to the history of the host
+    @param out_bytes: the compressed size (compress)
+    @param cases: the number of cases (tst)
+    @param key: if given, a sample with the same key is not added twice
+        (e.g. the id of a job)
+    @return True if added
+    """
+    if not HOST: return False
+    if phase not in PHASES: return False
+    if nbytes <= 0 or secs <= 0: return False
+
+    history = __load()
+    samples = history.setdefault(HOST, {}).setdefault(phase, [])
+    if key and any(s.get("key") == key for s in samples): return False
+    samples.append({
+        "bytes": nbytes,
+        "secs": round(secs, 3),
+        "out": out_bytes,
+        "cases": cases,
+        "key": key,
+        "date": datetime.now().isoformat(sep = ' ', timespec = 'seconds'),
+    })
+    del samples[:-WINDOW]
+    __save(history)
+    return True
+
+def learn_jobs(HOST = "", jobs = ()):
+    """Adds the finished jobs of the queue (as given by job_status()) to the
+    history of the TST, once each
+    @return number of samples added
+    """
+    n = 0
+    for j in jobs or ():
+        if j["state"] != "done" or not j["started"] or not j["finished"]: continue
+        if not j.get("cases") or not j.get("bytes"): continue
+        secs = (j["finished"] - j["started"]).total_seconds()
+        n += record(HOST, "tst", j["bytes"], secs, cases = j["cases"], key = j["id"])
+    return n
+
+def __fit_tst(samples):
+    """(seconds by case, seconds by MB) of the TST, as the least squares fit
+    of secs = a * cases + b * MB, or the median by case alone if the fit is
+    not possible (too few samples, or all of the same shape)
+    """
+    rows = [(s["cases"], s["bytes"] / 2**20, s["secs"]) for s in samples if s["cases"] > 0]
+    if not rows: return None
+    if len(rows) >= 2:
+        scc = sum(c * c for c, m, t in rows)
+        smm = sum(m * m for c, m, t in rows)
+        scm = sum(c * m for c, m, t in rows)
+        sct = sum(c * t for c, m, t in rows)
+        smt = sum(m * t for c, m, t in rows)
+        det = scc * smm - scm * scm
+        if det > 1e-9 * scc * smm:
+            a = (sct * smm - smt * scm) / det
+            b = (smt * scc - sct * scm) / det
+            if a >= 0 and b >= 0: return (a, b)
+    return (median(t / c for c, m, t in rows), 0.0)
+
+def rates(HOST = ""):
+    """Rates of the host, from the median of its recent samples
+    @return dict: compress (MB/s), ratio (compressed / original), link (MB/s),
+            tst_case (seconds by case), tst_mb (seconds by MB); None where
+            there are no samples yet
+    """
+    h = __load().get(HOST, {})
+    r = {"compress": None, "ratio": None, "link": None, "tst_case": None, "tst_mb": None}
+
+    compress = h.get("compress", [])
+    if compress:
+        r["compress"] = median(s["bytes"] / 2**20 / s["secs"] for s in compress)
+        ratios = [s["out"] / s["bytes"] for s in compress if s["out"]]
+        if ratios: r["ratio"] = median(ratios)
+
+    link = h.get("link", [])
+    if link:
+        r["link"] = median(s["bytes"] / 2**20 / s["secs"] for s in link)
+    else:
+        # the rates measured by the link profiler, if any (see linkprofile.py)
+        p = link_profile(HOST)
+        measured = list(p.get("sftp_rates", {}).values()) or list(p.get("ssh_rates", {}).values())
+        if measured: r["link"] = max(measured)
+
+    fit = __fit_tst(h.get("tst", []))
+    if fit: r["tst_case"], r["tst_mb"] = fit
+    return r
+
+def predict(HOST = "", nbytes = 0, cases = 0, upload = True):
+    """Predicted seconds of every phase of a folder of CSV files
+    @param upload: False for a folder already in the host (there is neither
+        compression nor upload)
+    @return dict {compress, link, tst, total}; a phase is None if its rate
+            is not known yet (and total is the sum of the known ones)
+    """
+    r = rates(HOST)
+    mb = nbytes / 2**20
+    p = {"compress": None, "link": None, "tst": None}
+    if not upload:
+        p["compress"] = p["link"] = 0.0
+    else:
+        if r["compress"]: p["compress"] = mb / r["compress"]
+        if r["link"]: p["link"] = mb * (r["ratio"] or DEFAULT_RATIO) / r["link"]
+    if r["tst_case"] is not None:
+        # the TST rate by MB is of the inputs as they were in the host
+        p["tst"] = r["tst_case"] * cases + r["tst_mb"] * mb
+    p["total"] = sum(v for v in p.values() if v)
+    return p
+
+def schedule(durations = None, slots = 2, loads = (), queued = ()):
+    """Orders a batch of studies for a queue of slots, longest first (LPT), and
+    places them as the queue would: every one in the first slot to get free
+    @param durations: {study: predicted seconds}
+    @param loads: seconds until every busy slot gets free (the jobs running)
+    @param queued: seconds of the jobs already queued, in their order (they
+        take the slots before the batch)
+    @return dict: order (list of studies), slot, start and end (dicts by
+            study, seconds from now), makespan (seconds)
+    """
+    durations = durations or {}
+    free = sorted(list(loads)[:slots] + [0.0] * max(0, slots - len(loads)))
+    heap = [(t, i) for i, t in enumerate(free)]
+    heapq.heapify(heap)
+    for d in queued:
+        t, i = heapq.heappop(heap)
+        heapq.heappush(heap, (t + d, i))
+    free = [t for t, i in heap]
+    plan = {"order": [], "slot": {}, "start": {}, "end": {}, "makespan": max(free, default = 0.0)}
+    for study in sorted(durations, key = lambda s: -durations[s]):
+        t, i = heapq.heappop(heap)
+        plan["order"].append(study)
+        plan["slot"][study] = i + 1
+        plan["start"][study] = t
+        plan["end"][study] = t + durations[study]
+        plan["makespan"] = max(plan["makespan"], t + durations[study])
+        heapq.heappush(heap, (t + durations[study], i))
+    return plan
+
+def folder_size(inv):
+    """(bytes, cases) of the inputs of an inventory of a csv/ folder (as given
+    by workspace.workspace_inventory())
+    """
+    nbytes = cases = 0
+    for e in inv["dirs"].values():
+        for name, (size, mtime) in e["files"].items():
+            if name.endswith(INPUT_SUFFIXES):
+                nbytes += size
+                cases += 1
+    return nbytes, cases
+
+def __predict_folder(HOST, working_dir, agent, verbose):
+    inv = workspace_inventory(HOST, working_dir.rstrip('/') + "/csv", agent, verbose = verbose)
+    if inv is None: return None
+    nbytes, cases = folder_size(inv)
+    return predict(HOST, nbytes, cases, upload = False)["tst"]
+
+def plan_studies(HOST = "", working_dirs = (), agent = None, verbose = False):
+    """Predicts the TST of every working folder (from their inventory and the
+    history of the host), and orders them for the queue (see schedule()),
+    after the jobs already there. The plan is printed.
+    @return the working folders in the order to submit them, or None
+    """
+    if not HOST: return
+    if not working_dirs: return []
+
+    jobs = job_status(HOST, verbose = verbose)
+    if jobs is None: return None
+    learn_jobs(HOST, jobs)
+    if rates(HOST)["tst_case"] is None:
+        print("No TST runs in the history of this host yet: the order is kept")
+        return list(working_dirs)
+    slots = job_slots(HOST, verbose) or 2
+
+    # the jobs running: by their progress, or else by their prediction
+    now = datetime.now()
+    loads = []
+    for j in jobs:
+        if j["state"] != "running" or not j["started"]: continue
+        elapsed = (now - j["started"]).total_seconds()
+        progress = job_progress(HOST, j["id"], verbose)
+        if progress and progress[0] > 0:
+            done, total = progress
+            loads.append(elapsed * max(0, total - done) / done)
+        else:
+            loads.append(max(0.0, (__predict_folder(HOST, j["working_dir"], agent, verbose) or 0.0) - elapsed))
+    queued = [__predict_folder(HOST, j["working_dir"], agent, verbose) or 0.0
+        for j in jobs if j["state"] == "queued"]
+
+    durations = {}
+    for wd in working_dirs:
+        d = __predict_folder(HOST, wd, agent, verbose)
+        if d is None:
+            stderr.write(f"plan_studies: no inventory of '{wd}'\n")
+            return None
+        durations[wd] = d
+
+    plan = schedule(durations, slots, loads, queued)
+    print(f"Plan over {slots} slot(s), after {len(loads)} running and {len(queued)} queued job(s):")
+    for wd in plan["order"]:
+        print("  {:30s} slot {:d}  {:>8s}  from +{:s} to +{:s}".format(wd, plan["slot"][wd],
+            format_secs(durations[wd]), format_secs(plan["start"][wd]), format_secs(plan["end"][wd])))
+    print(f"=> predicted makespan: {format_secs(plan['makespan'])}")
+    return plan["order"]
+
+def format_secs(secs):
+    """e.g. 3h 05m, 12m 30s, 45s; '?' if not known"""
+    if secs is None: return "?"
+    secs = int(round(secs))
+    if secs >= 3600: return f"{secs // 3600}h {secs % 3600 // 60:02d}m"
+    if secs >= 60: return f"{secs // 60}m {secs % 60:02d}s"
+    return f"{secs}s"
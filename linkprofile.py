@@ -0,0 +1,164 @@
+"""
+ * LINKPROFILE_PY
+ * Profiler of the SSH link with the remote host. It benchmarks the candidate
+ * ciphers (AES-GCM, ChaCha20, AES-CTR), the transport compression on and off,
+ * and the SFTP buffer size (-B) and requests in flight (-R), and saves the
+ * fastest profile of the host in .tstclient/link_profiles.json. From then on
+ * every SSH and SFTP session with the host takes it (see helpers.ssh_args()).
+ *
+ * The sample is random data, as incompressible as the gzip files sent.
+ *
+ * Usage:
+ *   python linkprofile.py HOST [MB]
+ *
+ * This product is protected under U.S. Copyright Law.
+ * Unauthorized reproduction is considered a criminal act.
+ * (C) 2018-2021 VDI Technologies, LLC. All rights reserved.
+"""
+
+__author__    = "Yoel Monsalve"
+__date__      = "October, 2026"
+__modified__  = ""
+__version__   = ""
+__copyright__ = "VDI Technologies, LLC"
+
+import os
+import sys
+from sys import stdin, stdout, stderr, argv, exit
+import json
+import subprocess
+import tempfile
+from time import perf_counter
+from datetime import datetime
+from helpers import ssh_args, sftp_args, state_path, LINK_PROFILES
+
+# (cipher, MAC); the AEAD ciphers carry their own MAC
+CIPHERS = (
+    ("aes128-gcm@openssh.com", ""),
+    ("aes256-gcm@openssh.com", ""),
+    ("chacha20-poly1305@openssh.com", ""),
+    ("aes128-ctr", "umac-64-etm@openssh.com"),
+)
+COMPRESSION   = ("no", "yes")
+SFTP_BUFFERS  = (32768, 131072, 262144)    # -B, bytes by request
+SFTP_REQUESTS = (64, 256)                  # -R, requests in flight
+
+SAMPLE_SIZE = 32 << 20     # 32 MB
+REMOTE_TMP  = ".linkprofile.tmp"
+
+def __ssh_options(cipher, mac, compression):
+    options = ["-c", cipher]
+    if mac: options += ["-m", mac]
+    return options + ["-o", "Compression=" + compression]
+
+def __time_ssh(HOST, options, data, verbose = False):
+    """Seconds to send data over a SSH session with the options (connection
+    included), or None if it failed (e.g. a cipher the server does not offer)
+    """
+    args = ssh_args(HOST, verbose, profile = False)
+    args[1:1] = options
+    t = perf_counter()
+    try:
+        r = subprocess.run(args + ["cat > /dev/null"], input = data,
+            stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL)
+    except OSError:
+        return None
+    if r.returncode != 0: return None
+    return perf_counter() - t
+
+def __time_sftp(HOST, options, path, verbose = False):
+    """Seconds to put the file over a SFTP session with the options, or None"""
+    args = sftp_args(HOST, verbose, profile = False)
+    args[1:1] = ["-b", "-"] + options
+    cmds = f"put \"{path}\" {REMOTE_TMP}\nrm {REMOTE_TMP}\n"
+    t = perf_counter()
+    try:
+        r = subprocess.run(args, input = cmds.encode('utf-8'),
+            stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL)
+    except OSError:
+        return None
+    if r.returncode != 0: return None
+    return perf_counter() - t
+
+def __save(HOST, profile):
+    path = state_path(LINK_PROFILES)
+    try:
+        with open(path) as f:
+            profiles = json.load(f)
+    except (OSError, ValueError):
+        profiles = {}
+    profiles[HOST] = profile
+    with open(path + ".part", "w") as f:
+        json.dump(profiles, f, indent = 2)
+    os.replace(path + ".part", path)
+
+def profile_link(HOST = "", size = SAMPLE_SIZE, verbose = False):
+    """Benchmarks the link with the host, and saves its fastest profile
+    @return the profile (dict with ssh_options, sftp_options, and the rates
+            measured in MB/s), or None if no session could be opened
+    """
+    if not HOST: return None
+
+    data = os.urandom(size)
+    mb = size / 2**20
+
+    print(f"Profiling the link with {HOST} ({mb:.0f} MB by test) ...")
+    secs = __time_ssh(HOST, [], data, verbose)
+    if secs is None:
+        stderr.write(f"linkprofile: no SSH session with {HOST}\n")
+        return None
+    default_rate = mb / secs
+    print(f"  {'(default options)':46s} {default_rate:8.1f} MB/s")
+
+    best, best_rate = [], default_rate
+    ssh_rates = {}
+    for cipher, mac in CIPHERS:
+        for compression in COMPRESSION:
+            options = __ssh_options(cipher, mac, compression)
+            secs = __time_ssh(HOST, options, data, verbose)
+            label = f"{cipher} compression={compression}"
+            if secs is None:
+                print(f"  {label:46s}   (not supported)")
+                continue
+            ssh_rates[label] = rate = mb / secs
+            print(f"  {label:46s} {rate:8.1f} MB/s")
+            if rate > best_rate:
+                best, best_rate = options, rate
+
+    sftp_best, sftp_rate = [], None
+    sftp_rates = {}
+    fd, path = tempfile.mkstemp(suffix = ".linkprofile")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    try:
+        for B in SFTP_BUFFERS:
+            for R in SFTP_REQUESTS:
+                options = ["-B", str(B), "-R", str(R)]
+                secs = __time_sftp(HOST, best + options, path, verbose)
+                if secs is None: continue
+                sftp_rates[f"-B {B} -R {R}"] = rate = mb / secs
+                print(f"  {'sftp -B %d -R %d' % (B, R):46s} {rate:8.1f} MB/s")
+                if sftp_rate is None or rate > sftp_rate:
+                    sftp_best, sftp_rate = options, rate
+    finally:
+        os.remove(path)
+
+    profile = {
+        "ssh_options": best,
+        "sftp_options": sftp_best,
+        "date": datetime.now().isoformat(sep = ' ', timespec = 'seconds'),
+        "default_rate": round(default_rate, 2),
+        "ssh_rates": {k: round(v, 2) for k, v in ssh_rates.items()},
+        "sftp_rates": {k: round(v, 2) for k, v in sftp_rates.items()},
+    }
+    __save(HOST, profile)
+    print("=> saved: ssh {:s} ({:.1f} MB/s), sftp {:s}".format(
+        " ".join(best) or "(defaults)", best_rate, " ".join(sftp_best) or "(defaults)"))
+    return profile
+
+if __name__ == "__main__":
+    if len(argv) < 2:
+        stderr.write(f"USAGE {argv[0]} HOST [MB]\n")
+        exit(1)
+    size = int(argv[2]) << 20 if len(argv) > 2 else SAMPLE_SIZE
+    exit(0 if profile_link(argv[1], size) else 1)
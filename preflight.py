@@ -0,0 +1,250 @@
+"""
+ * PREFLIGHT_PY
+ * Pre-flight check of the CSV files, prior to compression and transmission,
+ * so a truncated or malformed file is not discovered after a long TST run.
+ *
+ * Every file is read in batches of lines, and checked for:
+ *   - number of columns (every row as the first one),
+ *   - numeric cells, with no NaN or infinite values,
+ *   - time axis (first column) that never goes backwards.
+ * The files of a folder that the TST run would take as the same case (e.g.
+ * a/b.csv and a__b.csv) are rejected too.
+ * The batches are parsed with NumPy when available, or with plain Python.
+ *
+ * This product is protected under U.S. Copyright Law.
+ * Unauthorized reproduction is considered a criminal act.
+ * (C) 2018-2021 VDI Technologies, LLC. All rights reserved.
+"""
+
+__author__    = "Yoel Monsalve"
+__date__      = "October, 2026"
+__modified__  = ""
+__version__   = ""
+__copyright__ = "VDI Technologies, LLC"
+
+import os
+import sys
+from sys import stdin, stdout, stderr, argv, exit
+import math
+import warnings
+from datetime import datetime
+from scanner import scan
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+DELIMITER   = b','
+BATCH_BYTES = 1 << 23     # size hint of every batch of lines (8 MB)
+MAX_ERRORS  = 10          # errors reported by file
+
+REPORT = "preflight_report.txt"
+
+def __is_header(fields):
+    """True if some field of the first line is not a number"""
+    for x in fields:
+        try:
+            float(x)
+        except ValueError:
+            return True
+    return False
+
+def __parse_batch_py(rows):
+    """Parses the batch, cell by cell
+    @return (values by row, or None; index of the bad row, or None;
+             error message, or None)
+    """
+    values = []
+    for i, r in enumerate(rows):
+        try:
+            v = [float(x) for x in r.split(DELIMITER)]
+        except ValueError:
+            return (None, i, "non-numeric value")
+        if any(math.isnan(x) or math.isinf(x) for x in v):
+            return (None, i, "NaN or infinite value")
+        values.append(v)
+    return (values, None, None)
+
+def __check_batch_np(rows, ncols, last_time):
+    """Checks the batch as a whole, with NumPy
+    @return (last time, index of the bad row or None, error message)
+    """
+    # the C parser of NumPy stops (with a warning) at the first bad cell
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        try:
+            a = np.fromstring(DELIMITER.join(rows).decode('latin-1'), dtype=np.float64, sep=DELIMITER.decode())
+        except (ValueError, DeprecationWarning):
+            a = None
+    if a is None or a.size != len(rows) * ncols:
+        # a bad row, or a cell that only Python takes (e.g. 1_0): the batch
+        # is checked again, as a whole, by the plain Python path
+        return __check_batch_py(rows, ncols, last_time)
+    a = a.reshape(-1, ncols)
+
+    bad = ~np.isfinite(a).all(axis=1)
+    if bad.any():
+        return (last_time, int(np.argmax(bad)), "NaN or infinite value")
+
+    t = a[:, 0]
+    if last_time is not None:
+        t = np.concatenate(([last_time], t))
+    back = np.diff(t) < 0
+    if back.any():
+        i = int(np.argmax(back))
+        if last_time is None: i += 1
+        return (last_time, i, "time goes backwards")
+    return (float(t[-1]), None, None)
+
+def __check_batch_py(rows, ncols, last_time):
+    """Same as __check_batch_np(), with plain Python"""
+    values, i, msg = __parse_batch_py(rows)
+    if values is None:
+        return (last_time, i, msg)
+    for i, v in enumerate(values):
+        if last_time is not None and v[0] < last_time:
+            return (last_time, i, "time goes backwards")
+        last_time = v[0]
+    return (last_time, None, None)
+
+def scan_file(path, use_numpy = True):
+    """Checks a CSV file
+    @return list of errors, as strings (empty if the file is good)
+    """
+    check_batch = __check_batch_np if (use_numpy and np is not None) else __check_batch_py
+    errors = []
+
+    try:
+        f = open(path, "rb")
+    except OSError as e:
+        return [str(e)]
+
+    with f:
+        first = f.readline()
+        if not first.strip():
+            return ["empty file"]
+        fields = first.rstrip(b"\r\n").split(DELIMITER)
+        ncols = len(fields)
+        nline = 1         # lines already checked
+        last_time = None
+        pending = []
+        if not __is_header(fields):
+            nline = 0
+            pending.append(first)
+
+        while len(errors) < MAX_ERRORS:
+            new = f.readlines(BATCH_BYTES)
+            lines = pending + new
+            pending = []
+            if new:
+                # blank lines at the end of the batch: checked with the next
+                # one, unless the file ends there
+                k = len(lines)
+                while k and not lines[k - 1].strip(): k -= 1
+                lines, pending = lines[:k], lines[k:]
+                if not lines: continue
+            else:
+                # the end of the file (the last line may have no end of line,
+                # and is checked as any other)
+                lines = [l for l in lines if l.strip()]
+                if not lines: break
+
+            rows = [l.rstrip(b"\r\n") for l in lines]
+
+            # number of columns
+            counts = [r.count(DELIMITER) for r in rows]
+            bad = [i for i, c in enumerate(counts) if c != ncols - 1]
+            for i in bad[:MAX_ERRORS - len(errors)]:
+                errors.append(f"line {nline + i + 1}: {counts[i] + 1} columns, expected {ncols}")
+            if bad:
+                # no sense to check the values of the remaining rows
+                rows = rows[:bad[0]]
+
+            # values and time axis
+            if rows:
+                last_time, i, msg = check_batch(rows, ncols, last_time)
+                if i is not None:
+                    errors.append(f"line {nline + i + 1}: {msg}")
+            if bad: break
+            nline += len(lines)
+
+    return errors
+
+def case_name(filename = ''):
+    """Name of the case of a CSV file in the TST run (see run): its path
+    relative to the folder, with no extension, and '/' as '__'
+    (e.g. a/b.csv ==> a__b)
+    """
+    if filename.endswith(".csv"): filename = filename[:-len(".csv")]
+    return filename.replace('/', "__")
+
+def scan_folder(DIR = '', use_numpy = True, verbose = True, inventory = None):
+    """Checks all the CSV files of the folder DIR (or the given inventory, as
+    returned by scanner.scan())
+    @return dict {filename: list of errors} of the files that failed
+    """
+    if not DIR: return {}
+
+    if inventory is None:
+        inventory = scan(DIR)
+    bad = {}
+    # two files taken as the same case by the TST run would overwrite the
+    # results of each other: both are rejected
+    cases = {}
+    for entry in inventory:
+        cases.setdefault(case_name(entry.name), []).append(entry.name)
+    for case, names in cases.items():
+        if len(names) < 2: continue
+        for name in names:
+            bad[name] = [f"case name '{case}' also taken by " + ", ".join(n for n in names if n != name)]
+            if verbose: print(f"  pre-flight: {name} ... FAILED")
+    for entry in inventory:
+        if entry.name in bad: continue
+        errors = scan_file(entry.path, use_numpy)
+        if errors:
+            bad[entry.name] = errors
+            if verbose: print(f"  pre-flight: {entry.name} ... FAILED")
+    return bad
+
+def write_report(bad, path):
+    """Writes the report of the pre-flight check (see scan_folder())"""
+    with open(path, "w") as f:
+        f.write(f"Pre-flight check of the CSV files, {datetime.now()}\n")
+        f.write(f"{len(bad)} file(s) failed, and were excluded from the upload\n")
+        for filename in sorted(bad):
+            f.write(f"\n{filename}:\n")
+            for e in bad[filename]:
+                f.write(f"    {e}\n")
+
+def read_report(path):
+    """@return dict {filename: list of errors} of a report written by
+    write_report() (empty if it does not exist)
+    """
+    bad = {}
+    try:
+        with open(path) as f:
+            lines = f.read().split('\n')
+    except OSError:
+        return bad
+    name = None
+    # the header, and then every file as a line "name:" and its errors indented
+    for i, line in enumerate(lines):
+        if line.startswith("    ") and name is not None:
+            bad[name].append(line[4:])
+        elif line.endswith(':') and i > 0 and lines[i - 1] == "":
+            name = line[:-1]
+            bad[name] = []
+    return bad
+
+def test():
+    """Test code"""
+
+    DIR = "../work/2021S_2/csv/"
+    bad = scan_folder(DIR)
+    for filename in bad:
+        print(filename, bad[filename])
+
+if __name__ == "__main__":
+    from profiling import main_with_profile
+    main_with_profile("preflight", test)
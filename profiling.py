@@ -0,0 +1,101 @@
+"""
+ * PROFILING_PY
+ * Profiling mode of the client. Every action is run under cProfile and
+ * tracemalloc, and leaves in .tstclient/profiles/ two artifacts by run:
+ *
+ *   <timestamp>_<pid>_<action>.prof   the cProfile stats (for pstats,
+ *                                     snakeviz, ...), to compare the hot
+ *                                     spots across releases
+ *   <timestamp>_<pid>_<action>.txt    wall time, peak memory, top allocation
+ *                                     sites, and the time by function
+ *
+ * cProfile sees only the thread that runs the action: the time of the worker
+ * threads (e.g. of compress.parallel_gzip, or the compressor of
+ * transfer.stream_files) is in the wall time, and their allocations in the
+ * memory report, but not in the time by function.
+ *
+ * The modules run as scripts take --profile too (see main_with_profile()).
+ *
+ * This product is protected under U.S. Copyright Law.
+ * Unauthorized reproduction is considered a criminal act.
+ * (C) 2018-2021 VDI Technologies, LLC. All rights reserved.
+"""
+
+__author__    = "Yoel Monsalve"
+__date__      = "October, 2026"
+__modified__  = ""
+__version__   = ""
+__copyright__ = "VDI Technologies, LLC"
+
+import os
+import sys
+from sys import stdin, stdout, stderr, argv, exit
+import io
+import re         # regex
+import cProfile
+import pstats
+import tracemalloc
+from time import perf_counter
+from datetime import datetime
+from helpers import state_path, create_dir
+
+PROFILE_DIR  = "profiles"
+TOP_ALLOCS   = 15     # allocation sites in the report
+TOP_FUNCS    = 30     # functions in the report
+TRACE_FRAMES = 10     # frames kept by allocation
+
+def profile_call(name, func, *args, **kwargs):
+    """Runs func(*args, **kwargs) under cProfile and tracemalloc, and saves the
+    artifacts of the run (even if func raises)
+    @return what func returns
+    """
+    tracemalloc.start(TRACE_FRAMES)
+    pr = cProfile.Profile()
+    t1 = perf_counter()
+    try:
+        return pr.runcall(func, *args, **kwargs)
+    finally:
+        secs = perf_counter() - t1
+        current, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        save_profile(name, pr, secs, peak, snapshot)
+
+def main_with_profile(name, func, *args, **kwargs):
+    """Runs func(*args, **kwargs), under the profiler if --profile is in the
+    command line (it is removed from sys.argv first)
+    @return what func returns
+    """
+    if "--profile" not in argv[1:]:
+        return func(*args, **kwargs)
+    argv.remove("--profile")
+    return profile_call(name, func, *args, **kwargs)
+
+def save_profile(name, pr, secs, peak, snapshot):
+    """Writes the artifacts of a profiled run
+    @return base path of the artifacts (with no extension)
+    """
+    create_dir(state_path(PROFILE_DIR))
+    # the pid tells apart the runs of the same second
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S") + f"_{os.getpid()}"
+    base = state_path(os.path.join(PROFILE_DIR, stamp + "_" + re.sub(r"\W+", "_", name)))
+
+    pr.dump_stats(base + ".prof")
+
+    s = io.StringIO()
+    s.write(f"Action:      {name}\n")
+    s.write(f"Date:        {datetime.now()}\n")
+    s.write(f"Python:      {sys.version.split()[0]} ({sys.platform})\n")
+    s.write(f"Wall time:   {secs:.3f} s\n")
+    s.write(f"Peak memory: {peak / 2**20:.1f} MB (traced)\n")
+    s.write(f"\nTop {TOP_ALLOCS} allocation sites:\n")
+    for st in snapshot.statistics('lineno')[:TOP_ALLOCS]:
+        frame = st.traceback[0]
+        s.write(f"  {st.size / 2**10:10.1f} KB  {st.count:8d} blocks  {frame.filename}:{frame.lineno}\n")
+    s.write(f"\nTime by function (top {TOP_FUNCS}, by cumulative time):\n")
+    pstats.Stats(pr, stream = s).sort_stats("cumulative").print_stats(TOP_FUNCS)
+
+    with open(base + ".txt", "w") as f:
+        f.write(s.getvalue())
+    print(f"=> profile of '{name}': {base}.txt, peak memory {peak / 2**20:.1f} MB, {secs:.3f} s")
+    return base
@@ -0,0 +1,165 @@
+"""
+ * RATELIMIT_PY
+ * Bandwidth shaping of the transfers over the shared office link: a token
+ * bucket with a global cap (bytes/s), shared by all the transfers of the
+ * client, with priority classes:
+ *
+ *   INTERACTIVE   the downloads of results the user waits for
+ *   BULK          the uploads of the CSV files
+ *
+ * The transfers streamed by Python (stream_files, the ranges of a split
+ * upload, all of them bulk) take tokens for every block they write, in order
+ * of arrival. The ones run by sftp cannot be shaped block by block, so they
+ * get a rate limit (sftp -l) instead; an interactive one (the downloads, see
+ * transfer.sftp_batch) reserves its share of the cap (INTERACTIVE_SHARE) for
+ * its whole run, out of the bucket, so the bulk transfers get the rest
+ * meanwhile.
+ *
+ * The limit of an sftp is fixed when it starts: a reservation slows the
+ * Python writers, and the bulk sftp started while it lasts, but not a bulk
+ * sftp already running, which keeps its rate (the whole cap, if it started
+ * alone). Meanwhile, the total may exceed the cap, by up to the interactive
+ * share.
+ *
+ * The cap is saved in .tstclient/bandwidth.json (0, or no file: no cap).
+ *
+ * This product is protected under U.S. Copyright Law.
+ * Unauthorized reproduction is considered a criminal act.
+ * (C) 2018-2021 VDI Technologies, LLC. All rights reserved.
+"""
+
+__author__    = "Yoel Monsalve"
+__date__      = "October, 2026"
+__modified__  = ""
+__version__   = ""
+__copyright__ = "VDI Technologies, LLC"
+
+import os
+import sys
+from sys import stdin, stdout, stderr, argv, exit
+import json
+import itertools
+import threading
+from contextlib import contextmanager
+from time import monotonic
+from helpers import state_path
+
+BANDWIDTH = "bandwidth.json"
+
+# priority classes (see sftp_limit())
+INTERACTIVE = 0
+BULK        = 1
+
+INTERACTIVE_SHARE = 0.8       # of the cap, reserved by an interactive sftp
+QUANTUM           = 1 << 16   # bytes taken from the bucket at once (64 KB)
+BURST             = 0.25      # seconds of the rate the bucket holds
+
+class RateLimiter:
+    """Token bucket of rate bytes/s (0: no limit), whose waiters are served
+    in order of arrival
+    """
+    def __init__(self, rate = 0):
+        self.rate = rate
+        self.reserved = 0         # bytes/s taken by transfers out of the bucket
+        self.tokens = 0.0
+        self.stamp = monotonic()
+        self.tickets = itertools.count()
+        self.serving = 0          # the ticket whose turn it is
+        self.cond = threading.Condition()
+
+    def __refill(self):
+        now = monotonic()
+        rate = max(0.0, self.rate - self.reserved)
+        self.tokens = min(self.tokens + (now - self.stamp) * rate, max(QUANTUM, rate * BURST))
+        self.stamp = now
+        return rate
+
+    def set_rate(self, rate):
+        with self.cond:
+            self.__refill()
+            self.rate = rate
+            self.cond.notify_all()
+
+    def acquire(self, nbytes):
+        """Waits until nbytes may be sent (with no limit, at once). A block
+        larger than the bucket leaves it in debt, paid by the next ones.
+        """
+        if self.rate <= 0: return
+        with self.cond:
+            me = next(self.tickets)
+            while True:
+                rate = self.__refill()
+                if self.serving == me and self.tokens > 0:
+                    break
+                if self.rate <= 0:
+                    break
+                if self.serving == me and rate > 0:
+                    self.cond.wait((1 - self.tokens) / rate)
+                else:
+                    # not our turn, or all the rate reserved: wait to be notified
+                    self.cond.wait(1.0)
+            self.serving += 1
+            self.tokens -= nbytes
+            self.cond.notify_all()
+
+    def write(self, f, data):
+        """Writes data (bytes-like) to the file object f, by quanta taken
+        from the bucket
+        """
+        if self.rate <= 0:
+            f.write(data)
+            return
+        with memoryview(data) as view:
+            for i in range(0, len(view), QUANTUM):
+                block = view[i:i + QUANTUM]
+                self.acquire(len(block))
+                f.write(block)
+
+    @contextmanager
+    def reserve(self, rate):
+        """Takes rate bytes/s out of the bucket while in the block, for a
+        transfer shaped by other means (e.g. sftp -l)
+        """
+        with self.cond:
+            self.__refill()
+            self.reserved += rate
+        try:
+            yield
+        finally:
+            with self.cond:
+                self.__refill()
+                self.reserved -= rate
+                self.cond.notify_all()
+
+    def sftp_limit(self, priority = BULK):
+        """Rate (bytes/s) for a transfer run by sftp, or 0 for no limit: the
+        interactive share of the cap, or for a bulk one what is not reserved
+        """
+        if self.rate <= 0: return 0
+        if priority == INTERACTIVE: return self.rate * INTERACTIVE_SHARE
+        return max(self.rate - self.reserved, self.rate * (1 - INTERACTIVE_SHARE))
+
+def load_cap():
+    """@return the saved cap of the link (bytes/s), 0 if none"""
+    try:
+        with open(state_path(BANDWIDTH)) as f:
+            return max(0, int(json.load(f).get("cap", 0)))
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+def save_cap(cap = 0):
+    """Saves the cap of the link (bytes/s, 0 for none), and applies it"""
+    path = state_path(BANDWIDTH)
+    with open(path + ".part", "w") as f:
+        json.dump({"cap": int(cap)}, f)
+    os.replace(path + ".part", path)
+    LIMITER.set_rate(int(cap))
+
+def sftp_limit_args(priority = BULK):
+    """Arguments of sftp for its rate limit (-l, in Kbit/s), if any"""
+    rate = LIMITER.sftp_limit(priority)
+    if rate <= 0: return []
+    return ["-l", str(max(1, int(rate * 8 / 1000)))]
+
+# the limiter shared by all the transfers of the client
+LIMITER = RateLimiter(load_cap())
@@ -0,0 +1,221 @@
+"""
+ * RESULTS_DB_PY
+ * Local store of the results of the studies (SQLite), indexed by case,
+ * study and status, so questions across studies (e.g. which cases went
+ * unstable in the last five studies) are answered with no grep at all.
+ *
+ * The results are loaded after the download, incrementally: only the files
+ * changed since the last load are read again.
+ *
+ * Usage:
+ *   python results_db.py ingest local_working_folder [study]
+ *   python results_db.py query [--status S] [--last N] [--study S] [--case PATTERN]
+ *
+ * With --profile, the command is run under the profiler (see profiling.py).
+ *
+ * This product is protected under U.S. Copyright Law.
+ * Unauthorized reproduction is considered a criminal act.
+ * (C) 2018-2021 VDI Technologies, LLC. All rights reserved.
+"""
+
+__author__    = "Yoel Monsalve"
+__date__      = "October, 2026"
+__modified__  = ""
+__version__   = ""
+__copyright__ = "VDI Technologies, LLC"
+
+import os
+import sys
+from sys import stdin, stdout, stderr, argv, exit
+import csv
+import sqlite3
+import zipfile
+from datetime import datetime
+from helpers import state_path, CSVWriter
+import aggregate
+
+DB = "results.db"
+
+MASTER_FAILURE_REPORT = "Master-Failure-Report.csv"
+
+STABLE   = "stable"
+UNSTABLE = "unstable"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS studies (
+    study    TEXT PRIMARY KEY,
+    path     TEXT,
+    created  TEXT,
+    updated  TEXT
+);
+CREATE TABLE IF NOT EXISTS cases (
+    study    TEXT NOT NULL,
+    name     TEXT NOT NULL,
+    status   TEXT NOT NULL,
+    summary  TEXT,
+    report   TEXT,      -- where the report is: a file, or zip:member
+    PRIMARY KEY (study, name)
+);
+CREATE INDEX IF NOT EXISTS cases_by_name   ON cases (name);
+CREATE INDEX IF NOT EXISTS cases_by_status ON cases (status, study);
+CREATE TABLE IF NOT EXISTS sources (
+    study    TEXT NOT NULL,
+    path     TEXT NOT NULL,
+    size     INTEGER,
+    mtime    REAL,
+    PRIMARY KEY (study, path)
+);
+"""
+
+def connect(path = ""):
+    """Opens (creating it if needed) the results store"""
+    db = sqlite3.connect(path or state_path(DB))
+    db.executescript(SCHEMA)
+    return db
+
+def __changed(db, study, path):
+    """True if the file changed since it was loaded into the study (and
+    records it as loaded)
+    """
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return False
+    row = db.execute("SELECT size, mtime FROM sources WHERE study = ? AND path = ?",
+        (study, path)).fetchone()
+    if row and row[0] == st.st_size and row[1] == st.st_mtime:
+        return False
+    db.execute("INSERT OR REPLACE INTO sources VALUES (?, ?, ?, ?)",
+        (study, path, st.st_size, st.st_mtime))
+    return True
+
+def __upsert(db, study, name, summary = None, report = None):
+    db.execute("""INSERT INTO cases (study, name, status, summary, report) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (study, name) DO UPDATE SET
+            summary = COALESCE(excluded.summary, summary),
+            report  = COALESCE(excluded.report, report)""",
+        (study, name, STABLE, summary, report))
+
+def __failed_cases(path):
+    """Names of the cases listed in the master failure report (first column,
+    as a case name or as the path of its CSV file)
+    """
+    names = set()
+    with open(path, newline = '') as f:
+        for row in csv.reader(f):
+            if not row: continue
+            name = os.path.basename(row[0].strip())
+            names.add(os.path.splitext(name)[0])
+    return names
+
+def ingest(local_wd = "", study = "", db = None):
+    """Loads the results of a local working folder (as downloaded) into the
+    store. Only the files changed since the last load are read.
+    @return number of cases (re)loaded
+    """
+    if not local_wd: return 0
+    if not study: study = os.path.basename(os.path.normpath(local_wd))
+    own = db is None
+    if own: db = connect()
+
+    now = datetime.now().isoformat(sep = ' ', timespec = 'seconds')
+    db.execute("INSERT OR IGNORE INTO studies VALUES (?, ?, ?, ?)", (study, os.path.abspath(local_wd), now, now))
+    loaded = set()    # a case may be both in the aggregate and loose
+
+    # aggregated summaries (see aggregate.py)
+    path = os.path.join(local_wd, aggregate.SUMMARIES)
+    if os.path.isfile(os.path.join(local_wd, aggregate.INDEX)) and __changed(db, study, path):
+        index = aggregate.read_index(os.path.join(local_wd, aggregate.INDEX))
+        for case in index:
+            summary = aggregate.read_summary(local_wd, case, index)
+            __upsert(db, study, case, summary = summary.decode('utf-8', 'replace'))
+            loaded.add(case)
+
+    # loose summaries
+    d = os.path.join(local_wd, aggregate.SUMMARY_DIR)
+    if os.path.isdir(d):
+        for e in os.scandir(d):
+            if e.name.endswith(".summary") and __changed(db, study, e.path):
+                with open(e.path, errors = 'replace') as f:
+                    __upsert(db, study, e.name[:-len(".summary")], summary = f.read())
+                loaded.add(e.name[:-len(".summary")])
+
+    # reports: only where they are
+    path = os.path.join(local_wd, aggregate.REPORTS)
+    if os.path.isfile(path) and __changed(db, study, path):
+        with zipfile.ZipFile(path) as z:
+            for member in z.namelist():
+                __upsert(db, study, member[:-len(".report")], report = "zip:" + member)
+    d = os.path.join(local_wd, aggregate.REPORT_DIR)
+    if os.path.isdir(d):
+        for e in os.scandir(d):
+            if e.name.endswith(".report") and __changed(db, study, e.path):
+                __upsert(db, study, e.name[:-len(".report")], report = e.path)
+
+    # status, by the master failure report
+    path = os.path.join(local_wd, MASTER_FAILURE_REPORT)
+    if os.path.isfile(path) and (__changed(db, study, path) or loaded):
+        failed = __failed_cases(path)
+        db.execute("UPDATE cases SET status = ? WHERE study = ?", (STABLE, study))
+        db.executemany("UPDATE cases SET status = ? WHERE study = ? AND name = ?",
+            [(UNSTABLE, study, name) for name in failed])
+
+    db.execute("UPDATE studies SET updated = ? WHERE study = ?", (now, study))
+    db.commit()
+    if own: db.close()
+    return len(loaded)
+
+def query(status = "", last = 0, study = "", case = "", db = None):
+    """Cases of the store, by status, study, and case name (SQL LIKE pattern,
+    e.g. 'P1-1-%'), in the last N studies loaded (all, if last is 0)
+    @return list of tuples (study, case, status)
+    """
+    own = db is None
+    if own: db = connect()
+
+    sql  = "SELECT c.study, c.name, c.status FROM cases c WHERE 1 = 1"
+    args = []
+    if status:
+        sql += " AND c.status = ?"
+        args.append(status)
+    if study:
+        sql += " AND c.study = ?"
+        args.append(study)
+    if case:
+        sql += " AND c.name LIKE ?"
+        args.append(case)
+    if last > 0:
+        sql += " AND c.study IN (SELECT study FROM studies ORDER BY created DESC, rowid DESC LIMIT ?)"
+        args.append(last)
+    sql += " ORDER BY c.study, c.name"
+    rows = db.execute(sql, args).fetchall()
+
+    if own: db.close()
+    return rows
+
+def main(args):
+    if len(args) >= 1 and args[0] == "ingest" and len(args) >= 2:
+        n = ingest(args[1], args[2] if len(args) > 2 else "")
+        print(f"{n} case(s) loaded")
+        return 0
+
+    if len(args) >= 1 and args[0] == "query":
+        opts = {"--status": "", "--last": "0", "--study": "", "--case": ""}
+        i = 1
+        while i + 1 < len(args) and args[i] in opts:
+            opts[args[i]] = args[i + 1]
+            i += 2
+        rows = query(opts["--status"], int(opts["--last"]), opts["--study"], opts["--case"])
+        with CSVWriter(stdout) as w:
+            w.write_rows([["study", "case", "status"]])
+            w.write_rows(rows)
+        return 0
+
+    stderr.write(f"USAGE {argv[0]} ingest local_working_folder [study]\n")
+    stderr.write(f"      {argv[0]} query [--status S] [--last N] [--study S] [--case PATTERN]\n")
+    return 1
+
+if __name__ == "__main__":
+    from profiling import main_with_profile
+    command = [a for a in argv[1:] if a != "--profile"][:1]
+    exit(main_with_profile(" ".join(["results_db"] + command), lambda: main(argv[1:])))
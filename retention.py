@@ -0,0 +1,306 @@
+"""
+ * RETENTION_PY
+ * Retention of the old working folders in the remote host. It walks the
+ * folders under work/ and applies the policies, in parallel:
+ *
+ *   inputs   the CSV files of the finished studies (a .tst_done marker, see
+ *            run, older than INPUT_AGE days) are compressed back to .csv.gz.
+ *            A new run takes them with --stream, or after a decompression.
+ *            The ones linked from the store are left: they are kept once.
+ *   plots    the plots/ of the finished studies, with no file newer than
+ *            PLOTS_AGE days, are archived into one plots-YYYYMMDD.tar.gz
+ *   caches   leftovers (*.part files, .stream folders) older than CACHE_AGE
+ *            days, the files of the store (see the script cas) no longer
+ *            linked by any working folder, older than STORE_AGE days or
+ *            beyond STORE_MAX bytes (the least recently linked ones first),
+ *            and the jobs of the queue (see jobq) finished JOBS_AGE days ago
+ *
+ * The folders of a queued or running job are never touched (the queue is
+ * read again before every file or folder is acted on). The result
+ * (bytes reclaimed, by policy) is left in .retention.json, in the home of
+ * the remote user. In a dry run, the bytes are an estimate: the inputs by
+ * CSV_RATIO, and the plots as an upper bound (the size of their archive is
+ * not known). It is meant to run in the background, with low I/O and
+ * CPU priority, as started by ssh_methods.clean_server().
+ *
+ * Usage (in the remote host):
+ *   python3 retention.py [--work DIR] [--dry-run]
+ *
+ * This product is protected under U.S. Copyright Law.
+ * Unauthorized reproduction is considered a criminal act.
+ * (C) 2018-2021 VDI Technologies, LLC. All rights reserved.
+"""
+
+__author__    = "Yoel Monsalve"
+__date__      = "October, 2026"
+__modified__  = ""
+__version__   = ""
+__copyright__ = "VDI Technologies, LLC"
+
+import os
+import sys
+from sys import stdin, stdout, stderr, argv, exit
+import json
+import time
+import gzip
+import shutil
+import tarfile
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+WORK        = "work"
+REPORT      = ".retention.json"
+DONE_MARKER = ".tst_done"                             # see run
+CAS_DIR     = os.environ.get("CAS_DIR", os.path.expanduser("~/.cas"))
+JOBQ_DIR    = os.environ.get("JOBQ_DIR", os.path.expanduser("~/.jobq"))
+
+DAY        = 86400
+INPUT_AGE  = 7
+PLOTS_AGE  = 30
+CACHE_AGE  = 1
+STORE_AGE  = 30
+STORE_MAX  = 50 << 30      # 50 GB
+JOBS_AGE   = 30
+
+# compressed size of a CSV file, for the estimate of a dry run (as the
+# default of the client, see history.DEFAULT_RATIO)
+CSV_RATIO   = 0.3
+
+COPY_BUFFER = 1 << 20
+# half of the CPUs: this is background work
+WORKERS     = max(1, (os.cpu_count() or 1) // 2)
+
+class Report:
+    """Bytes reclaimed and files handled, by policy (updated by the workers)"""
+    def __init__(self, dry_run = False):
+        self.dry_run = dry_run
+        self.lock = threading.Lock()
+        self.reclaimed = {"inputs": 0, "plots": 0, "caches": 0}
+        self.files = {"inputs": 0, "plots": 0, "caches": 0}
+        self.errors = []
+
+    def add(self, policy, nbytes, nfiles = 1):
+        with self.lock:
+            self.reclaimed[policy] += nbytes
+            self.files[policy] += nfiles
+
+    def error(self, path, e):
+        with self.lock:
+            self.errors.append(f"{path}: {type(e).__name__}: {e}")
+        stderr.write(f"retention: {path}: {e}\n")
+
+def __freed(st):
+    # a file with other hard links (e.g. in the store) frees nothing
+    return st.st_size if st.st_nlink == 1 else 0
+
+def __busy_workspaces():
+    """Absolute paths of the working folders of the queued and running jobs"""
+    busy = set()
+    jobs = os.path.join(JOBQ_DIR, "jobs")
+    for job in os.listdir(jobs) if os.path.isdir(jobs) else ():
+        try:
+            with open(os.path.join(jobs, job, "state")) as f:
+                if f.read().strip() not in ("queued", "running"): continue
+            with open(os.path.join(jobs, job, "cwd")) as f:
+                cwd = f.read().strip()
+            with open(os.path.join(jobs, job, "wd")) as f:
+                busy.add(os.path.realpath(os.path.join(cwd, f.read().strip())))
+        except OSError:
+            continue
+    return busy
+
+def __finished_since(wd):
+    """mtime of the done marker of the working folder, or None if no run has
+    finished there (or one is running)
+    """
+    try:
+        return os.stat(os.path.join(wd, DONE_MARKER)).st_mtime
+    except OSError:
+        return None
+
+def __gzip_file(path, report):
+    st = os.stat(path)
+    if st.st_nlink > 1: return
+    if report.dry_run:
+        report.add("inputs", int(__freed(st) * (1 - CSV_RATIO)))
+        return
+    with open(path, "rb") as fi, gzip.open(path + ".gz.part", "wb", compresslevel = 6) as fo:
+        shutil.copyfileobj(fi, fo, COPY_BUFFER)
+    shutil.copystat(path, path + ".gz.part")
+    os.replace(path + ".gz.part", path + ".gz")
+    os.remove(path)
+    report.add("inputs", __freed(st) - os.path.getsize(path + ".gz"))
+
+def compress_inputs(wd, report, pool, now = None):
+    """Compresses back the CSV inputs of a finished study (in the pool)
+    @return list of futures
+    """
+    done = __finished_since(wd)
+    now = now or time.time()
+    if done is None or now - done < INPUT_AGE * DAY: return []
+    futures = []
+    for d, dirs, files in os.walk(os.path.join(wd, "csv")):
+        for name in files:
+            if name.endswith(".csv"):
+                futures.append(pool.submit(__guard, __gzip_file, os.path.join(d, name), report, wd))
+    return futures
+
+def archive_plots(wd, report, now = None):
+    """Archives the plots of a finished study into one tar.gz, and removes
+    them (the folders are kept, see ssh_methods.WORKSPACE_LAYOUT)
+    """
+    now = now or time.time()
+    if __finished_since(wd) is None: return
+    plots = os.path.join(wd, "plots")
+    files = [os.path.join(d, name) for d, dirs, names in os.walk(plots) for name in names]
+    if not files: return
+    stats = [os.stat(p) for p in files]
+    if now - max(st.st_mtime for st in stats) < PLOTS_AGE * DAY: return
+
+    freed = sum(__freed(st) for st in stats)
+    if report.dry_run:
+        report.add("plots", freed, len(files))
+        return
+    archive = os.path.join(wd, "plots-" + datetime.now().strftime("%Y%m%d") + ".tar.gz")
+    with tarfile.open(archive + ".part", "w:gz") as tar:
+        for p in files:
+            tar.add(p, os.path.relpath(p, wd))
+    os.replace(archive + ".part", archive)
+    for p in files:
+        os.remove(p)
+    report.add("plots", freed - os.path.getsize(archive), len(files))
+
+def __remove(path, policy, report):
+    if os.path.isdir(path) and not os.path.islink(path):
+        files = [os.path.join(d, n) for d, dirs, names in os.walk(path) for n in names]
+        freed = sum(__freed(os.lstat(p)) for p in files)
+        if not report.dry_run: shutil.rmtree(path)
+        report.add(policy, freed, len(files))
+    else:
+        freed = __freed(os.lstat(path))
+        if not report.dry_run: os.remove(path)
+        report.add(policy, freed)
+
+def clean_leftovers(wd, report, now = None):
+    """Removes the partial files (*.part) and stream folders of a working
+    folder, older than CACHE_AGE days
+    """
+    now = now or time.time()
+    for d, dirs, files in os.walk(wd):
+        for name in dirs + files:
+            if name.endswith(".part") or name == ".stream":
+                p = os.path.join(d, name)
+                if now - os.lstat(p).st_mtime >= CACHE_AGE * DAY:
+                    __remove(p, "caches", report)
+                    if name in dirs: dirs.remove(name)
+
+def clean_store(store, report, now = None):
+    """Removes the files of the store linked by no working folder, older than
+    STORE_AGE days, and then the least recently linked ones (by ctime, which
+    every new hard link updates) while the store is beyond STORE_MAX bytes
+    """
+    now = now or time.time()
+    entries = []
+    for d, dirs, files in os.walk(store):
+        for name in files:
+            p = os.path.join(d, name)
+            entries.append((p, os.lstat(p)))
+    total = sum(st.st_size for p, st in entries)
+    for p, st in sorted(entries, key = lambda e: e[1].st_ctime):
+        if st.st_nlink > 1: continue
+        if now - st.st_ctime < STORE_AGE * DAY and total <= STORE_MAX: break
+        __remove(p, "caches", report)
+        total -= st.st_size
+
+def clean_jobs(jobq, report, now = None):
+    """Removes the jobs of the queue finished JOBS_AGE days ago (their logs).
+    A job cancelled while queued has no finish time: its submission is taken.
+    """
+    now = now or time.time()
+    jobs = os.path.join(jobq, "jobs")
+    for job in sorted(os.listdir(jobs)) if os.path.isdir(jobs) else ():
+        try:
+            with open(os.path.join(jobs, job, "state")) as f:
+                state = f.read().strip()
+            stamp = "finished"
+            if state == "cancelled" and not os.path.isfile(os.path.join(jobs, job, "finished")):
+                stamp = "submitted"
+            with open(os.path.join(jobs, job, stamp)) as f:
+                finished = int(f.read().strip())
+        except (OSError, ValueError):
+            continue
+        if now - finished >= JOBS_AGE * DAY:
+            __remove(os.path.join(jobs, job), "caches", report)
+
+def __guard(func, path, report, wd = None):
+    # a job may have been queued on the working folder wd since the start:
+    # the queue is read again just before acting on it
+    if wd is not None and os.path.realpath(wd) in __busy_workspaces(): return
+    # a policy failing on a file (or folder) does not stop the others
+    try:
+        func(path, report)
+    except OSError as e:
+        report.error(path, e)
+
+def __save(report, state, started):
+    r = {
+        "state": state,
+        "pid": os.getpid(),
+        "dry_run": report.dry_run,
+        "started": started,
+        "finished": datetime.now().isoformat(sep = ' ', timespec = 'seconds') if state != "running" else "",
+        "reclaimed": report.reclaimed,
+        "files": report.files,
+        "errors": report.errors,
+    }
+    with open(REPORT + ".part", "w") as f:
+        json.dump(r, f, indent = 2)
+    os.replace(REPORT + ".part", REPORT)
+
+def retention(work = WORK, dry_run = False):
+    """Applies the policies to the working folders under work, and to the
+    store and queue
+    @return the Report
+    """
+    report = Report(dry_run)
+    started = datetime.now().isoformat(sep = ' ', timespec = 'seconds')
+    __save(report, "running", started)
+
+    busy = __busy_workspaces()
+    workspaces = [os.path.join(work, name) for name in sorted(os.listdir(work))
+        if os.path.isdir(os.path.join(work, name)) and os.path.realpath(os.path.join(work, name)) not in busy]
+
+    with ThreadPoolExecutor(WORKERS) as pool:
+        futures = []
+        for wd in workspaces:
+            futures += compress_inputs(wd, report, pool)
+            futures.append(pool.submit(__guard, archive_plots, wd, report, wd))
+            futures.append(pool.submit(__guard, clean_leftovers, wd, report, wd))
+        for f in futures:
+            f.result()
+    # after the inputs, so the store files they released are taken too
+    __guard(clean_store, CAS_DIR, report)
+    __guard(clean_jobs, JOBQ_DIR, report)
+
+    __save(report, "done", started)
+    return report
+
+if __name__ == "__main__":
+    args = argv[1:]
+    work = WORK
+    if "--work" in args:
+        i = args.index("--work")
+        if i + 1 >= len(args):
+            stderr.write(f"USAGE {argv[0]} [--work DIR] [--dry-run]\n")
+            exit(1)
+        work = args[i + 1]
+    dry_run = "--dry-run" in args
+    if not os.path.isdir(work):
+        stderr.write(f"retention: no such directory '{work}'\n")
+        exit(2)
+    report = retention(work, dry_run)
+    total = sum(report.reclaimed.values())
+    print("retention: {:s}{:.1f} MB reclaimed ({:s}), {:d} error(s)".format(
+        "(dry run, estimated) " if dry_run else "", total / 2**20,
+        ", ".join(f"{k} {v / 2**20:.1f} MB" for k, v in report.reclaimed.items()), len(report.errors)))
@@ -0,0 +1,99 @@
+"""
+ * SCANNER_PY
+ * Scanning of the local folders. The folder is enumerated once, with
+ * os.scandir() and a single stat by file, into an inventory of the files
+ * (path, size, mtime) that every stage (pre-flight, compression, hashing,
+ * transfer) takes, instead of listing and stat-ing the folder again.
+ *
+ * This product is protected under U.S. Copyright Law.
+ * Unauthorized reproduction is considered a criminal act.
+ * (C) 2018-2021 VDI Technologies, LLC. All rights reserved.
+"""
+
+__author__    = "Yoel Monsalve"
+__date__      = "October, 2026"
+__modified__  = ""
+__version__   = ""
+__copyright__ = "VDI Technologies, LLC"
+
+import os
+import sys
+from sys import stdin, stdout, stderr, argv, exit
+import stat
+import re         # regex
+import fnmatch
+from collections import namedtuple
+
+# name: the path relative to the scanned folder, with '/' as separator
+FileEntry = namedtuple("FileEntry", ["path", "name", "size", "mtime", "mode"])
+
+CSV_PATTERNS = ("*.csv",)
+
+# folders never entered in a recursive scan (e.g. the output of compress_files)
+SKIP_DIRS = (".tmp",)
+
+def compile_patterns(patterns = ()):
+    """Compiles a list of glob patterns (e.g. '*.csv', 'old/*') into a single
+    regex, or None if the list is empty
+    """
+    if not patterns: return None
+    return re.compile("|".join(fnmatch.translate(p) for p in patterns))
+
+def scan(DIR = '', include = CSV_PATTERNS, exclude = (), recursive = False):
+    """Enumerates the regular files of the folder DIR, and of its subfolders
+    if recursive is True
+    @param include: glob patterns of the files to take (over the relative name)
+    @param exclude: glob patterns of the files to leave out
+    @return list of FileEntry, sorted by name
+    """
+    if not DIR: return []
+
+    inc = compile_patterns(include)
+    exc = compile_patterns(exclude)
+
+    files = []
+    # (st_dev, st_ino) of the folders walked: a symbolic link may loop back
+    visited = set()
+    try:
+        st = os.stat(DIR)
+        visited.add((st.st_dev, st.st_ino))
+    except OSError:
+        pass
+    stack = [(DIR, "")]
+    while stack:
+        path, prefix = stack.pop()
+        try:
+            it = os.scandir(path)
+        except OSError as e:
+            stderr.write(f"scan: {e}\n")
+            continue
+        with it:
+            for e in it:
+                name = prefix + e.name
+                if e.is_dir():
+                    # the type comes with the directory entry; a stat only
+                    # for the folders to walk
+                    if recursive and e.name not in SKIP_DIRS:
+                        try:
+                            st = e.stat()
+                        except OSError:
+                            continue
+                        if (st.st_dev, st.st_ino) in visited: continue
+                        visited.add((st.st_dev, st.st_ino))
+                        stack.append((e.path, name + '/'))
+                    continue
+                if inc is not None and not inc.match(name): continue
+                if exc is not None and exc.match(name): continue
+                try:
+                    st = e.stat()
+                except OSError:
+                    continue      # vanished meanwhile
+                if not stat.S_ISREG(st.st_mode): continue
+                files.append(FileEntry(e.path, name, st.st_size, st.st_mtime, st.st_mode))
+
+    files.sort(key = lambda f: f.name)
+    return files
+
+def total_size(inventory):
+    """Total bytes of the files of an inventory"""
+    return sum(f.size for f in inventory)
@@ -1,404 +1,756 @@
-"""
- * TRANSFER_PY
- * Utility to transfer the content of the gzip-ed files
- * into the folder csv/.tmp to the remote host
- *
- * This product is protected under U.S. Copyright Law.
- * Unauthorized reproduction is considered a criminal act.
- * (C) 2018-2021 VDI Technologies, LLC. All rights reserved. 
-"""
-
-__author__    = "Yoel Monsalve"
-__date__      = "July, 2019"
-__modified__  = "July, 2021"
-__version__   = ""
-__copyright__ = "VDI Technologies, LLC"
-
-"""C snippet to handle signals
-
-include <signal.h>
-
-void sigpipe_handler(int unused)
-{
-}
-
-int main(void)
-{
-  sigaction(SIGPIPE, &(struct sigaction){sigpipe_handler}, NULL);
-
-  ...
-"""
-
-"""snippet to create a new Windows console
-https://stackoverflow.com/questions/6469655/how-can-i-spawn-new-shells-to-run-python-scripts-from-a-base-python-script
-
-(option 1) 
-import os
-os.system("start cmd /K dir") #/K remains the window, /C executes and dies (popup)
-
-(option 2) 
-subprocess.popen([sys.executable, 'script.py'], creationflags = subprocess.CREATE_NEW_CONSOLE)
-"""
-
-import os
-import sys
-from sys import stdin, stdout, stderr, argv
-import subprocess
-from time import sleep
-import signal
-import re         # regex
-import shlex      # quote
-from helpers import is_win, is_posix
-
-stdin_fileno  = stdin.fileno()
-stdout_fileno = stdout.fileno()
-stderr_fileno = stderr.fileno()
-
-def sigpipe_handler(signum, frame):
-	"""Custom handler to SIGPIPE: ignore
-	This happens when the child ends and closes the pipe, and
-	the signal is delivered to the parent
-	"""
-	print(f"[{os.getpid()}] W: Received SIGPIPE. Event ignored.")
-
-
-def decompress_files(HOST = "", path = "", verbose = False):
-	if not HOST: return
-	if not path: return
-	
-	# define SIGPIPE handler (UNIX)
-	if is_posix():
-		signal.signal(signal.SIGPIPE, sigpipe_handler)
-
-	# In Windows, we use the more suitable method subprocess, instead of the low-level
-	# methods fork() + spawn()
-	p    = None
-	pipe = None     # PIPE to talk with the child process (= subprocess.STDIN)
-	if verbose:
-		if is_win():
-			p = subprocess.Popen(["ssh", "-v", "-i", ".ssh/id_rsa", 
-				"tst@" + HOST], 
-				stdin=subprocess.PIPE
-				#, stdout=sys.stdout, stderr=subprocess.STDOUT
-				, creationflags = subprocess.CREATE_NEW_CONSOLE
-				, close_fds=True
-				)
-		else:
-			p = subprocess.Popen(["ssh", "-v", "-i", ".ssh/id_rsa", 
-				"tst@" + HOST], 
-				stdin=subprocess.PIPE
-				#, stdout=sys.stdout, stderr=subprocess.STDOUT
-				, close_fds=True
-				)
-	else:
-		if is_win():
-			cmd = "ssh -i .ssh/id_rsa tst@" + HOST
-			cmd = "cmd /C " + "\"" + cmd + "\""
-			p = subprocess.Popen(cmd
-				, stdin=subprocess.PIPE
-				#, stdout=sys.stdout, stderr=subprocess.STDOUT
-				, creationflags=subprocess.CREATE_NEW_CONSOLE
-				, close_fds=True
-				)
-		else:
-			p = subprocess.Popen(["ssh", "-i", ".ssh/id_rsa", 
-				"tst@" + HOST], 
-				stdin=subprocess.PIPE
-				#, stdout=sys.stdout, stderr=subprocess.STDOUT
-				, close_fds=True
-				)
-	
-	if not p: return
-
-	# The parent: send commands to child
-	pipe = p.stdin
-	# set permissions
-	s = "chmod 640 \"{:s}\"/*.csv.gz 2> /dev/null;\n".format(path)
-	print(s)
-	pipe.write(s.encode('utf-8'))
-	# decompress
-	s  = "echo decompressing ...; "
-	s += "ls \"{:s}\"/*.csv.gz 2> /dev/null && (ls \"{:s}\"/*.csv.gz | xargs gzip -df)\n".format(path, path)
-	print(s)
-	pipe.write(s.encode('utf-8'))
-	# list content
-	s = "echo \"Done. Content of {:s}:\" && ls -l {:s}\n".format(path, path)
-	print(s)
-	pipe.write(s.encode('utf-8'));
-
-	# close & exit
-	#pipe.write("exit".encode('utf-8'))
-	pipe.write("echo -e -n \"\\nTask done. Close this windows to terminate ...\"\n".encode('utf-8'))
-	pipe.write("while true; do sleep 30; done".encode('utf-8'))
-	pipe.close()
-
-	return p
-
-def inspect_working_directory(HOST = "", path = "", verbose = False):
-	if not HOST: return
-	if not path: return
-	
-	# define SIGPIPE handler (UNIX)
-	if is_posix():
-		signal.signal(signal.SIGPIPE, sigpipe_handler)
-
-	# In Windows, we use the more suitable method subprocess, instead of the low-level
-	# methods fork() + spawn()
-	p    = None
-	pipe = None     # PIPE to talk with the child process (= subprocess.STDIN)
-	if verbose:
-		if is_win():
-			p = subprocess.Popen(["ssh", "-v", "-i", ".ssh/id_rsa", 
-				"tst@" + HOST], 
-				stdin=subprocess.PIPE
-				#, stdout=sys.stdout, stderr=subprocess.STDOUT
-				, creationflags = subprocess.CREATE_NEW_CONSOLE
-				, close_fds=True
-				)
-		else:
-			p = subprocess.Popen(["ssh", "-v", "-i", ".ssh/id_rsa", 
-				"tst@" + HOST], 
-				stdin=subprocess.PIPE
-				#, stdout=sys.stdout, stderr=subprocess.STDOUT
-				, close_fds=True
-				)
-	else:
-		if is_win():
-			cmd = "ssh -i .ssh/id_rsa tst@" + HOST
-			cmd = "cmd /C " + "\"" + cmd + "\""
-			p = subprocess.Popen(cmd
-				, stdin=subprocess.PIPE
-				#, stdout=sys.stdout, stderr=subprocess.STDOUT
-				, creationflags=subprocess.CREATE_NEW_CONSOLE
-				, close_fds=True
-				)
-		else:
-			p = subprocess.Popen(["ssh", "-i", ".ssh/id_rsa", 
-				"tst@" + HOST], 
-				stdin=subprocess.PIPE
-				#, stdout=sys.stdout, stderr=subprocess.STDOUT
-				, close_fds=True
-				)
-	
-	if not p: return
-
-	pipe = p.stdin
-	# set permissions
-	# s = "tree -d {:s} \n".format(path)
-	s = "tree {:s} \n".format(path) # Yoel Monsalve 07/16/2021
-	pipe.write(s.encode('utf-8'))
-	
-	# close & exit
-	#pipe.write("exit".encode('utf-8'))
-	pipe.write("echo -e -n \"\\nTask done. Will close automatically in 10 secs ...\"\n".encode('utf-8'))
-	pipe.write("sleep 10\n".encode('utf-8'))
-	pipe.close()
-
-	return
-
-def create_directory(HOST = "", new_path = "", mode = 0o750, create_structure = False, verbose = False):
-	
-	if not HOST: return
-	if not new_path: return
-	
-	# define SIGPIPE handler (UNIX)
-	if is_posix():
-		signal.signal(signal.SIGPIPE, sigpipe_handler)
-
-	# In Windows, we use the more suitable method subprocess, instead of the low-level
-	# methods fork() + spawn()
-	p    = None
-	pipe = None     # PIPE to talk with the child process (= subprocess.STDIN)
-	if verbose:
-		if is_win():
-			p = subprocess.Popen(["ssh", "-v", "-i", ".ssh/id_rsa", 
-				"tst@" + HOST], 
-				stdin=subprocess.PIPE
-				#, stdout=sys.stdout, stderr=subprocess.STDOUT
-				, creationflags = subprocess.CREATE_NEW_CONSOLE
-				, close_fds=True
-				)
-		else:
-			p = subprocess.Popen(["ssh", "-v", "-i", ".ssh/id_rsa", 
-				"tst@" + HOST], 
-				stdin=subprocess.PIPE
-				#, stdout=sys.stdout, stderr=subprocess.STDOUT
-				, close_fds=True
-				)
-	else:
-		if is_win():
-			cmd = "ssh -i .ssh/id_rsa tst@" + HOST
-			cmd = "cmd /C " + "\"" + cmd + "\""
-			p = subprocess.Popen(cmd
-				, stdin=subprocess.PIPE
-				#, stdout=sys.stdout, stderr=subprocess.STDOUT
-				, creationflags=subprocess.CREATE_NEW_CONSOLE
-				, close_fds=True
-				)
-		else:
-			p = subprocess.Popen(["ssh", "-i", ".ssh/id_rsa", 
-				"tst@" + HOST], 
-				stdin=subprocess.PIPE
-				#, stdout=sys.stdout, stderr=subprocess.STDOUT
-				, close_fds=True
-				)
-	
-	if not p: return
-
-	# The parent: send commands to child
-	print("SSH connection started, please wait ...")
-	
-	pipe = p.stdin
-
-	pipe.write(f"echo \"Current content:\" && ls -l .\n".encode('utf-8'));
-
-	# creating remote directory
-	pipe.write(f"mkdir -p \"{new_path}\" && echo created '{new_path}' ... success.\n".encode('utf-8'))
-	
-	# setting mode/perms
-	s = "chmod {:o} \"{:s}\" && echo mode changed to {:o} ... success.\n".format(
-		mode, new_path, mode)
-	pipe.write(s.encode('utf-8'))
-
-	if create_structure:
-		# creating directory structure
-		s  = "echo \"Creating directory structure ...\"; "
-		pipe.write(s.encode('utf-8'))
-		# --> /csv
-		s = "echo -n \"--> creating {:s}/csv ... \"; ".format(new_path)
-		s += "mkdir -p \"{:s}/csv\"; ".format(new_path)
-		s += "chmod 750 \"{:s}/csv\"; ".format(new_path)
-		s += "(test $? -eq 0 && echo success );"
-		pipe.write(s.encode('utf-8'))
-		# --> output
-		s = "echo -n \"--> creating {:s}/output/ ... \"; ".format(new_path)
-		s += "mkdir -p \"{:s}/output\"; ".format(new_path)
-		s += "chmod 750 \"{:s}/output\"; ".format(new_path)
-		s += "(test $? -eq 0 && echo success );"
-		pipe.write(s.encode('utf-8'))
-		# --> /output/report
-		s = "echo -n \"--> creating {:s}/output/report ... \"; ".format(new_path)
-		s += "mkdir -p \"{:s}/output/report\"; ".format(new_path)
-		s += "chmod 750 \"{:s}/output/report\"; ".format(new_path)
-		s += "(test $? -eq 0 && echo success );"
-		pipe.write(s.encode('utf-8'))
-		# --> /output/summary
-		s = "echo -n \"--> creating {:s}/output/summary ... \"; ".format(new_path)
-		s += "mkdir -p \"{:s}/output/summary\"; ".format(new_path)
-		s += "chmod 750 \"{:s}/output/summary\"; ".format(new_path)
-		s += "(test $? -eq 0 && echo success );"
-		pipe.write(s.encode('utf-8'))
-
-		# --> plots
-		s = "echo -n \"--> creating {:s}/plots/ ... \"; ".format(new_path)
-		s += "mkdir -p \"{:s}/plots\"; ".format(new_path)
-		s += "chmod 750 \"{:s}/plots\"; ".format(new_path)
-		s += "(test $? -eq 0 && echo success );"
-		pipe.write(s.encode('utf-8'))
-		# --> /plots/angle
-		s = "echo -n \"--> creating {:s}/plots/angle ... \"; ".format(new_path)
-		s += "mkdir -p \"{:s}/plots/angle\"; ".format(new_path)
-		s += "chmod 750 \"{:s}/plots/angle\"; ".format(new_path)
-		s += "(test $? -eq 0 && echo success );"
-		pipe.write(s.encode('utf-8'))
-		# --> /plots/volt
-		s = "echo -n \"--> creating {:s}/plots/volt ... \"; ".format(new_path)
-		s += "mkdir -p \"{:s}/plots/volt\"; ".format(new_path)
-		s += "chmod 750 \"{:s}/plots/volt\"; ".format(new_path)
-		s += "(test $? -eq 0 && echo success );"
-		pipe.write(s.encode('utf-8'))
-		# --> /plots/unstable
-		s = "echo -n \"--> creating {:s}/plots/unstable ... \"; ".format(new_path)
-		s += "mkdir -p \"{:s}/plots/unstable\"; ".format(new_path)
-		s += "chmod 750 \"{:s}/plots/unstable\"; ".format(new_path)
-		s += "(test $? -eq 0 && echo success );"
-		pipe.write(s.encode('utf-8'))
-
-		#s  = "echo \"Directory structure is:\"; "
-		#s += "tree -d {:s}".format(new_path)
-		#print(s)
-		#pipe.write(s.encode('utf-8'))
-
-	# close & exit
-	#pipe.write("exit".encode('utf-8'))
-	pipe.write("echo -e -n \"\\nTask done. Close this windows to terminate ...\"\n".encode('utf-8'))
-	pipe.write("while true; do sleep 30; done".encode('utf-8'))
-	pipe.close()
-
-def run_app(HOST = "", working_dir = "", verbose = False):
-	if not HOST: return
-	if not working_dir: return
-	
-	# define SIGPIPE handler (UNIX)
-	if is_posix():
-		signal.signal(signal.SIGPIPE, sigpipe_handler)
-
-	# In Windows, we use the more suitable method subprocess, instead of the low-level
-	# methods fork() + spawn()
-	p    = None
-	pipe = None     # PIPE to talk with the child process (= subprocess.STDIN)
-	if verbose:
-		if is_win():
-			p = subprocess.Popen(["ssh", "-v", "-i", ".ssh/id_rsa", 
-				"tst@" + HOST], 
-				stdin=subprocess.PIPE
-				#, stdout=sys.stdout, stderr=subprocess.STDOUT
-				, creationflags = subprocess.CREATE_NEW_CONSOLE
-				, close_fds=True
-				)
-		else:
-			p = subprocess.Popen(["ssh", "-v", "-i", ".ssh/id_rsa", 
-				"tst@" + HOST], 
-				stdin=subprocess.PIPE
-				#, stdout=sys.stdout, stderr=subprocess.STDOUT
-				, close_fds=True
-				)
-	else:
-		if is_win():
-			cmd = "ssh -i .ssh/id_rsa tst@" + HOST
-			cmd = "cmd /C " + "\"" + cmd + "\""
-			p = subprocess.Popen(cmd
-				, stdin=subprocess.PIPE
-				#, stdout=sys.stdout, stderr=subprocess.STDOUT
-				, creationflags=subprocess.CREATE_NEW_CONSOLE
-				, close_fds=True
-				)
-		else:
-			p = subprocess.Popen(["ssh", "-i", ".ssh/id_rsa", 
-				"tst@" + HOST], 
-				stdin=subprocess.PIPE
-				#, stdout=sys.stdout, stderr=subprocess.STDOUT
-				, close_fds=True
-				)
-	
-	if not p: return
-
-	pipe = p.stdin
-	# set permissions
-	s = "./run {:s} \n".format(working_dir)
-	pipe.write(s.encode('utf-8'))
-	
-	# close & exit
-	#pipe.write("exit".encode('utf-8'))
-	#pipe.write("echo -e -n \"\\nTask done. Will close automatically in 10 secs ...\"\n".encode('utf-8'))
-	#pipe.write("sleep 10\n".encode('utf-8'))
-	pipe.write("echo -e -n \"\\nTask done. Close this windows to terminate ...\"\n".encode('utf-8'))
-	pipe.write("while true; do sleep 30; done".encode('utf-8'))
-	pipe.close()
-
-	return
-	
-def test():
-	"""Test code"""
-	
-	HOST = "54.38.79.195"
-	new_dir = "2021S_2"
-	#p =create_directory(HOST, new_dir, 0o750, create_structure = True)
-	#p = decompress_files(HOST, new_dir + '/csv')
-	#p = inspect_working_directory(HOST, new_dir)
-	p = run_app(HOST, new_dir)
-	exit(0)
-	
-if __name__ == "__main__":
-	test()
-	
+"""
+ * TRANSFER_PY
+ * Utility to transfer the content of the gzip-ed files
+ * into the folder csv/.tmp to the remote host
+ *
+ * This product is protected under U.S. Copyright Law.
+ * Unauthorized reproduction is considered a criminal act.
+ * (C) 2018-2021 VDI Technologies, LLC. All rights reserved. 
+"""
+
+__author__    = "Yoel Monsalve"
+__date__      = "July, 2019"
+__modified__  = "July, 2021"
+__version__   = ""
+__copyright__ = "VDI Technologies, LLC"
+
+"""C snippet to handle signals
+
+include <signal.h>
+
+void sigpipe_handler(int unused)
+{
+}
+
+int main(void)
+{
+  sigaction(SIGPIPE, &(struct sigaction){sigpipe_handler}, NULL);
+
+  ...
+"""
+
+"""snippet to create a new Windows console
+https://stackoverflow.com/questions/6469655/how-can-i-spawn-new-shells-to-run-python-scripts-from-a-base-python-script
+
+(option 1) 
+import os
+os.system("start cmd /K dir") #/K remains the window, /C executes and dies (popup)
+
+(option 2) 
+subprocess.popen([sys.executable, 'script.py'], creationflags = subprocess.CREATE_NEW_CONSOLE)
+"""
+
+import os
+import sys
+from sys import stdin, stdout, stderr, argv
+import subprocess
+from time import sleep
+import signal
+import re         # regex
+import shlex      # quote
+import json
+from datetime import datetime
+from helpers import is_win, is_posix, ssh_args
+
+stdin_fileno  = stdin.fileno()
+stdout_fileno = stdout.fileno()
+stderr_fileno = stderr.fileno()
+
+def sigpipe_handler(signum, frame):
+	"""Custom handler to SIGPIPE: ignore
+	This happens when the child ends and closes the pipe, and
+	the signal is delivered to the parent
+	"""
+	print(f"[{os.getpid()}] W: Received SIGPIPE. Event ignored.")
+
+
+# Manifest of hashes uploaded with the files (see compress.MANIFEST), and the
+# list of files that failed its verification, in the remote folder
+MANIFEST      = "MANIFEST.b2"
+VERIFY_FAILED = ".verify_failed"
+
+def verify_command(path = ""):
+	"""Shell command to verify (in parallel, with b2sum -c) the files of the
+	remote folder against the manifest. The names of the files that failed
+	are printed, and left in VERIFY_FAILED. The files of the manifest not in
+	the folder (e.g. not uploaded) are not a failure: they are listed apart.
+	"""
+	parts = ".manifest."
+	s  = "(cd \"{:s}\" && if test -f {:s}; then echo verifying ...; ".format(path, MANIFEST)
+	s += "rm -f {:s}*; split -n l/$(nproc) {:s} {:s}; ".format(parts, MANIFEST, parts)
+	s += "ls {:s}* | xargs -P $(nproc) -n 1 b2sum -c --quiet --ignore-missing 2> /dev/null ".format(parts)
+	s += "| sed -n 's/: FAILED.*$//p' > {:s}; ".format(VERIFY_FAILED)
+	s += "rm -f {:s}*; ".format(parts)
+	s += "cut -d ' ' -f 3- {:s} | while IFS= read -r f; do test -e \"$f\" || echo \"$f\"; done > .verify_missing; ".format(MANIFEST)
+	s += "if test -s .verify_missing; then echo \"not in the folder ($(wc -l < .verify_missing) file(s)):\"; cat .verify_missing; fi; rm -f .verify_missing; "
+	s += "if test -s {:s}; then echo MISMATCH:; cat {:s}; else echo all files verified; fi; fi)".format(VERIFY_FAILED, VERIFY_FAILED)
+	return s
+
+def verify_report(HOST = "", path = "", verbose = False):
+	"""Result of the last verification of the remote folder (see decompress_files())
+	@return list of the files that do not match the manifest, or None if the
+	        folder was not verified
+	"""
+	if not HOST: return
+	if not path: return
+
+	out = ssh_exec(HOST, "cat \"{:s}/{:s}\" 2> /dev/null || echo '?'".format(path, VERIFY_FAILED), verbose = verbose)
+	if out is None or out.strip() == '?': return None
+	return [l for l in out.split('\n') if l]
+
+def decompress_files(HOST = "", path = "", verbose = False, agent = None):
+	if not HOST: return
+	if not path: return
+	
+	# the remote side of the columnar format, and of the dictionary mode
+	upload_script(HOST, "columnar.py", verbose = verbose)
+	upload_script(HOST, "zdict.py", verbose = verbose)
+	
+	if agent is not None:
+		# through the remote agent (see agent.py): the same steps, as one request
+		print("decompressing ...")
+		r = agent.call("decompress", path = path)
+		if r is None: return None
+		print(f"Done. {r['files']} file(s) decompressed in {path}")
+		if r.get("missing"):
+			print(f"not in the folder ({len(r['missing'])} file(s)):")
+			for f in r["missing"]: print(f"  {f}")
+		if r["failed"]:
+			print("MISMATCH:")
+			for f in r["failed"]: print(f"  {f}")
+		elif r["verified"]:
+			print("all files verified")
+		return r
+	
+	# define SIGPIPE handler (UNIX)
+	if is_posix():
+		signal.signal(signal.SIGPIPE, sigpipe_handler)
+
+	# In Windows, we use the more suitable method subprocess, instead of the low-level
+	# methods fork() + spawn()
+	p    = None
+	pipe = None     # PIPE to talk with the child process (= subprocess.STDIN)
+	if verbose:
+		if is_win():
+			p = subprocess.Popen(ssh_args(HOST, True), 
+				stdin=subprocess.PIPE
+				#, stdout=sys.stdout, stderr=subprocess.STDOUT
+				, creationflags = subprocess.CREATE_NEW_CONSOLE
+				, close_fds=True
+				)
+		else:
+			p = subprocess.Popen(ssh_args(HOST, True), 
+				stdin=subprocess.PIPE
+				#, stdout=sys.stdout, stderr=subprocess.STDOUT
+				, close_fds=True
+				)
+	else:
+		if is_win():
+			cmd = " ".join(ssh_args(HOST))
+			cmd = "cmd /C " + "\"" + cmd + "\""
+			p = subprocess.Popen(cmd
+				, stdin=subprocess.PIPE
+				#, stdout=sys.stdout, stderr=subprocess.STDOUT
+				, creationflags=subprocess.CREATE_NEW_CONSOLE
+				, close_fds=True
+				)
+		else:
+			p = subprocess.Popen(ssh_args(HOST), 
+				stdin=subprocess.PIPE
+				#, stdout=sys.stdout, stderr=subprocess.STDOUT
+				, close_fds=True
+				)
+	
+	if not p: return
+
+	# The parent: send commands to child
+	pipe = p.stdin
+	# set permissions
+	# (the files may be in subfolders, see scanner.scan())
+	s = "find \"{:s}\" -name '*.gz' -exec chmod 640 {{}} + 2> /dev/null;\n".format(path)
+	print(s)
+	pipe.write(s.encode('utf-8'))
+	# decompress
+	s  = "echo decompressing ...; "
+	s += "find \"{:s}\" -name '*.csv.gz' -print0 | xargs -0 -r gzip -df\n".format(path)
+	print(s)
+	pipe.write(s.encode('utf-8'))
+	# rebuild the CSV files sent in the columnar format
+	s  = "find \"{:s}\" -name '*.csv.col.gz' -print0 | xargs -0 -r gzip -df && "
+	s += "find \"{:s}\" -name '*.csv.col' -print0 | xargs -0 -r python3 columnar.py -d\n".format(path, path)
+	print(s)
+	pipe.write(s.encode('utf-8'))
+	# decode the CSV files compressed against the dictionary
+	s  = "test -f \"{0:s}/DICT.zdict\" && find \"{0:s}\" -name '*.csv.zd' -print0 | ".format(path)
+	s += "xargs -0 -r python3 zdict.py -d \"{:s}/DICT.zdict\"\n".format(path)
+	print(s)
+	pipe.write(s.encode('utf-8'))
+	# verify the files against the hashes taken while compressing
+	s = verify_command(path) + "\n"
+	print(s)
+	pipe.write(s.encode('utf-8'))
+	# add the new files to the content-addressed store (see the script cas)
+	s = "test -f cas && bash cas ingest \"{:s}\"\n".format(path)
+	print(s)
+	pipe.write(s.encode('utf-8'))
+	# list content
+	s = "echo \"Done. Content of {:s}:\" && ls -l {:s}\n".format(path, path)
+	print(s)
+	pipe.write(s.encode('utf-8'));
+
+	# close & exit
+	#pipe.write("exit".encode('utf-8'))
+	pipe.write("echo -e -n \"\\nTask done. Close this windows to terminate ...\"\n".encode('utf-8'))
+	pipe.write("while true; do sleep 30; done".encode('utf-8'))
+	pipe.close()
+
+	return p
+
+def inspect_working_directory(HOST = "", path = "", verbose = False, agent = None):
+	if not HOST: return
+	if not path: return
+	
+	if agent is not None:
+		# through the remote agent (see agent.py), as a tree
+		entries = agent.call("list", path = path, recursive = True)
+		if entries is None: return None
+		print(path)
+		for e in sorted(entries, key = lambda e: e["name"].split('/')):
+			depth = e["name"].count('/')
+			name = os.path.basename(e["name"]) + ('/' if e["type"] == "dir" else "")
+			print("    " * (depth + 1) + name)
+		return entries
+	
+	# define SIGPIPE handler (UNIX)
+	if is_posix():
+		signal.signal(signal.SIGPIPE, sigpipe_handler)
+
+	# In Windows, we use the more suitable method subprocess, instead of the low-level
+	# methods fork() + spawn()
+	p    = None
+	pipe = None     # PIPE to talk with the child process (= subprocess.STDIN)
+	if verbose:
+		if is_win():
+			p = subprocess.Popen(ssh_args(HOST, True), 
+				stdin=subprocess.PIPE
+				#, stdout=sys.stdout, stderr=subprocess.STDOUT
+				, creationflags = subprocess.CREATE_NEW_CONSOLE
+				, close_fds=True
+				)
+		else:
+			p = subprocess.Popen(ssh_args(HOST, True), 
+				stdin=subprocess.PIPE
+				#, stdout=sys.stdout, stderr=subprocess.STDOUT
+				, close_fds=True
+				)
+	else:
+		if is_win():
+			cmd = " ".join(ssh_args(HOST))
+			cmd = "cmd /C " + "\"" + cmd + "\""
+			p = subprocess.Popen(cmd
+				, stdin=subprocess.PIPE
+				#, stdout=sys.stdout, stderr=subprocess.STDOUT
+				, creationflags=subprocess.CREATE_NEW_CONSOLE
+				, close_fds=True
+				)
+		else:
+			p = subprocess.Popen(ssh_args(HOST), 
+				stdin=subprocess.PIPE
+				#, stdout=sys.stdout, stderr=subprocess.STDOUT
+				, close_fds=True
+				)
+	
+	if not p: return
+
+	pipe = p.stdin
+	# set permissions
+	# s = "tree -d {:s} \n".format(path)
+	s = "tree {:s} \n".format(path) # Yoel Monsalve 07/16/2021
+	pipe.write(s.encode('utf-8'))
+	
+	# close & exit
+	#pipe.write("exit".encode('utf-8'))
+	pipe.write("echo -e -n \"\\nTask done. Will close automatically in 10 secs ...\"\n".encode('utf-8'))
+	pipe.write("sleep 10\n".encode('utf-8'))
+	pipe.close()
+
+	return
+
+# Layout of a working directory: subfolders and their modes
+WORKSPACE_LAYOUT = (
+	("csv",            0o750),
+	("output",         0o750),
+	("output/report",  0o750),
+	("output/summary", 0o750),
+	("plots",          0o750),
+	("plots/angle",    0o750),
+	("plots/volt",     0o750),
+	("plots/unstable", 0o750),
+)
+
+def provision_workspaces(HOST = "", paths = (), layout = WORKSPACE_LAYOUT, mode = 0o750, verbose = False,
+	agent = None):
+	"""Creates many working folders at once, every one with the subfolders of
+	the layout, in a single request to the remote agent (see agent.py)
+	@return list of dicts {"path", "ok", "created", "error"}, one by folder,
+	        or None if the request failed
+	"""
+	if not HOST: return
+	if not paths: return []
+	
+	own = agent is None
+	if own: agent = RemoteAgent(HOST, verbose)
+	results = agent.call("provision", paths = list(paths), layout = [list(e) for e in layout], mode = mode)
+	if own: agent.close()
+	return results
+
+def create_directory(HOST = "", new_path = "", mode = 0o750, create_structure = False, verbose = False,
+	agent = None):
+	
+	if not HOST: return
+	if not new_path: return
+	
+	if agent is not None:
+		# through the remote agent (see agent.py)
+		r = provision_workspaces(HOST, [new_path], WORKSPACE_LAYOUT if create_structure else (), mode,
+			agent = agent)
+		if not r: return False
+		r = r[0]
+		if not r["ok"]:
+			print(f"??? {new_path}: {r['error']}")
+			return False
+		print(f"created '{new_path}' with mode {mode:o} ... success.")
+		for d in r["created"]:
+			if d != ".": print(f"--> created {new_path}/{d}")
+		return True
+	
+	# define SIGPIPE handler (UNIX)
+	if is_posix():
+		signal.signal(signal.SIGPIPE, sigpipe_handler)
+
+	# In Windows, we use the more suitable method subprocess, instead of the low-level
+	# methods fork() + spawn()
+	p    = None
+	pipe = None     # PIPE to talk with the child process (= subprocess.STDIN)
+	if verbose:
+		if is_win():
+			p = subprocess.Popen(ssh_args(HOST, True), 
+				stdin=subprocess.PIPE
+				#, stdout=sys.stdout, stderr=subprocess.STDOUT
+				, creationflags = subprocess.CREATE_NEW_CONSOLE
+				, close_fds=True
+				)
+		else:
+			p = subprocess.Popen(ssh_args(HOST, True), 
+				stdin=subprocess.PIPE
+				#, stdout=sys.stdout, stderr=subprocess.STDOUT
+				, close_fds=True
+				)
+	else:
+		if is_win():
+			cmd = " ".join(ssh_args(HOST))
+			cmd = "cmd /C " + "\"" + cmd + "\""
+			p = subprocess.Popen(cmd
+				, stdin=subprocess.PIPE
+				#, stdout=sys.stdout, stderr=subprocess.STDOUT
+				, creationflags=subprocess.CREATE_NEW_CONSOLE
+				, close_fds=True
+				)
+		else:
+			p = subprocess.Popen(ssh_args(HOST), 
+				stdin=subprocess.PIPE
+				#, stdout=sys.stdout, stderr=subprocess.STDOUT
+				, close_fds=True
+				)
+	
+	if not p: return
+
+	# The parent: send commands to child
+	print("SSH connection started, please wait ...")
+	
+	pipe = p.stdin
+
+	pipe.write(f"echo \"Current content:\" && ls -l .\n".encode('utf-8'));
+
+	# creating remote directory
+	pipe.write(f"mkdir -p \"{new_path}\" && echo created '{new_path}' ... success.\n".encode('utf-8'))
+	
+	# setting mode/perms
+	s = "chmod {:o} \"{:s}\" && echo mode changed to {:o} ... success.\n".format(
+		mode, new_path, mode)
+	pipe.write(s.encode('utf-8'))
+
+	if create_structure:
+		# creating directory structure
+		s  = "echo \"Creating directory structure ...\"; "
+		pipe.write(s.encode('utf-8'))
+		for d, m in WORKSPACE_LAYOUT:
+			s = "echo -n \"--> creating {:s}/{:s} ... \"; ".format(new_path, d)
+			s += "mkdir -p \"{:s}/{:s}\"; ".format(new_path, d)
+			s += "chmod {:o} \"{:s}/{:s}\"; ".format(m, new_path, d)
+			s += "(test $? -eq 0 && echo success );"
+			pipe.write(s.encode('utf-8'))
+
+		#s  = "echo \"Directory structure is:\"; "
+		#s += "tree -d {:s}".format(new_path)
+		#print(s)
+		#pipe.write(s.encode('utf-8'))
+
+	# close & exit
+	#pipe.write("exit".encode('utf-8'))
+	pipe.write("echo -e -n \"\\nTask done. Close this windows to terminate ...\"\n".encode('utf-8'))
+	pipe.write("while true; do sleep 30; done".encode('utf-8'))
+	pipe.close()
+
+def run_app(HOST = "", working_dir = "", verbose = False):
+	if not HOST: return
+	if not working_dir: return
+	
+	# define SIGPIPE handler (UNIX)
+	if is_posix():
+		signal.signal(signal.SIGPIPE, sigpipe_handler)
+
+	# In Windows, we use the more suitable method subprocess, instead of the low-level
+	# methods fork() + spawn()
+	p    = None
+	pipe = None     # PIPE to talk with the child process (= subprocess.STDIN)
+	if verbose:
+		if is_win():
+			p = subprocess.Popen(ssh_args(HOST, True), 
+				stdin=subprocess.PIPE
+				#, stdout=sys.stdout, stderr=subprocess.STDOUT
+				, creationflags = subprocess.CREATE_NEW_CONSOLE
+				, close_fds=True
+				)
+		else:
+			p = subprocess.Popen(ssh_args(HOST, True), 
+				stdin=subprocess.PIPE
+				#, stdout=sys.stdout, stderr=subprocess.STDOUT
+				, close_fds=True
+				)
+	else:
+		if is_win():
+			cmd = " ".join(ssh_args(HOST))
+			cmd = "cmd /C " + "\"" + cmd + "\""
+			p = subprocess.Popen(cmd
+				, stdin=subprocess.PIPE
+				#, stdout=sys.stdout, stderr=subprocess.STDOUT
+				, creationflags=subprocess.CREATE_NEW_CONSOLE
+				, close_fds=True
+				)
+		else:
+			p = subprocess.Popen(ssh_args(HOST), 
+				stdin=subprocess.PIPE
+				#, stdout=sys.stdout, stderr=subprocess.STDOUT
+				, close_fds=True
+				)
+	
+	if not p: return
+
+	pipe = p.stdin
+	# set permissions
+	s = "./run {:s} \n".format(working_dir)
+	pipe.write(s.encode('utf-8'))
+	
+	# close & exit
+	#pipe.write("exit".encode('utf-8'))
+	#pipe.write("echo -e -n \"\\nTask done. Will close automatically in 10 secs ...\"\n".encode('utf-8'))
+	#pipe.write("sleep 10\n".encode('utf-8'))
+	pipe.write("echo -e -n \"\\nTask done. Close this windows to terminate ...\"\n".encode('utf-8'))
+	pipe.write("while true; do sleep 30; done".encode('utf-8'))
+	pipe.close()
+
+	return
+	
+def ssh_exec(HOST = "", cmd = "", data = None, verbose = False):
+	"""Runs a single command in the remote host, with no console, and
+	returns its output (stdout) as a string, or None if it failed.
+	@param data: optional bytes sent to the stdin of the remote command
+	"""
+	if not HOST: return
+	if not cmd: return
+
+	try:
+		r = subprocess.run(ssh_args(HOST, verbose) + [cmd]
+			, input=data
+			, stdout=subprocess.PIPE
+			, stderr=subprocess.PIPE
+			)
+	except OSError as e:
+		stderr.write(f"ssh_exec: {e}\n")
+		return None
+
+	if r.returncode != 0:
+		stderr.write(f"ssh_exec: '{cmd}' failed: {r.stderr.decode('utf-8', 'replace')}\n")
+		return None
+	return r.stdout.decode('utf-8', 'replace')
+
+def upload_script(HOST = "", local_path = "", remote_path = "", verbose = False, executable = False):
+	"""Copies a script (e.g. a Python module run in the remote host) to the
+	home of the remote user, or to remote_path if given
+	@param executable: if True, the copy is made executable
+	@return True if success, False otherwise
+	"""
+	if not HOST: return
+	if not local_path: return
+	if not remote_path: remote_path = os.path.basename(local_path)
+
+	# the scripts live next to this module
+	if not os.path.isabs(local_path):
+		local_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), local_path)
+	with open(local_path, "rb") as f:
+		data = f.read()
+	# into a new file, renamed over the old one: a shell script being run
+	# (e.g. jobq, by its workers) is read while it runs, and must not change
+	part = shlex.quote(remote_path + ".part")
+	cmd = "cat > {:s} && {:s}mv -f {:s} {:s}".format(part,
+		"chmod +x {:s} && ".format(part) if executable else "", part, shlex.quote(remote_path))
+	out = ssh_exec(HOST, cmd, data = data, verbose = verbose)
+	return out is not None
+
+# Queue of TST runs in the remote host (see the script jobq)
+JOBQ = "./jobq"
+
+def submit_job(HOST = "", working_dir = "", options = "", verbose = False):
+	"""Submits a run of the TST over the working directory to the remote
+	queue. The run is detached from the SSH session, so this returns at once.
+	@return the job id, or None on failure
+	"""
+	if not HOST: return
+	if not working_dir: return
+
+	# the queue, and the run it starts
+	for script in (JOBQ, "./run"):
+		if not upload_script(HOST, os.path.basename(script), verbose = verbose, executable = True):
+			stderr.write(f"submit_job: could not install '{script}' in the remote host\n")
+			return None
+	# the aggregation of the results, run after the TST
+	upload_script(HOST, "aggregate.py", verbose = verbose)
+	if "--stream" in options.split():
+		# the decoders of the inputs, fed to the TST as they are (see run)
+		upload_script(HOST, "columnar.py", verbose = verbose)
+		upload_script(HOST, "zdict.py", verbose = verbose)
+	cmd = "{:s} submit {:s} {:s}".format(JOBQ, shlex.quote(working_dir), options)
+	out = ssh_exec(HOST, cmd, verbose = verbose)
+	if not out: return None
+	return out.strip()
+
+def job_status(HOST = "", job_id = "", verbose = False):
+	"""Status of one job (or all of them, if job_id is empty)
+	@return list of dicts with keys: id, state, working_dir, submitted,
+	        started, finished (times are datetime, or None), cases and bytes
+	        of the inputs (int, or None if not known yet)
+	"""
+	if not HOST: return
+
+	cmd = "{:s} status {:s}".format(JOBQ, shlex.quote(job_id) if job_id else "")
+	out = ssh_exec(HOST, cmd, verbose = verbose)
+	if out is None: return None
+
+	jobs = []
+	for line in out.splitlines():
+		fields = line.split('\t')
+		if len(fields) < 6: continue
+		times = [datetime.fromtimestamp(int(t)) if t else None for t in fields[3:6]]
+		sizes = [int(n) if n.strip().isdigit() else None for n in (fields[6:8] + ["", ""])[:2]]
+		jobs.append({
+			"id": fields[0],
+			"state": fields[1],
+			"working_dir": fields[2],
+			"submitted": times[0],
+			"started": times[1],
+			"finished": times[2],
+			"cases": sizes[0],
+			"bytes": sizes[1],
+		})
+	return jobs
+
+def job_slots(HOST = "", verbose = False):
+	"""@return number of jobs the queue runs at the same time, or None"""
+	if not HOST: return
+
+	out = ssh_exec(HOST, "{:s} slots".format(JOBQ), verbose = verbose)
+	try:
+		return int(out)
+	except (TypeError, ValueError):
+		return None
+
+def job_progress(HOST = "", job_id = "", verbose = False):
+	"""@return tuple (cases done, total cases) of the job, or None"""
+	if not HOST: return
+	if not job_id: return
+
+	out = ssh_exec(HOST, "{:s} progress {:s}".format(JOBQ, shlex.quote(job_id)), verbose = verbose)
+	try:
+		done, total = out.split()
+		return (int(done), int(total))
+	except (AttributeError, ValueError):
+		return None
+
+def job_tail(HOST = "", job_id = "", lines = 20, verbose = False):
+	"""@return the last lines of the log of the job, as a string"""
+	if not HOST: return
+	if not job_id: return
+
+	return ssh_exec(HOST, "{:s} tail {:s} {:d}".format(JOBQ, shlex.quote(job_id), lines), verbose = verbose)
+
+def job_cancel(HOST = "", job_id = "", verbose = False):
+	"""Cancels a queued or running job
+	@return True if success, False otherwise
+	"""
+	if not HOST: return
+	if not job_id: return
+
+	out = ssh_exec(HOST, "{:s} cancel {:s}".format(JOBQ, shlex.quote(job_id)), verbose = verbose)
+	return out is not None
+
+# Retention of the old working folders (see retention.py)
+RETENTION        = "retention.py"
+RETENTION_REPORT = ".retention.json"
+RETENTION_LOG    = ".retention.log"
+
+def retention_report(HOST = "", verbose = False):
+	"""Report of the last (or the current) retention in the remote host
+	@return dict with keys: state ('running', 'done', or 'killed' if it died
+	        running), started, finished, dry_run, reclaimed and files (by
+	        policy), errors; {} if there was none, or None on failure
+	"""
+	if not HOST: return
+
+	out = ssh_exec(HOST, "cat {:s} 2> /dev/null; true".format(RETENTION_REPORT), verbose = verbose)
+	if out is None: return None
+	if not out.strip(): return {}
+	try:
+		report = json.loads(out)
+	except ValueError:
+		return {}
+	if report.get("state") == "running":
+		alive = ssh_exec(HOST, "kill -0 {:d} 2> /dev/null && echo alive; true".format(report["pid"]), verbose = verbose)
+		if alive is not None and not alive.strip():
+			report["state"] = "killed"
+	return report
+
+def clean_server(HOST = "", work = "work", dry_run = False, verbose = False):
+	"""Starts the retention of the working folders under work (see retention.py)
+	in the background, detached from the SSH session, with the lowest I/O
+	(idle class, where ionice is available) and CPU priority. Its result is
+	read later with retention_report().
+	@return True if started, False if another one is running (or on failure)
+	"""
+	if not HOST: return
+
+	report = retention_report(HOST, verbose)
+	if report is None: return False
+	if report.get("state") == "running":
+		stderr.write("clean_server: a retention is already running (since {:s})\n".format(report.get("started", "")))
+		return False
+
+	if not upload_script(HOST, RETENTION, verbose = verbose): return False
+	cmd = ("IONICE=$(command -v ionice > /dev/null && echo 'ionice -c 3'); "
+		"setsid nohup $IONICE nice -n 19 python3 {:s} --work {:s}{:s} > {:s} 2>&1 < /dev/null &").format(
+		RETENTION, shlex.quote(work), " --dry-run" if dry_run else "", RETENTION_LOG)
+	return ssh_exec(HOST, cmd, verbose = verbose) is not None
+
+# Persistent agent in the remote host (see agent.py). Its source goes through
+# the SSH channel, preceded by its length, and then the same channel carries
+# the requests and the responses.
+AGENT = "agent.py"
+AGENT_BOOTSTRAP = "python3 -u -c 'import sys; n = int(sys.stdin.buffer.readline()); exec(sys.stdin.buffer.read(n))'"
+
+class RemoteAgent:
+	"""Client of the remote agent. It is started on the first call, and kept
+	open for the next ones (one round trip by operation):
+	
+		agent = RemoteAgent(HOST)
+		entries = agent.call("list", path = "work/2021S_2", recursive = True)
+		agent.close()
+	
+	call() returns the result of the operation, or None if it failed (the
+	error is written to stderr, and kept in self.error).
+	"""
+	def __init__(self, HOST = "", verbose = False):
+		self.HOST    = HOST
+		self.verbose = verbose
+		self.p       = None
+		self.next_id = 0
+		self.error   = ""
+
+	def start(self):
+		"""Starts the agent, if not running
+		@return True if success, False otherwise
+		"""
+		if self.p is not None and self.p.poll() is None: return True
+		if not self.HOST: return False
+
+		with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), AGENT), "rb") as f:
+			source = f.read()
+		try:
+			self.p = subprocess.Popen(ssh_args(self.HOST, self.verbose) + [AGENT_BOOTSTRAP]
+				, stdin=subprocess.PIPE
+				, stdout=subprocess.PIPE
+				)
+			self.p.stdin.write(b"%d\n" % len(source) + source)
+			self.p.stdin.flush()
+		except OSError as e:
+			stderr.write(f"agent: {e}\n")
+			self.p = None
+			return False
+		return True
+
+	def call(self, op, **args):
+		"""Runs an operation of the agent (see agent.OPS), with its arguments
+		@return the result, or None if failed
+		"""
+		if not self.start(): return None
+		self.next_id += 1
+		req = json.dumps({"id": self.next_id, "op": op, "args": args}) + '\n'
+		try:
+			self.p.stdin.write(req.encode('utf-8'))
+			self.p.stdin.flush()
+			line = self.p.stdout.readline()
+		except OSError:
+			line = b""
+		if not line:
+			self.error = "the connection with the agent was lost"
+			stderr.write(f"agent: {op}: {self.error}\n")
+			self.close()
+			return None
+		resp = json.loads(line)
+		if not resp.get("ok"):
+			self.error = resp.get("error", "")
+			stderr.write(f"agent: {op}: {self.error}\n")
+			return None
+		return resp["result"]
+
+	def close(self):
+		"""Ends the agent"""
+		if self.p is None: return
+		try:
+			self.p.stdin.write(b'{"op": "quit"}\n')
+			self.p.stdin.close()
+		except OSError:
+			pass
+		self.p.wait()
+		self.p = None
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+def test():
+	"""Test code"""
+	
+	HOST = "54.38.79.195"
+	new_dir = "2021S_2"
+	#p =create_directory(HOST, new_dir, 0o750, create_structure = True)
+	#p = decompress_files(HOST, new_dir + '/csv')
+	#p = inspect_working_directory(HOST, new_dir)
+	p = run_app(HOST, new_dir)
+	exit(0)
+	
+if __name__ == "__main__":
+	from profiling import main_with_profile
+	main_with_profile("ssh_methods", test)
+	
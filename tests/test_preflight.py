@@ -0,0 +1,61 @@
+"""
+ * TEST_PREFLIGHT_PY
+ * Tests of the pre-flight check of the CSV files (see preflight.py)
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+import preflight
+
+PATHS = [False] + ([True] if preflight.np is not None else [])
+
+def __write(tmp_path, data):
+    path = tmp_path / "case.csv"
+    path.write_bytes(data)
+    return str(path)
+
+@pytest.mark.parametrize("use_numpy", PATHS)
+def test_last_line_with_no_end_of_line(tmp_path, use_numpy):
+    path = __write(tmp_path, b"t,v\n0.0,1.5\n0.1,1.6")
+    assert preflight.scan_file(path, use_numpy) == []
+
+@pytest.mark.parametrize("use_numpy", PATHS)
+def test_trailing_blank_lines(tmp_path, use_numpy):
+    path = __write(tmp_path, b"t,v\n0.0,1.5\n0.1,1.6\n\n\n")
+    assert preflight.scan_file(path, use_numpy) == []
+
+@pytest.mark.parametrize("use_numpy", PATHS)
+def test_last_line_cut(tmp_path, use_numpy):
+    path = __write(tmp_path, b"t,v\n0.0,1.5\n0.1")
+    assert preflight.scan_file(path, use_numpy) == ["line 3: 1 columns, expected 2"]
+
+@pytest.mark.parametrize("use_numpy", PATHS)
+def test_blank_line_inside(tmp_path, use_numpy):
+    path = __write(tmp_path, b"t,v\n0.0,1.5\n\n0.1,1.6\n")
+    assert preflight.scan_file(path, use_numpy) == ["line 3: 1 columns, expected 2"]
+
+def test_case_name_collision(tmp_path):
+    (tmp_path / "a").mkdir()
+    (tmp_path / "a" / "b.csv").write_bytes(b"t,v\n0.0,1.5\n")
+    (tmp_path / "a__b.csv").write_bytes(b"t,v\n0.0,1.5\n")
+    (tmp_path / "c.csv").write_bytes(b"t,v\n0.0,1.5\n")
+    inventory = preflight.scan(str(tmp_path), recursive = True)
+    bad = preflight.scan_folder(str(tmp_path), verbose = False, inventory = inventory)
+    assert sorted(bad) == ["a/b.csv", "a__b.csv"]
+    assert bad["a/b.csv"] == ["case name 'a__b' also taken by a__b.csv"]
+
+def test_report_round_trip(tmp_path):
+    bad = {"a/b.csv": ["line 3: 1 columns, expected 2"], "c.csv": ["line 2: not a number", "line 5: NaN"]}
+    path = str(tmp_path / preflight.REPORT)
+    preflight.write_report(bad, path)
+    assert preflight.read_report(path) == bad
+
+@pytest.mark.parametrize("use_numpy", PATHS)
+def test_cell_only_python_parses(tmp_path, use_numpy):
+    # float() takes 1_0 (as 10.0), the parser of NumPy does not
+    path = __write(tmp_path, b"t,v\n1_0,1.5\n5.0,1.6\n")
+    assert preflight.scan_file(path, use_numpy) == ["line 3: time goes backwards"]
@@ -0,0 +1,19 @@
+"""
+ * TEST_SCANNER_PY
+ * Tests of the scan of the CSV folders (see scanner.py)
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import scanner
+
+def test_symlink_loop(tmp_path):
+    (tmp_path / "a").mkdir()
+    (tmp_path / "x.csv").write_bytes(b"t,v\n")
+    (tmp_path / "a" / "y.csv").write_bytes(b"t,v\n")
+    os.symlink("..", tmp_path / "a" / "up")
+    names = [f.name for f in scanner.scan(str(tmp_path), recursive = True)]
+    assert names == ["a/y.csv", "x.csv"]
@@ -36,7 +36,24 @@ import subprocess
 from time import sleep
 import signal
 import re         # regex
-from helpers import is_win, is_posix
+import shlex      # quote
+import gzip
+import hashlib
+import threading
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from time import perf_counter
+from helpers import is_win, is_posix, ssh_args, sftp_args
+from ratelimit import LIMITER, INTERACTIVE, BULK, sftp_limit_args
+from contextlib import nullcontext
+from compress import AdaptiveLevel, mapped_file, iter_chunks, OUTPUT_PATTERNS, MANIFEST
+from scanner import scan
+from ssh_methods import ssh_exec
+from dedup import hash_file
+import preflight
+import aggregate
+import zdict
 
 stdin_fileno  = stdin.fileno()
 stdout_fileno = stdout.fileno()
@@ -50,7 +67,42 @@ def sigpipe_handler(signum, frame):
     print(f"[{os.getpid()}] W: Received SIGPIPE. Event ignored.")
 
 
-def transfer_files_posix(HOST = "", local_path = "", remote_path = "", verbose = False):
+def __sftp_args(HOST, verbose = False, priority = BULK):
+    """sftp_args(), with the rate limit of the priority class (see ratelimit.py)"""
+    args = sftp_args(HOST, verbose)
+    args[1:1] = sftp_limit_args(priority)
+    return args
+
+def put_commands(local_path = "", files = None, put = "put"):
+    """SFTP commands to put the compressed files of local_path (one scan of the
+    folder, see scanner.scan()), creating first the remote subfolders of a
+    recursive layout
+    @param files: if given, only these files (names relative to local_path)
+    """
+    inventory = scan(local_path, include = OUTPUT_PATTERNS, recursive = True)
+    names = [f.name for f in inventory if files is None or f.name in files]
+    
+    cmds = []
+    dirs = set()
+    for name in names:
+        d = os.path.dirname(name)
+        while d and d not in dirs:
+            dirs.add(d)
+            d = os.path.dirname(d)
+    for d in sorted(dirs):
+        cmds.append(f"-mkdir \"{d}\"\n")
+    for name in names:
+        cmds.append(f"{put} \"{name}\" \"{name}\"\n")
+    # the dictionary of the files compressed against it (see zdict.py), with
+    # any put: it may have changed since the .zd files sent before
+    if os.path.isfile(os.path.join(local_path, zdict.DICT)) and any(f.name.endswith(zdict.EXT) for f in inventory):
+        cmds.append(f"{put} \"{zdict.DICT}\"\n")
+    # the hashes of all of them, to be verified in the remote host
+    if os.path.isfile(os.path.join(local_path, MANIFEST)):
+        cmds.append(f"{put} \"{MANIFEST}\"\n")
+    return cmds
+
+def transfer_files_posix(HOST = "", local_path = "", remote_path = "", verbose = False, files = None):
     
     if not HOST: return
     if not local_path: return
@@ -70,13 +122,11 @@ def transfer_files_posix(HOST = "", local_path = "", remote_path = "", verbose =
         
         if verbose:
             # verbose option
-            cpid = os.spawnlp(os.P_NOWAIT, "sftp", "sftp", "-v", "-i", ".ssh/id_rsa", 
-            "tst@" + HOST)
+            cpid = os.spawnvp(os.P_NOWAIT, "sftp", __sftp_args(HOST, True))
             
         else:
             # non-verbose
-            cpid = os.spawnlp(os.P_NOWAIT, "sftp", "sftp", "-i", ".ssh/id_rsa", 
-            "tst@" + HOST)
+            cpid = os.spawnvp(os.P_NOWAIT, "sftp", __sftp_args(HOST))
         
         # close pipe, and exit
         os.close(r)
@@ -112,11 +162,8 @@ def transfer_files_posix(HOST = "", local_path = "", remote_path = "", verbose =
         os.write(w, "!ls *.csv.gz\n".encode('utf-8'))
         
         # putting the files
-        matcher = re.compile(r".*\.csv\.gz$")
-        for f in os.listdir(local_path):
-            if matcher.match(f):
-                os.write(w, (f"put -a \"{f}\"\n").encode('utf-8'))
-                #break
+        for cmd in put_commands(local_path, files, "put -a"):
+            os.write(w, cmd.encode('utf-8'))
         
         # listing the remote content
         os.write(w, "ls\n".encode('utf-8'))
@@ -126,7 +173,7 @@ def transfer_files_posix(HOST = "", local_path = "", remote_path = "", verbose =
         # close pipe, and exit
         os.close(w)
 
-def transfer_files_win(HOST = "", local_path = "", remote_path = "", verbose = False):
+def transfer_files_win(HOST = "", local_path = "", remote_path = "", verbose = False, files = None):
     
     if not HOST: return
     if not local_path: return
@@ -139,15 +186,13 @@ def transfer_files_win(HOST = "", local_path = "", remote_path = "", verbose = F
     # In Windows, we use the more suitable method subprocess, instead of the low-level
     # methods fork() + spawn()
     if verbose:
-        p = subprocess.Popen(["sftp", "-v", "-i", ".ssh/id_rsa", 
-            "tst@" + HOST]
+        p = subprocess.Popen(__sftp_args(HOST, True)
             , stdin=subprocess.PIPE
             , creationflags=subprocess.CREATE_NEW_CONSOLE
             , close_fds=True
             )
     else:
-        p = subprocess.Popen(["sftp", "-i", ".ssh/id_rsa", 
-            "tst@" + HOST]
+        p = subprocess.Popen(__sftp_args(HOST)
             , stdin=subprocess.PIPE
             , creationflags=subprocess.CREATE_NEW_CONSOLE
             , close_fds=True
@@ -174,12 +219,8 @@ def transfer_files_win(HOST = "", local_path = "", remote_path = "", verbose = F
     pipe.write("!dir *.csv.gz\n".encode('utf-8'))
     
     # putting the files
-    matcher = re.compile(r".*\.csv\.gz$")
-    for f in os.listdir(local_path):
-        if matcher.match(f):
-            pipe.write((f"put \"{f}\"\n").encode('utf-8'))
-            #break
-            pass
+    for cmd in put_commands(local_path, files):
+        pipe.write(cmd.encode('utf-8'))
     
     # listing the remote content
     s = "echo \"Content of remote folder {:s}:\"\n".format(remote_path)
@@ -201,15 +242,13 @@ def download_files_win(HOST = "", remote_path = "", local_path = "", verbose = F
     # In Windows, we use the more suitable method subprocess, instead of the low-level
     # methods fork() + spawn()
     if verbose:
-        p = subprocess.Popen(["sftp", "-v", "-i", ".ssh/id_rsa", 
-            "tst@" + HOST]
+        p = subprocess.Popen(__sftp_args(HOST, True, INTERACTIVE)
             , stdin=subprocess.PIPE
             , creationflags=subprocess.CREATE_NEW_CONSOLE
             , close_fds=True
             )
     else:
-        p = subprocess.Popen(["sftp", "-i", ".ssh/id_rsa", 
-            "tst@" + HOST]
+        p = subprocess.Popen(__sftp_args(HOST, priority = INTERACTIVE)
             , stdin=subprocess.PIPE
             , creationflags=subprocess.CREATE_NEW_CONSOLE
             , close_fds=True
@@ -239,19 +278,411 @@ def download_files_win(HOST = "", remote_path = "", local_path = "", verbose = F
     # exiting from sftp
     pipe.write("exit\n".encode('utf-8'))
     
-def transfer_files(HOST = "", local_path = "", remote_path = "", verbose = False):
+def sftp_batch(HOST = "", cmds = (), verbose = False, priority = INTERACTIVE):
+    """Runs a list of SFTP commands in batch mode (sftp -b -), with no console,
+    and waits for them. A command prefixed by '-' may fail.
+    @param priority: class of the transfer (see ratelimit.py); an interactive
+        one reserves its share of the link while it runs
+    @return True if success, False otherwise
+    """
+    if not HOST: return False
+    
+    args = __sftp_args(HOST, verbose, priority)
+    args[1:1] = ["-b", "-"]
+    reserve = LIMITER.reserve(LIMITER.sftp_limit(priority)) if priority == INTERACTIVE else nullcontext()
+    try:
+        with reserve:
+            r = subprocess.run(args
+                , input="".join(c.rstrip('\n') + '\n' for c in cmds).encode('utf-8')
+                , stdout=None if verbose else subprocess.DEVNULL
+                )
+    except OSError as e:
+        stderr.write(f"sftp_batch: {e}\n")
+        return False
+    return r.returncode == 0
+
+def download_aggregated(HOST = "", remote_path = "", local_path = "", verbose = False):
+    """Downloads the results of the working folder remote_path as aggregated
+    by the remote host (see aggregate.py): a few large files, instead of one
+    report and one summary by case, plus the plots
+    """
+    if not HOST: return
+    if not local_path: return
+    if not remote_path: return
+    
+    for d in ("output", "plots/angle", "plots/volt", "plots/unstable"):
+        os.makedirs(os.path.join(local_path, d), exist_ok = True)
+    
+    # a stale archive would hide that this run packed none
+    reports = os.path.join(local_path, aggregate.REPORTS)
+    if os.path.isfile(reports): os.remove(reports)
+    
+    cmds = []
+    for f in (aggregate.SUMMARIES, aggregate.INDEX):
+        cmds.append(f"get \"{remote_path}/{f}\" \"{local_path}/{f}\"")
+    cmds.append(f"-get \"{remote_path}/{aggregate.REPORTS}\" \"{local_path}/{aggregate.REPORTS}\"")
+    cmds.append(f"-get \"{remote_path}/Master-Failure-Report.csv\" \"{local_path}\"")
+    for d in ("angle", "volt", "unstable"):
+        cmds.append(f"-mget \"{remote_path}\"/plots/{d}/* \"{local_path}\"/plots/{d}")
+    if not sftp_batch(HOST, cmds, verbose): return False
+    
+    if not os.path.isfile(reports):
+        # run with no --pack-reports: the reports one by one
+        os.makedirs(os.path.join(local_path, aggregate.REPORT_DIR), exist_ok = True)
+        return sftp_batch(HOST, [f"-mget \"{remote_path}\"/{aggregate.REPORT_DIR}/* \"{local_path}\"/{aggregate.REPORT_DIR}"], verbose)
+    return True
+
+def fetch_case(HOST = "", remote_path = "", local_path = "", case = "", verbose = False):
+    """Pulls the report and the summary of a single case, on demand"""
+    if not HOST: return
+    if not case: return
+    
+    cmds = []
+    for d, ext in ((aggregate.REPORT_DIR, ".report"), (aggregate.SUMMARY_DIR, ".summary")):
+        os.makedirs(os.path.join(local_path, d), exist_ok = True)
+        cmds.append(f"get \"{remote_path}/{d}/{case}{ext}\" \"{local_path}/{d}/{case}{ext}\"")
+    return sftp_batch(HOST, cmds, verbose)
+
+# written by run when the TST and the plots are done (see run)
+DONE_MARKER = ".tst_done"
+
+# remote folders followed while the TST runs
+FOLLOW_DIRS = (aggregate.REPORT_DIR, aggregate.SUMMARY_DIR, "plots")
+
+FOLLOW_INTERVAL = 15      # seconds between polls
+FOLLOW_STABLE   = 2       # polls with no change for a file to be taken as complete
+
+def __remote_listing(HOST, remote_path, verbose = False):
+    """Files of the followed folders of remote_path, as dict {name: (size, mtime)}
+    @return (listing, done), where done tells the run has finished, or None
+    """
+    # the marker is tested before the listing, so once it is seen the listing is final
+    cmd = "cd {0:s} && if test -f {1:s}; then echo {1:s}; fi && find {2:s} -type f -printf '%s %T@ %p\n' 2> /dev/null; true".format(
+        shlex.quote(remote_path), DONE_MARKER, " ".join(FOLLOW_DIRS))
+    out = ssh_exec(HOST, cmd, verbose = verbose)
+    if out is None: return None
+    listing = {}
+    done = False
+    for line in out.splitlines():
+        if line == DONE_MARKER:
+            done = True
+            continue
+        size, mtime, name = line.split(' ', 2)
+        listing[name] = (int(size), float(mtime))
+    return listing, done
+
+def follow_download(HOST = "", remote_path = "", local_path = "", interval = FOLLOW_INTERVAL,
+                    stable_polls = FOLLOW_STABLE, verbose = False):
+    """Downloads the results of the working folder remote_path while the TST
+    is still running: the reports, summaries and plots are polled, and every
+    file is pulled as soon as it is complete (its size and mtime did not change
+    over stable_polls polls). When the run is done (see DONE_MARKER) the rest
+    is pulled, with the aggregated results.
+    @return number of files pulled, or None if failed
+    """
+    if not HOST: return
+    if not local_path: return
+    if not remote_path: return
+
+    pulled  = {}    # name => (size, mtime) pulled
+    pending = {}    # name => [(size, mtime), polls with no change]
+    n = 0
+    print(f"Following {remote_path} (every {interval} s, Ctrl-C to stop) ...")
+    try:
+        while 1:
+            r = __remote_listing(HOST, remote_path, verbose)
+            if r is None: return None
+            listing, done = r
+
+            complete = []
+            for name, sig in listing.items():
+                if pulled.get(name) == sig: continue
+                local = os.path.join(local_path, name)
+                if name not in pulled and os.path.isfile(local) and os.path.getsize(local) == sig[0]:
+                    pulled[name] = sig      # pulled by a former follow
+                    continue
+                p = pending.get(name)
+                if p and p[0] == sig:
+                    p[1] += 1
+                else:
+                    pending[name] = p = [sig, 1]
+                if done or p[1] >= stable_polls:
+                    complete.append(name)
+
+            cmds = []
+            for name in complete:
+                os.makedirs(os.path.dirname(os.path.join(local_path, name)), exist_ok = True)
+                cmds.append(f"get \"{remote_path}/{name}\" \"{local_path}/{name}\"")
+            if done:
+                for f in (aggregate.SUMMARIES, aggregate.INDEX, aggregate.REPORTS, "Master-Failure-Report.csv"):
+                    os.makedirs(os.path.dirname(os.path.join(local_path, f)), exist_ok = True)
+                    cmds.append(f"-get \"{remote_path}/{f}\" \"{local_path}/{f}\"")
+            if cmds:
+                if not sftp_batch(HOST, cmds, verbose):
+                    stderr.write("follow_download: the download failed, retrying in the next poll\n")
+                    done = False
+                else:
+                    for name in complete:
+                        pulled[name] = listing[name]
+                        del pending[name]
+                    n += len(complete)
+                    print(f"[{datetime.now():%H:%M:%S}] {len(complete)} file(s) pulled, {n} in total")
+            if done:
+                print("=> the run is done, all the results were pulled")
+                return n
+            sleep(interval)
+    except KeyboardInterrupt:
+        print("\nFollow stopped")
+    return n
+
+# Files larger than SPLIT_THRESHOLD are split into SPLIT_PARTS ranges, sent
+# at once over as many SSH channels, and reassembled in the remote host
+SPLIT_THRESHOLD = 256 << 20     # 256 MB
+SPLIT_PARTS     = 4
+
+# Writer of a range of a file, run in the remote host: writes its stdin at
+# the given offset of the (preallocated) file
+RANGE_WRITER = r"""
+import os, sys
+path, offset, size = sys.argv[1], int(sys.argv[2]), int(sys.argv[3])
+fd = os.open(path, os.O_WRONLY | os.O_CREAT, 0o640)
+f = sys.stdin.buffer
+while size > 0:
+    data = f.read(min(size, 1 << 20))
+    if not data: sys.exit(1)
+    offset += os.pwrite(fd, data, offset)
+    size -= len(data)
+os.close(fd)
+"""
+
+def __send_range(HOST, path_local, path_remote, offset, size, verbose):
+    """Sends the bytes [offset, offset + size) of the local file to the same
+    range of the remote one, over its own SSH channel
+    @return True if success, False otherwise
+    """
+    cmd = "python3 -c {:s} {:s} {:d} {:d}".format(shlex.quote(RANGE_WRITER), shlex.quote(path_remote), offset, size)
+    p = subprocess.Popen(ssh_args(HOST, verbose) + [cmd], stdin=subprocess.PIPE)
+    try:
+        with mapped_file(path_local) as data:
+            with data[offset:offset + size] as part:
+                for chunk in iter_chunks(part):
+                    LIMITER.write(p.stdin, chunk)
+        p.stdin.close()
+    except BrokenPipeError:
+        pass
+    return p.wait() == 0
+
+def split_upload(HOST = "", path_local = "", path_remote = "", parts = SPLIT_PARTS, verbose = False):
+    """Uploads a large file as parts ranges at once, over as many SSH channels.
+    The ranges are written in place into a preallocated path_remote.part,
+    which is renamed to path_remote once its hash matches the local file.
+    @return True if success, False otherwise
+    """
+    if not HOST: return False
+    if not path_local: return False
+    if not path_remote: return False
+
+    size = os.path.getsize(path_local)
+    part = path_remote + ".part"
+    q = shlex.quote(part)
+    cmd = "mkdir -p {:s} && rm -f {:s} && (fallocate -l {:d} {:s} 2> /dev/null || truncate -s {:d} {:s})".format(
+        shlex.quote(os.path.dirname(path_remote) or "."), q, size, q, size, q)
+    if ssh_exec(HOST, cmd, verbose = verbose) is None: return False
+
+    step = -(-size // parts)
+    ranges = [(offset, min(step, size - offset)) for offset in range(0, size, step)] if size else []
+    t1 = datetime.now()
+    with ThreadPoolExecutor(len(ranges) + 1) as pool:
+        h = pool.submit(hash_file, path_local)
+        sent = list(pool.map(lambda r: __send_range(HOST, path_local, part, r[0], r[1], verbose), ranges))
+        h = h.result()
+    if not all(sent):
+        stderr.write(f"split_upload: {path_local}: {sent.count(False)} of {len(ranges)} range(s) failed\n")
+        return False
+
+    # reassembled: verified, and put in place
+    cmd = "test \"$(b2sum < {0:s} | cut -d ' ' -f 1)\" = {1:s} && mv -f {0:s} {2:s}".format(
+        q, h, shlex.quote(path_remote))
+    if ssh_exec(HOST, cmd, verbose = verbose) is None:
+        stderr.write(f"split_upload: {path_remote}: the hash does not match the local file\n")
+        return False
+    secs = (datetime.now() - t1).total_seconds()
+    print(f"  sent: {os.path.basename(path_local)} ({size} bytes, {len(ranges)} ranges, {size / 2**20 / max(secs, 1e-6):.1f} MB/s)")
+    return True
+
+def transfer_files(HOST = "", local_path = "", remote_path = "", verbose = False, files = None,
+                   split_threshold = SPLIT_THRESHOLD):
+    """Puts the compressed files of local_path into remote_path
+    @param files: if given, only these files (names) of local_path are put
+    @param split_threshold: files of this size or more are sent as ranges at
+        once (see split_upload()), before the rest; 0 to not split any
+    """
+    if split_threshold > 0:
+        outputs = [f for f in scan(local_path, include = OUTPUT_PATTERNS, recursive = True)
+            if files is None or f.name in files]
+        large = [f for f in outputs if f.size >= split_threshold]
+        if large:
+            print(f"Sending {len(large)} large file(s) in {SPLIT_PARTS} ranges each ...")
+            sent = {f.name for f in large if split_upload(HOST, f.path, remote_path + "/" + f.name, verbose = verbose)}
+            # the rest (and the large ones that failed) as usual
+            files = {f.name for f in outputs if f.name not in sent}
     if is_win():
-        transfer_files_win(HOST, local_path, remote_path, verbose)
+        transfer_files_win(HOST, local_path, remote_path, verbose, files)
     else:
-        transfer_files_posix(HOST, local_path, remote_path, verbose)
+        transfer_files_posix(HOST, local_path, remote_path, verbose, files)
 
-def download_files(HOST = "", remote_path = "", local_path = "", verbose = False):
+def download_files(HOST = "", remote_path = "", local_path = "", verbose = False, aggregated = False,
+                   follow = False):
+    if follow:
+        # success, even if the last poll pulled no new file (0)
+        return follow_download(HOST, remote_path, local_path, verbose = verbose) is not None
+    if aggregated:
+        return download_aggregated(HOST, remote_path, local_path, verbose)
     if is_win():
         download_files_win(HOST, remote_path, local_path, verbose)
     else:
         #download_files_posix(HOST, remote_path, local_path, verbose)
         pass
 
+# Receiver of the streamed files, run in the remote host. Every file comes as
+# a sequence of frames 'name size\n' + size bytes; a frame of size 0 ends it.
+STREAM_RECEIVER = r"""
+import os, sys
+f = sys.stdin.buffer
+out = {}
+while True:
+    line = f.readline()
+    if not line: break
+    name, size = line.decode('utf-8').rstrip('\n').rsplit(' ', 1)
+    size = int(size)
+    if name not in out:
+        os.makedirs(os.path.dirname(name) or '.', exist_ok=True)
+        out[name] = open(name + '.part', 'wb')
+    if size == 0:
+        out.pop(name).close()
+        os.replace(name + '.part', name)
+        print(name, flush=True)
+    else:
+        out[name].write(f.read(size))
+"""
+
+STREAM_CHUNK = 1 << 22    # 4 MB, every chunk is a gzip member
+
+def stream_files(HOST = "", DIR = "", remote_path = "", compresslevel = 5, adaptive = True,
+    preflight_check = True, verbose = False, inventory = None, recursive = False):
+    """Compresses the CSV files of DIR and sends them to remote_path while
+    compressing, over a single SSH session, with no temporary files.
+    
+    The files are sent as multi-member gzip files (file.csv.gz), one member
+    by chunk, so they are decompressed by the remote gzip -d as usual. If
+    adaptive is True, the compression level is adjusted chunk by chunk to
+    the throughput of the CPU and the link (see compress.AdaptiveLevel).
+    
+    @return dict with the totals: files, bytes_in, bytes_out, secs, or None
+    """
+    if not HOST: return
+    if not DIR: return
+    if not remote_path: return
+
+    if inventory is None:
+        inventory = scan(DIR, recursive = recursive)
+    bad = preflight.scan_folder(DIR, inventory = inventory) if preflight_check else {}
+    entries = [f for f in inventory if f.name not in bad]
+    if not entries: return
+
+    cmd = "cd {:s} && python3 -c {:s}".format(shlex.quote(remote_path), shlex.quote(STREAM_RECEIVER))
+    p = subprocess.Popen(ssh_args(HOST, verbose) + [cmd]
+        , stdin=subprocess.PIPE
+        , stdout=subprocess.DEVNULL
+        )
+    pipe = p.stdin
+    
+    control = AdaptiveLevel(compresslevel)
+    chunks = queue.Queue(maxsize = 4)     # compressor ==> sender
+    stop = threading.Event()              # the sender gave up
+    failed = []                           # the error of the compressor, if any
+    totals = {"files": 0, "bytes_in": 0, "bytes_out": 0, "secs": 0.0}
+
+    def compressor():
+        # compressing in its own thread, so CPU and link work at the same time
+        # (zlib releases the GIL while compressing)
+        try:
+            manifest = {}
+            for entry in entries:
+                filename = entry.name
+                h = hashlib.blake2b()
+                with mapped_file(entry.path) as content:
+                    # an empty file still needs a (empty) gzip member
+                    for data in iter_chunks(content, STREAM_CHUNK) if len(content) else [b""]:
+                        if stop.is_set(): return
+                        level = control.next_level() if adaptive else compresslevel
+                        t = perf_counter()
+                        blob = gzip.compress(data, compresslevel = level)
+                        control.compressed(level, len(data), len(blob), perf_counter() - t)
+                        h.update(data)
+                        totals["bytes_in"] += len(data)
+                        chunks.put((filename + ".gz", blob, level))
+                chunks.put((filename + ".gz", b"", 0))
+                manifest[filename] = h.hexdigest()
+            # the hashes of the original files, to be verified in the remote host
+            blob = "".join(f"{manifest[f]}  {f}\n" for f in sorted(manifest)).encode('utf-8')
+            chunks.put((MANIFEST, blob, 0))
+            chunks.put((MANIFEST, b"", 0))
+        except Exception as e:
+            # e.g. a file removed or cut after the scan: the sender stops
+            failed.append(e)
+        finally:
+            chunks.put(None)
+
+    t1 = datetime.now()
+    th = threading.Thread(target = compressor, daemon = True)
+    th.start()
+    try:
+        while True:
+            item = chunks.get()
+            if item is None: break
+            filename, blob, level = item
+            t = perf_counter()
+            pipe.write(f"{filename} {len(blob)}\n".encode('utf-8'))
+            LIMITER.write(pipe, blob)
+            pipe.flush()
+            control.sent(len(blob), perf_counter() - t)
+            totals["bytes_out"] += len(blob)
+            if blob:
+                if verbose: print(f"  {filename}: {len(blob)} bytes at level {level}")
+            else:
+                if filename != MANIFEST: totals["files"] += 1
+                print(f"  sent: {filename}")
+        pipe.close()
+        sent = not failed
+        if failed:
+            stderr.write(f"stream_files: the compression failed: {failed[0]}\n")
+    except BrokenPipeError:
+        stderr.write("stream_files: the connection with the remote host was lost\n")
+        sent = False
+    finally:
+        # the compressor may be blocked on the full queue: drained until it ends
+        stop.set()
+        while th.is_alive():
+            try:
+                chunks.get(timeout = 0.1)
+            except queue.Empty:
+                pass
+        th.join()
+        try:
+            pipe.close()
+        except OSError:
+            pass
+        p.wait()
+    if not sent: return None
+    if p.returncode != 0:
+        stderr.write(f"stream_files: the remote receiver failed ({p.returncode})\n")
+        return None
+    totals["secs"] = (datetime.now() - t1).total_seconds()
+    print("Streamed {:d} file(s), {:d} => {:d} bytes, in {}".format(
+        totals["files"], totals["bytes_in"], totals["bytes_out"], datetime.now() - t1))
+    return totals
+
 def test():
     """Test code"""
     
@@ -267,5 +698,6 @@ def test():
     exit(0)
     
 if __name__ == "__main__":
-    test()
+    from profiling import main_with_profile
+    main_with_profile("transfer", test)
     
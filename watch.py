@@ -0,0 +1,146 @@
+"""
+ * WATCH_PY
+ * Watch mode: the CSV folder is polled while the upstream simulation is
+ * still writing into it, and every CSV file is compressed and uploaded as
+ * soon as it is complete, so by the time the last case lands almost all of
+ * them are already in the server.
+ *
+ * A file is taken as complete when its size and mtime did not change over
+ * STABLE_POLLS polls in a row. The files already uploaded (by size and
+ * mtime) are kept in .tstclient/watch.json, so a watch can be stopped
+ * (Ctrl-C) and resumed later; a file changed after its upload is sent again.
+ *
+ * This product is protected under U.S. Copyright Law.
+ * Unauthorized reproduction is considered a criminal act.
+ * (C) 2018-2021 VDI Technologies, LLC. All rights reserved.
+"""
+
+__author__    = "Yoel Monsalve"
+__date__      = "October, 2026"
+__modified__  = ""
+__version__   = ""
+__copyright__ = "VDI Technologies, LLC"
+
+import os
+import sys
+from sys import stdin, stdout, stderr, argv, exit
+import json
+from time import sleep
+from datetime import datetime
+from helpers import state_path
+from scanner import scan
+from compress import compress_files
+from transfer import put_commands, sftp_batch
+from ratelimit import BULK
+import columnar
+
+STATE = "watch.json"
+
+POLL_INTERVAL = 30      # seconds between polls
+STABLE_POLLS  = 2       # polls with no change for a file to be taken as complete
+
+def __load_state():
+    try:
+        with open(state_path(STATE)) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def __save_state(state):
+    path = state_path(STATE)
+    with open(path + ".part", "w") as f:
+        json.dump(state, f)
+    os.replace(path + ".part", path)
+
+def __push(HOST, DIR, remote_path, entries, use_columnar, verbose):
+    """Compresses and uploads a batch of complete files
+    @return names of the files uploaded, or None if the upload failed
+    """
+    TMP = DIR + ".tmp/"
+    done = compress_files(DIR, use_columnar, inventory = entries, overwrite = True)
+    if not done: return []
+
+    ext = (columnar.EXT + ".gz") if use_columnar else ".gz"
+    cmds = [f"lcd \"{TMP}\"", f"cd \"{remote_path}\""]
+    cmds += put_commands(TMP, {name + ext for name in done})
+    if not sftp_batch(HOST, cmds, verbose, priority = BULK):
+        return None
+    return done
+
+def watch_folder(HOST = "", DIR = "", remote_path = "", interval = POLL_INTERVAL, stable_polls = STABLE_POLLS,
+                 use_columnar = False, recursive = False, idle_exit = 0, verbose = False):
+    """Watches the CSV folder DIR, compressing and uploading into remote_path
+    every CSV file as soon as it is complete, until Ctrl-C
+    @param idle_exit: if > 0, the watch also ends after so many seconds with
+        no new or changing files
+    @return number of files uploaded
+    """
+    if not HOST: return 0
+    if not DIR: return 0
+    if not remote_path: return 0
+    if not DIR[-1] == '/': DIR += '/'
+
+    state = __load_state()
+    key = f"{HOST}:{remote_path}:{os.path.abspath(DIR)}"
+    # name => [size, mtime] as handled (uploaded, or rejected by the pre-flight
+    # check, to not check it again in every poll unless it changes)
+    handled = state.setdefault(key, {})
+    pending = {}    # name => [[size, mtime], polls with no change]
+    n_sent  = 0
+    idle    = 0
+
+    print(f"Watching {DIR} (every {interval} s, Ctrl-C to stop) ...")
+    try:
+        while 1:
+            inventory = scan(DIR, recursive = recursive)
+            names = set()
+            complete = []
+            for e in inventory:
+                names.add(e.name)
+                sig = [e.size, e.mtime]
+                if handled.get(e.name) == sig: continue
+                if e.size == 0:
+                    # created, but not written yet: not pending (nor activity)
+                    pending.pop(e.name, None)
+                    continue
+                p = pending.get(e.name)
+                if p and p[0] == sig:
+                    p[1] += 1
+                else:
+                    pending[e.name] = p = [sig, 1]
+                if p[1] >= stable_polls:
+                    complete.append(e)
+            for name in list(pending):
+                if name not in names: del pending[name]    # vanished
+
+            if complete:
+                print(f"[{datetime.now():%H:%M:%S}] {len(complete)} new complete file(s)")
+                done = __push(HOST, DIR, remote_path, complete, use_columnar, verbose)
+                if done is None:
+                    stderr.write("watch: the upload failed, retrying in the next poll\n")
+                else:
+                    for e in complete:
+                        handled[e.name] = [e.size, e.mtime]
+                        del pending[e.name]
+                    __save_state(state)
+                    n_sent += len(done)
+                    print(f"=> {len(done)} file(s) uploaded, {n_sent} in this watch, {len(pending)} still being written")
+
+            idle = 0 if (complete or pending) else idle + interval
+            if idle_exit > 0 and idle >= idle_exit:
+                print(f"No new files in {idle} s, ending the watch")
+                break
+            sleep(interval)
+    except KeyboardInterrupt:
+        print("\nWatch stopped")
+
+    return n_sent
+
+def test():
+    """Test code"""
+
+    HOST = "54.38.79.195"
+    watch_folder(HOST, "../work/2021S_2/csv/", "work/2021S_2/csv")
+
+if __name__ == "__main__":
+    test()
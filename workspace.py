@@ -0,0 +1,111 @@
+"""
+ * WORKSPACE_PY
+ * Structured inventory of the remote working folders (files, sizes, mtimes,
+ * counts and bytes by subfolder), fetched through the remote agent (see
+ * agent.py) and cached in .tstclient/inventory/. After the first time only
+ * the changes are fetched: the folders with a new mtime come whole, and the
+ * rest only with their files modified since the last inventory.
+ *
+ * This product is protected under U.S. Copyright Law.
+ * Unauthorized reproduction is considered a criminal act.
+ * (C) 2018-2021 VDI Technologies, LLC. All rights reserved.
+"""
+
+__author__    = "Yoel Monsalve"
+__date__      = "October, 2026"
+__modified__  = ""
+__version__   = ""
+__copyright__ = "VDI Technologies, LLC"
+
+import os
+import sys
+from sys import stdin, stdout, stderr, argv, exit
+import json
+import hashlib
+from helpers import state_path, create_dir
+from ssh_methods import RemoteAgent
+
+CACHE_DIR = "inventory"
+
+# margin for the clocks (and the mtime resolution) between two inventories
+SINCE_MARGIN = 2.0
+
+def __cache_path(HOST, path):
+    create_dir(state_path(CACHE_DIR))
+    # by a hash: a name made of them would take a-b, a_b and a.b as the same
+    key = hashlib.sha1(f"{HOST}\0{path}".encode('utf-8')).hexdigest()
+    return state_path(os.path.join(CACHE_DIR, key + ".json"))
+
+def __load(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def __save(path, inv):
+    with open(path + ".part", "w") as f:
+        json.dump(inv, f)
+    os.replace(path + ".part", path)
+
+def workspace_inventory(HOST = "", path = "", agent = None, refresh = False, verbose = False):
+    """Inventory of the remote folder path, updated with the changes since the
+    cached one (or walked whole, if refresh is True)
+    @return dict {"time", "dirs": {folder: {"mtime", "files": {name: [size, mtime]}}}},
+            with the folders relative to path ("" is path itself), or None
+    """
+    if not HOST: return
+    if not path: return
+
+    cache = __cache_path(HOST, path)
+    inv = None if refresh else __load(cache)
+    if inv is None:
+        inv = {"time": 0, "dirs": {}}
+
+    own = agent is None
+    if own: agent = RemoteAgent(HOST, verbose)
+    delta = agent.call("inventory", path = path,
+        since = inv["time"] - SINCE_MARGIN if inv["time"] else 0,
+        dirs = {d: e["mtime"] for d, e in inv["dirs"].items()})
+    if own: agent.close()
+    if delta is None: return None
+
+    dirs = {d: inv["dirs"][d] for d in delta["all"] if d in inv["dirs"]}
+    dirs.update(delta["dirs"])
+    for d, files in delta["updated"].items():
+        dirs[d]["files"].update(files)
+    inv = {"time": delta["time"], "dirs": dirs}
+    __save(cache, inv)
+    return inv
+
+def summarize(inv):
+    """@return dict {"files", "bytes", "dirs": {folder: {"files", "bytes", "last"}}},
+    with the totals of every folder (its own files, not of its subfolders)
+    and the mtime of its last file
+    """
+    summary = {"files": 0, "bytes": 0, "dirs": {}}
+    for d, e in sorted(inv["dirs"].items()):
+        files = e["files"].values()
+        s = {
+            "files": len(files),
+            "bytes": sum(f[0] for f in files),
+            "last": max((f[1] for f in files), default = None),
+        }
+        summary["dirs"][d] = s
+        summary["files"] += s["files"]
+        summary["bytes"] += s["bytes"]
+    return summary
+
+def inspect_workspace(HOST = "", path = "", agent = None, refresh = False, verbose = False):
+    """Prints the summary of the inventory of the remote folder path
+    @return the summary (see summarize()), or None
+    """
+    inv = workspace_inventory(HOST, path, agent, refresh, verbose)
+    if inv is None: return None
+    summary = summarize(inv)
+    print(f"{path}:")
+    for d, s in summary["dirs"].items():
+        print("  {:40s} {:7d} file(s) {:12.1f} MB".format((d or ".") + "/", s["files"], s["bytes"] / 2**20))
+    print("=> {:d} file(s), {:.1f} MB in {:d} folder(s)".format(
+        summary["files"], summary["bytes"] / 2**20, len(summary["dirs"])))
+    return summary
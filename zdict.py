@@ -0,0 +1,112 @@
+"""
+ * ZDICT_PY
+ * Dictionary mode of the compression, for folders of many small CSV files
+ * with the same header and columns. A preset dictionary is trained from a
+ * sample of the folder (headers and first rows) and every small file is
+ * compressed against it (zlib, with zdict), instead of from a cold window.
+ * The dictionary is sent once, as DICT.zdict, with the files (file.csv.zd).
+ *
+ * The zlib header of every file carries the Adler-32 of its dictionary, so
+ * a file is never decompressed with a wrong one.
+ *
+ * Usage (in the remote host):
+ *   python3 zdict.py -d DICT.zdict file.csv.zd ...    ==> file.csv
+ *   python3 zdict.py -c DICT.zdict file.csv.zd        ==> the CSV to stdout
+ *
+ * This product is protected under U.S. Copyright Law.
+ * Unauthorized reproduction is considered a criminal act.
+ * (C) 2018-2021 VDI Technologies, LLC. All rights reserved.
+"""
+
+__author__    = "Yoel Monsalve"
+__date__      = "October, 2026"
+__modified__  = ""
+__version__   = ""
+__copyright__ = "VDI Technologies, LLC"
+
+import os
+import sys
+from sys import stdin, stdout, stderr, argv, exit
+import zlib
+from collections import Counter
+
+DICT = "DICT.zdict"
+EXT  = ".zd"
+
+DICT_SIZE    = 1 << 15     # the window of deflate: 32 KB
+SAMPLE_FILES = 64          # files read to train the dictionary
+SAMPLE_HEAD  = 4096        # bytes read from the head of every one
+MAX_FILE     = 1 << 20     # larger files gain nothing from a dictionary
+
+def train(inventory, size = DICT_SIZE, sample = SAMPLE_FILES):
+    """Trains a dictionary from a sample of the files of an inventory (as
+    given by scanner.scan()), taken evenly through it. The most common header
+    goes last, where deflate reaches it with the shortest distances.
+    @return the dictionary (bytes), empty if there are no files
+    """
+    if not inventory: return b""
+    step = max(1, len(inventory) // sample)
+    heads = []
+    for f in inventory[::step][:sample]:
+        with open(f.path, "rb") as fi:
+            heads.append(fi.read(SAMPLE_HEAD))
+
+    headers = Counter(h.split(b'\n', 1)[0] + b'\n' for h in heads if b'\n' in h)
+    header = headers.most_common(1)[0][0] if headers else b""
+    bodies = [h[len(header):] if h.startswith(header) else h for h in heads]
+
+    # a slice of every body, as much as fits
+    share = max(1, (size - len(header)) // len(bodies))
+    body = b"".join(b[:share] for b in bodies)
+    return (body + header)[-size:]
+
+def compress(data, dictionary, level = 6):
+    """Compresses data (bytes-like) against the dictionary (zlib format)"""
+    c = zlib.compressobj(level, zlib.DEFLATED, 15, zdict = dictionary)
+    return c.compress(data) + c.flush()
+
+def decompress(data, dictionary):
+    """Decompresses a file compressed against the dictionary"""
+    d = zlib.decompressobj(15, zdict = dictionary)
+    return d.decompress(data) + d.flush()
+
+def decode_file(path_in, dictionary):
+    """Decodes file.csv.zd into file.csv, and removes the former
+    @return True if success, False otherwise
+    """
+    if not path_in.endswith(EXT):
+        stderr.write(f"zdict: '{path_in}' has not the extension {EXT}\n")
+        return False
+    path_out = path_in[:-len(EXT)]
+    try:
+        with open(path_in, "rb") as fi:
+            data = decompress(fi.read(), dictionary)
+        with open(path_out + ".part", "wb") as fo:
+            fo.write(data)
+        os.replace(path_out + ".part", path_out)
+        os.remove(path_in)
+    except (OSError, zlib.error) as e:
+        stderr.write(f"zdict: {path_in}: {e}\n")
+        return False
+    return True
+
+if __name__ == "__main__":
+    if len(argv) < 4 or argv[1] not in ("-d", "-c"):
+        stderr.write(f"USAGE {argv[0]} -d DICT.zdict file.csv.zd ...\n")
+        stderr.write(f"      {argv[0]} -c DICT.zdict file.csv.zd\n")
+        exit(1)
+    with open(argv[2], "rb") as f:
+        dictionary = f.read()
+    if argv[1] == "-c":
+        # to stdout, e.g. to feed a named pipe (see run --stream)
+        try:
+            with open(argv[3], "rb") as f:
+                stdout.buffer.write(decompress(f.read(), dictionary))
+        except (zlib.error, BrokenPipeError) as e:
+            stderr.write(f"zdict: {argv[3]}: {e}\n")
+            exit(1)
+        exit(0)
+    errors = 0
+    for path in argv[3:]:
+        if not decode_file(path, dictionary): errors += 1
+    exit(1 if errors else 0)